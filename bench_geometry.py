@@ -0,0 +1,100 @@
+import argparse
+import itertools
+import json
+import random
+import time
+from vott_tools.vott2coco import asset_to_coco, assets_to_coco, batches, coco_image, polygon_area
+
+
+def per_region(assets, cat2id):
+    # vott2coco's region processing before the geometry module
+    results = []
+    for asset in assets:
+        image = coco_image(asset)
+        annotations = []
+        for region in asset['regions']:
+            points = [(int(p['x']+0.5), int(p['y']+0.5)) for p in region['points']]
+            annotation = {}
+            annotation['area'] = polygon_area(points)
+            annotation['iscrowd'] = 0
+            annotation['image_id'] = None
+            annotation['bbox'] = [int(region['boundingBox']['left'] + 0.5),
+                                  int(region['boundingBox']['top'] + 0.5),
+                                  int(region['boundingBox']['width'] + 0.5),
+                                  int(region['boundingBox']['height'] + 0.5)]
+            annotation['category_id'] = cat2id[region['tags'][0]]
+            annotation['id'] = None
+            if region['type'] == 'POLYGON':
+                annotation['segmentation'] = [list(itertools.chain.from_iterable(points))]
+            annotations.append(annotation)
+        results.append((image, annotations))
+    return results
+
+
+def per_asset(assets, cat2id):
+    # one asset at a time, as export, tiling and serve convert them
+    return [asset_to_coco(asset, cat2id) for asset in assets]
+
+
+def batched(assets, cat2id):
+    # in batches, as create_cocos converts them
+    return [coco for batch in batches(assets) for coco in assets_to_coco(batch, cat2id)]
+
+
+def make_assets(num_assets, num_regions, num_points, seed=0):
+    rng = random.Random(seed)
+    assets = []
+    for _ in range(num_assets):
+        regions = []
+        for _ in range(num_regions):
+            points = [{'x': rng.uniform(0, 1920), 'y': rng.uniform(0, 1080)} for _ in range(num_points)]
+            left = min(p['x'] for p in points)
+            top = min(p['y'] for p in points)
+            regions.append({'type': 'POLYGON', 'tags': ['tag'], 'points': points,
+                            'boundingBox': {'left': left, 'top': top,
+                                            'width': max(p['x'] for p in points) - left,
+                                            'height': max(p['y'] for p in points) - top}})
+        assets.append({'name': 'img%20{}.jpg'.format(len(assets)), 'size': {'width': 1920, 'height': 1080},
+                       'regions': regions})
+    return assets
+
+
+def best_time(func, assets, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(assets, {'tag': 1})
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark vott2coco's region geometry against the per-region code.")
+    parser.add_argument('-a', '--num_assets', type=int, default=1000, help="number of assets")
+    parser.add_argument('-r', '--num_regions', type=int, default=20, help="regions per asset")
+    parser.add_argument('-p', '--num_points', type=int, default=16, help="points per region")
+    parser.add_argument('--repeat', type=int, default=3, help="number of timed runs, the best is reported")
+    parser.add_argument('--json', help='print the result as json', action='store_true')
+
+    args = parser.parse_args()
+
+    assets = make_assets(args.num_assets, args.num_regions, args.num_points)
+    methods = [('per_region', per_region), ('per_asset', per_asset), ('batched', batched)]
+    for name, func in methods[1:]:
+        if func(assets[:10], {'tag': 1}) != per_region(assets[:10], {'tag': 1}):
+            raise SystemExit('{} results differ from the per-region code'.format(name))
+
+    num_regions = args.num_assets * args.num_regions
+    result = {}
+    for name, func in methods:
+        seconds = best_time(func, assets, args.repeat)
+        result[name] = {'seconds': seconds, 'regions_per_second': num_regions / seconds,
+                        'speedup': result['per_region']['seconds'] / seconds if result else 1.0}
+
+    if args.json:
+        print(json.dumps(result))
+    else:
+        for name, _ in methods:
+            print('{:<12} {:8.3f} s {:12.0f} regions/s {:6.2f}x'.format(name, result[name]['seconds'],
+                                                                         result[name]['regions_per_second'],
+                                                                         result[name]['speedup']))
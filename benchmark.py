@@ -0,0 +1,187 @@
+import argparse
+import concurrent.futures
+import contextlib
+import importlib.metadata
+import json
+import multiprocessing
+import os
+import pathlib
+import platform
+import resource
+import sys
+import tempfile
+import time
+import synthetic
+from vott_tools.cli_utils import MASK_FORMATS, TFRECORD_BACKENDS
+
+
+STAGES = ('load_json', 'create_coco', 'create_tf_example', 'create_mask', 'create_masked_image')
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+
+
+def prepare_stage(stage, vott_path, work_dir, options):
+    # Returns a function running the stage once over the whole project and
+    # returning the number of assets it processed. Loading done here is not
+    # timed.
+    from vott_tools.project_index import load_json
+    annotation_dir = vott_path.parent
+    image_dir = annotation_dir.joinpath('images')
+    asset_files = sorted(annotation_dir.glob('*-asset.json'))
+    new_size = options['new_size']
+
+    if stage == 'load_json':
+        return lambda: len(load_json(vott_path, options['num_workers'])['assets'])
+
+    if stage == 'create_coco':
+        from vott_tools.vott2coco import create_coco
+        vott = load_json(vott_path, options['num_workers'])
+        asset_ids = list(vott['assets'])
+
+        def run():
+            create_coco(vott, asset_ids, work_dir.joinpath('benchmark.json'))
+            return len(asset_ids)
+        return run
+
+    if stage == 'create_tf_example':
+        from vott_tools.vott2tfrecords import create_tf_example, get_categories
+        class_id = {cat['name']: cat['id'] for cat in get_categories(vott_path)}
+
+        def run():
+            for asset_file in asset_files:
+                create_tf_example(image_dir, asset_file, class_id, new_size, True, options['mask_format'],
+                                  options['backend']).SerializeToString(deterministic=True)
+            return len(asset_files)
+        return run
+
+    if stage == 'create_mask':
+        from vott_tools.make_masks import create_mask
+
+        def run():
+            for asset_file in asset_files:
+                create_mask(asset_file, work_dir, new_size)
+            return len(asset_files)
+        return run
+
+    if stage == 'create_masked_image':
+        from vott_tools.cutout import create_masked_image
+
+        def run():
+            for asset_file in asset_files:
+                create_masked_image(image_dir, asset_file, work_dir, new_size)
+            return len(asset_files)
+        return run
+
+    raise ValueError('unknown stage {}'.format(stage))
+
+
+def run_stage(stage, vott_path, work_dir, options):
+    # Runs in a fresh process, so peak_rss_mb is the peak of this stage alone
+    work_dir = pathlib.Path(work_dir).joinpath(stage)
+    work_dir.mkdir(parents=True, exist_ok=True)
+    start = time.perf_counter()
+    run = prepare_stage(stage, pathlib.Path(vott_path), work_dir, options)
+    setup_seconds = time.perf_counter() - start
+    times = []
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        for _ in range(options['repeat']):
+            start = time.perf_counter()
+            num_assets = run()
+            times.append(time.perf_counter() - start)
+    return {'setup_seconds': setup_seconds, 'seconds': min(times), 'all_seconds': times,
+            'assets': num_assets, 'peak_rss_mb': peak_rss_mb()}
+
+
+def run_benchmark(vott_path, work_dir, stages, options, num_regions):
+    context = multiprocessing.get_context('spawn')
+    results = {}
+    for stage in stages:
+        with concurrent.futures.ProcessPoolExecutor(1, mp_context=context) as executor:
+            result = executor.submit(run_stage, stage, str(vott_path), str(work_dir), options).result()
+        result['assets_per_second'] = result['assets'] / result['seconds'] if result['seconds'] else 0.0
+        result['regions_per_second'] = result['assets_per_second'] * num_regions
+        results[stage] = result
+    return results
+
+
+def environment():
+    # Versions come from package metadata, so TensorFlow is not imported here
+    versions = {'python': platform.python_version()}
+    for package in ('numpy', 'opencv-python', 'opencv-python-headless', 'tensorflow', 'tensorflow-cpu', 'orjson'):
+        try:
+            versions[package] = importlib.metadata.version(package)
+        except importlib.metadata.PackageNotFoundError:
+            pass
+    return {'platform': platform.platform(), 'cpu_count': os.cpu_count(), 'versions': versions}
+
+
+def compare(results, baseline, tolerance):
+    # Stages more than tolerance slower than the baseline
+    regressions = []
+    for stage, result in results.items():
+        if stage in baseline.get('stages', {}):
+            ratio = result['seconds'] / baseline['stages'][stage]['seconds']
+            result['baseline_ratio'] = ratio
+            if ratio > 1 + tolerance:
+                regressions.append(stage)
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the converters on a synthetic VoTT project.")
+    parser.add_argument('-d', '--project_dir', default=None, help="where the synthetic project is kept and reused, default a temporary directory")
+    synthetic.add_project_arguments(parser)
+    parser.add_argument('--stages', nargs='+', default=list(STAGES), choices=STAGES, help="stages to run")
+    parser.add_argument('-n', '--new_size', type=int, default=None, nargs=2, metavar=('height', 'width'), help="new size (height, width)")
+    parser.add_argument('-m', '--mask_format', default='png', choices=MASK_FORMATS, help="mask format of create_tf_example")
+    parser.add_argument('-b', '--backend', default='lite', choices=TFRECORD_BACKENDS, help="create_tf_example backend, lite needs no TensorFlow")
+    parser.add_argument('-j', '--num_workers', type=int, default=None, help="threads reading asset files in load_json")
+    parser.add_argument('--repeat', type=int, default=3, help="number of timed runs per stage, the best is reported")
+    parser.add_argument('-o', '--output', default=None, help="write the results as json to this file")
+    parser.add_argument('--baseline', default=None, help="results json of an earlier run to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="slowdown against --baseline reported as a regression")
+    parser.add_argument('--json', help='print the results as json', action='store_true')
+
+    args = parser.parse_args()
+
+    params = synthetic.params_from_args(args)
+    options = {'new_size': args.new_size, 'mask_format': args.mask_format, 'backend': args.backend,
+               'num_workers': args.num_workers, 'repeat': args.repeat}
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        project_dir = pathlib.Path(args.project_dir or tmp_dir).joinpath('project')
+        start = time.perf_counter()
+        vott_path = synthetic.ensure_project(project_dir, params)
+        generate_seconds = time.perf_counter() - start
+        results = run_benchmark(vott_path, pathlib.Path(tmp_dir).joinpath('output'), args.stages, options, args.num_regions)
+
+    report = {'project': params, 'options': options, 'environment': environment(),
+              'generate_seconds': generate_seconds, 'stages': results}
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        report['regressions'] = regressions
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.json:
+        print(json.dumps(report))
+    else:
+        print('{:<20} {:>9} {:>12} {:>13} {:>10}'.format('stage', 'seconds', 'assets/s', 'regions/s', 'peak MB'))
+        for stage, result in results.items():
+            line = '{:<20} {:9.3f} {:12.1f} {:13.0f} {:10.1f}'.format(stage, result['seconds'], result['assets_per_second'],
+                                                                  result['regions_per_second'], result['peak_rss_mb'])
+            if 'baseline_ratio' in result:
+                line += ' {:6.2f}x baseline'.format(result['baseline_ratio'])
+            print(line)
+
+    if regressions:
+        sys.exit('slower than the baseline: {}'.format(', '.join(regressions)))
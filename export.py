@@ -0,0 +1,7 @@
+# Runs vott_tools.export from a checkout, as `python export.py ...`
+from vott_tools.cli_utils import parse_args
+from vott_tools.export import main
+
+
+if __name__ == '__main__':
+    main(parse_args('export'))
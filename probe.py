@@ -0,0 +1,7 @@
+# Runs vott_tools.probe from a checkout, as `python probe.py ...`
+from vott_tools.cli_utils import parse_args
+from vott_tools.probe import main
+
+
+if __name__ == '__main__':
+    main(parse_args('probe'))
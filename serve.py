@@ -0,0 +1,7 @@
+# Runs vott_tools.serve from a checkout, as `python serve.py ...`
+from vott_tools.cli_utils import parse_args
+from vott_tools.serve import main
+
+
+if __name__ == '__main__':
+    main(parse_args('serve'))
@@ -0,0 +1,177 @@
+import argparse
+import hashlib
+import json
+import math
+import pathlib
+import random
+import string
+import urllib.parse
+import cv2
+import numpy as np
+
+
+VOTT_VERSION = '2.1.0'
+PARAMS_FILE = 'synthetic.json'
+TAG_COLORS = ['#5b1837', '#d04a02', '#e01e5a', '#36c5f0', '#2eb67d', '#ecb22e', '#4a154b', '#1264a3']
+
+
+def asset_id(path):
+    # VoTT names assets by the md5 of their path
+    return hashlib.md5(path.encode('utf-8')).hexdigest()
+
+def region_id(rng):
+    return ''.join(rng.choice(string.ascii_letters + string.digits + '-_') for _ in range(9))
+
+def polygon_points(rng, height, width, num_points):
+    # Star shaped around a random centre, so the polygon never intersects itself
+    cx = rng.uniform(0, width)
+    cy = rng.uniform(0, height)
+    radius = rng.uniform(0.02, 0.2) * min(height, width)
+    angles = sorted(rng.uniform(0, 2 * math.pi) for _ in range(num_points))
+    points = []
+    for angle in angles:
+        r = radius * rng.uniform(0.5, 1.0)
+        points.append({'x': min(max(cx + r * math.cos(angle), 0.0), width - 1.0),
+                       'y': min(max(cy + r * math.sin(angle), 0.0), height - 1.0)})
+    return points
+
+def make_region(rng, tags, height, width, num_points, rectangle=False):
+    points = polygon_points(rng, height, width, num_points)
+    xs = [point['x'] for point in points]
+    ys = [point['y'] for point in points]
+    left, top, right, bottom = min(xs), min(ys), max(xs), max(ys)
+    if rectangle:
+        points = [{'x': left, 'y': top}, {'x': right, 'y': top}, {'x': right, 'y': bottom}, {'x': left, 'y': bottom}]
+    return {
+        'id': region_id(rng),
+        'type': 'RECTANGLE' if rectangle else 'POLYGON',
+        'tags': [rng.choice(tags)['name']],
+        'boundingBox': {'height': bottom - top, 'width': right - left, 'left': left, 'top': top},
+        'points': points,
+    }
+
+def make_image(seed, height, width, regions):
+    # A noisy gradient with the regions filled in, so JPEG sizes and decode
+    # times are closer to photos than a flat image would be.
+    np_rng = np.random.default_rng(seed)
+    x = np.linspace(0, 191, width, dtype=np.float32)[np.newaxis, :]
+    y = np.linspace(0, 191, height, dtype=np.float32)[:, np.newaxis]
+    image = np.empty((height, width, 3), dtype=np.uint8)
+    image[..., 0] = x
+    image[..., 1] = y
+    image[..., 2] = (x + y) / 2
+    noise = np_rng.integers(0, 64, size=(-(-height // 4), -(-width // 4), 3), dtype=np.uint8)
+    image += cv2.resize(noise, (width, height), interpolation=cv2.INTER_LINEAR)
+    for region in regions:
+        points = np.array([[point['x'], point['y']] for point in region['points']]).astype(np.int32)
+        cv2.fillPoly(image, [points], [int(c) for c in np_rng.integers(0, 256, size=3)])
+    return image
+
+
+def make_project(output_dir, num_assets=100, num_regions=10, num_points=(3, 16), image_sizes=((480, 640),),
+                 num_tags=5, rectangle_ratio=0.25, seed=0, name='synthetic', images=True):
+    # Writes <name>.vott and one *-asset.json per asset into output_dir and
+    # matching JPEGs into output_dir/images. Returns the .vott path.
+    output_dir = pathlib.Path(output_dir)
+    image_dir = output_dir.joinpath('images')
+    image_dir.mkdir(parents=True, exist_ok=True)
+    rng = random.Random(seed)
+    tags = [{'name': 'tag{}'.format(idx), 'color': TAG_COLORS[idx % len(TAG_COLORS)]} for idx in range(num_tags)]
+
+    assets = {}
+    for idx in range(num_assets):
+        height, width = image_sizes[idx % len(image_sizes)]
+        filename = 'img {:06d}.jpg'.format(idx)
+        path = 'file:' + urllib.parse.quote(str(image_dir.absolute().joinpath(filename)))
+        asset = {
+            'format': 'jpg',
+            'id': asset_id(path),
+            'name': urllib.parse.quote(filename),
+            'path': path,
+            'size': {'width': width, 'height': height},
+            'state': 2,
+            'type': 1,
+        }
+        regions = [make_region(rng, tags, height, width, rng.randint(*num_points), rng.random() < rectangle_ratio)
+                   for _ in range(num_regions)]
+        with open(output_dir.joinpath('{}-asset.json'.format(asset['id'])), 'w') as f:
+            json.dump({'asset': asset, 'regions': regions, 'version': VOTT_VERSION}, f, indent=4)
+        if images:
+            cv2.imwrite(str(image_dir.joinpath(filename)), make_image([seed, idx], height, width, regions))
+        assets[asset['id']] = asset
+
+    vott = {
+        'name': name,
+        'securityToken': '{} Token'.format(name),
+        'sourceConnection': {'name': name, 'providerType': 'localFileSystemProxy',
+                             'providerOptions': {'folderPath': str(image_dir.absolute())}},
+        'targetConnection': {'name': name, 'providerType': 'localFileSystemProxy',
+                             'providerOptions': {'folderPath': str(output_dir.absolute())}},
+        'videoSettings': {'frameExtractionRate': 15},
+        'tags': tags,
+        'version': VOTT_VERSION,
+        'lastVisitedAssetId': next(iter(assets), None),
+        'assets': assets,
+    }
+    vott_path = output_dir.joinpath('{}.vott'.format(name))
+    with open(vott_path, 'w') as f:
+        json.dump(vott, f, indent=4)
+    return vott_path
+
+
+def project_params(num_assets, num_regions, num_points, image_sizes, num_tags, rectangle_ratio, seed, images):
+    return {'num_assets': num_assets, 'num_regions': num_regions, 'num_points': list(num_points),
+            'image_sizes': [list(size) for size in image_sizes], 'num_tags': num_tags,
+            'rectangle_ratio': rectangle_ratio, 'seed': seed, 'images': images}
+
+def ensure_project(output_dir, params, name='synthetic'):
+    # Reuses the project in output_dir when it was generated with the same
+    # parameters, otherwise (re)generates it.
+    output_dir = pathlib.Path(output_dir)
+    params_path = output_dir.joinpath(PARAMS_FILE)
+    vott_path = output_dir.joinpath('{}.vott'.format(name))
+    try:
+        with open(params_path) as f:
+            if json.load(f) == params and vott_path.is_file():
+                return vott_path
+    except (OSError, ValueError):
+        if any(output_dir.glob('*-asset.json')):
+            raise FileExistsError('{} holds asset files of another project'.format(output_dir))
+    output_dir.mkdir(parents=True, exist_ok=True)
+    for asset_path in output_dir.glob('*-asset.json'):
+        asset_path.unlink()
+    vott_path = make_project(output_dir, name=name, **params)
+    with open(params_path, 'w') as f:
+        json.dump(params, f)
+    return vott_path
+
+
+def add_project_arguments(parser):
+    parser.add_argument('-a', '--num_assets', type=int, default=100, help="number of assets")
+    parser.add_argument('-r', '--num_regions', type=int, default=10, help="regions per asset")
+    parser.add_argument('-p', '--num_points', type=int, nargs=2, default=[3, 16], metavar=('min', 'max'),
+                        help="polygon vertex count range")
+    parser.add_argument('-s', '--image_size', type=int, nargs=2, action='append', default=None, metavar=('height', 'width'),
+                        help="image resolution, repeat for a mix of sizes (default 480 640)")
+    parser.add_argument('-t', '--num_tags', type=int, default=5, help="number of tags")
+    parser.add_argument('--rectangle_ratio', type=float, default=0.25, help="share of RECTANGLE regions")
+    parser.add_argument('--seed', type=int, default=0, help="random seed")
+    parser.add_argument('--no_images', help="write annotations only", action='store_true')
+
+def params_from_args(args):
+    return project_params(args.num_assets, args.num_regions, args.num_points, args.image_size or [[480, 640]],
+                          args.num_tags, args.rectangle_ratio, args.seed, not args.no_images)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Generate a synthetic VoTT project with dummy images.")
+    parser.add_argument('-o', '--output_dir', help="project directory", required=True)
+    add_project_arguments(parser)
+
+    args = parser.parse_args()
+
+    if args.num_points[0] < 3 or args.num_points[0] > args.num_points[1]:
+        parser.error('--num_points must be a range starting at 3 or more')
+
+    vott_path = ensure_project(args.output_dir, params_from_args(args))
+    print(vott_path)
@@ -0,0 +1,9 @@
+import pytest
+
+
+@pytest.fixture
+def project(tmp_path):
+    # The .vott path of a small synthetic project, images in images/
+    synthetic = pytest.importorskip('synthetic')
+    return synthetic.make_project(tmp_path / 'project', num_assets=12, num_regions=4,
+                                  image_sizes=((48, 64), (64, 48)))
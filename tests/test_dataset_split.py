@@ -0,0 +1,103 @@
+import collections
+import json
+import random
+import pytest
+from vott_tools import video, vott2coco, vott2tfrecords
+from vott_tools.cli_utils import parse_args
+from vott_tools.dataset_split import SPLITS, Splitter, hash_split, primary_tag, split_all, split_fraction, split_key
+from vott_tools.tfrecord_io import read_index
+
+RATIO = {'train': 0.6, 'val': 0.2, 'test': 0.2}
+KEYS = ['img 000.jpg', 'img 001.jpg', 'a', '画像 1.jpg', 'frames/clip.mp4']
+
+
+def make_assets(num_assets, tags, seed=0):
+    # (asset, regions) pairs whose primary tags follow the weights of tags
+    rng = random.Random(seed)
+    names, weights = zip(*tags.items())
+    assets = []
+    for idx in range(num_assets):
+        tag = rng.choices(names, weights)[0]
+        asset = {'id': 'id{:05d}'.format(idx), 'name': 'img%20{:05d}.jpg'.format(idx)}
+        assets.append((asset, [{'tags': [tag]}, {'tags': [tag, 'other']}]))
+    return assets
+
+
+def test_split_fraction_is_fixed():
+    # the same on every Python version and platform, so datasets can be rebuilt
+    assert [split_fraction(key) for key in KEYS[:3]] == [0.3046811400192312, 0.8941283332375297, 0.7417194198289923]
+
+@pytest.mark.parametrize('seed, splits', [
+    (0, ['train', 'test', 'val', 'train', 'train']),
+    (1, ['test', 'train', 'train', 'val', 'train']),
+])
+def test_hash_split_is_fixed(seed, splits):
+    assert [hash_split(key, RATIO, seed) for key in KEYS] == splits
+
+def test_hash_split_follows_the_ratio():
+    for ratio in (RATIO, {'train': 0.8, 'val': 0.2}, {'train': 0.5, 'test': 0.5}):
+        counts = collections.Counter(hash_split('img {}.jpg'.format(idx), ratio, 3) for idx in range(20000))
+        assert set(counts) == {split for split in SPLITS if ratio.get(split)}
+        for split, count in counts.items():
+            assert count / 20000 == pytest.approx(ratio[split], abs=0.02)
+
+def test_seeds_give_other_splits():
+    splits = {seed: [hash_split('img {}.jpg'.format(idx), RATIO, seed) for idx in range(200)] for seed in range(3)}
+    assert splits[0] != splits[1] != splits[2] != splits[0]
+
+def test_split_keys():
+    asset = {'id': 'abc', 'name': 'my%20image.jpg'}
+    frame = {'id': 'def', 'name': 'clip_t000000.500.jpg', 'type': video.VIDEO_FRAME_ASSET,
+             'parent': {'id': 'ghi', 'name': 'my%20clip.mp4'}, 'timestamp': 0.5}
+    assert split_key(asset) == 'my image.jpg' and split_key(asset, 'id') == 'abc'
+    # frames go with their video
+    assert split_key(frame) == 'my clip.mp4' and split_key(frame, 'id') == 'ghi'
+
+def test_primary_tag():
+    assert primary_tag([]) is None
+    assert primary_tag([{'tags': ['b']}, {'tags': ['a', 'b']}, {'tags': ['a']}]) == 'a'
+    assert primary_tag([{'tags': ['b', 'c']}, {'tags': ['c']}]) == 'c'
+
+
+@pytest.mark.parametrize('stratify', [False, True])
+def test_split_all_does_not_depend_on_order(stratify):
+    assets = make_assets(500, {'cat': 10, 'dog': 3, 'bird': 1})
+    expected = None
+    for seed in range(4):
+        shuffled = list(assets)
+        random.Random(seed).shuffle(shuffled)
+        splitter = Splitter(RATIO, 5, stratify)
+        splits = dict(split_all(splitter, ((asset['id'], asset, regions) for asset, regions in shuffled)))
+        assert expected is None or splits == expected
+        expected = splits
+    if not stratify:
+        # every asset on its own
+        assert expected == {asset['id']: hash_split(split_key(asset), RATIO, 5) for asset, _ in assets}
+
+@pytest.mark.parametrize('seed', [0, 1, 2])
+def test_stratified_splits_are_balanced(seed):
+    assets = make_assets(600, {'cat': 20, 'dog': 5, 'bird': 1, 'fish': 0.3}, seed)
+    splitter = Splitter(RATIO, seed, True)
+    splits = dict(split_all(splitter, ((asset['id'], asset, regions) for asset, regions in assets)))
+    strata = collections.defaultdict(collections.Counter)
+    for asset, regions in assets:
+        strata[primary_tag(regions)][splits[asset['id']]] += 1
+    for counts in strata.values():
+        total = sum(counts.values())
+        for split in SPLITS:
+            # no split over its share by more than the slack, so none is
+            # under by more than the slack of the other two
+            assert counts[split] <= RATIO[split] * total + splitter.slack
+            assert counts[split] >= RATIO[split] * total - 2 * splitter.slack
+
+@pytest.mark.parametrize('stratify', [[], ['--stratify']])
+def test_tools_agree_on_splits(project, tmp_path, stratify):
+    common = ['-f', str(project), '-o', str(tmp_path), '-r', '50:25:25', '--seed', '4'] + stratify
+    vott2coco.main(parse_args('coco', common + ['-p', 'coco_']))
+    vott2tfrecords.main(parse_args('tfrecords', common + ['-p', 'tf_', '-i', str(project.parent / 'images'),
+                                                          '-b', 'lite']))
+    for split in SPLITS:
+        with open(tmp_path / 'coco_{}.json'.format(split)) as f:
+            coco_files = [image['file_name'] for image in json.load(f)['images']]
+        tf_files = [filename for _, _, _, filename in read_index(tmp_path / 'tf_{}.tfrecord'.format(split))]
+        assert sorted(tf_files) == sorted(coco_files)
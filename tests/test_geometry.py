@@ -0,0 +1,179 @@
+import math
+import random
+import numpy as np
+import pytest
+from vott_tools import geometry
+
+
+def star_polygon(rng, height, width, integer):
+    # Star shaped around a centre that may lie off the image
+    cx = rng.uniform(-5, width + 5)
+    cy = rng.uniform(-5, height + 5)
+    radius = rng.uniform(1, min(height, width) / 2)
+    points = []
+    for angle in sorted(rng.uniform(0, 2 * math.pi) for _ in range(rng.randint(3, 12))):
+        r = radius * rng.uniform(0.3, 1.0)
+        points.append((cx + r * math.cos(angle), cy + r * math.sin(angle)))
+    if integer:
+        points = [(round(x), round(y)) for x, y in points]
+    return points
+
+def orientation(a, b, c):
+    cross = (b[0] - a[0]) * (c[1] - a[1]) - (b[1] - a[1]) * (c[0] - a[0])
+    return (cross > 0) - (cross < 0)
+
+def segments_touch(p, q, r, s):
+    def between(a, b, c):
+        return min(a[0], b[0]) <= c[0] <= max(a[0], b[0]) and min(a[1], b[1]) <= c[1] <= max(a[1], b[1])
+    o1, o2, o3, o4 = orientation(p, q, r), orientation(p, q, s), orientation(r, s, p), orientation(r, s, q)
+    if o1 != o2 and o3 != o4:
+        return True
+    return ((o1 == 0 and between(p, q, r)) or (o2 == 0 and between(p, q, s)) or
+            (o3 == 0 and between(r, s, p)) or (o4 == 0 and between(r, s, q)))
+
+def is_simple(points):
+    # No repeated or collinear neighbouring vertices and no edges touching
+    # other than neighbours at their shared vertex. Rounding a star polygon
+    # to integers can break it.
+    n = len(points)
+    if any(orientation(points[idx - 2], points[idx - 1], points[idx]) == 0 for idx in range(n)):
+        return False
+    edges = [(points[idx], points[(idx + 1) % n]) for idx in range(n)]
+    return not any(segments_touch(*edges[i], *edges[j])
+                   for i in range(n) for j in range(i + 2, n) if not (i == 0 and j == n - 1))
+
+def simple_polygons(seed, integer, count=150):
+    rng = random.Random(seed)
+    polygons = []
+    while len(polygons) < count:
+        height, width = rng.randint(5, 40), rng.randint(5, 40)
+        points = star_polygon(rng, height, width, integer)
+        if is_simple(points):
+            polygons.append((points, height, width))
+    return polygons
+
+def polygon_mask(polygons, height, width):
+    xs = [x for points in polygons for x, _ in points]
+    ys = [y for points in polygons for _, y in points]
+    offsets = np.cumsum([0] + [len(points) for points in polygons])
+    instances, columns, start, stop = geometry.polygon_runs(xs, ys, offsets, height, width)
+    return geometry.runs_to_mask(columns, start, stop, height, width, value=1)
+
+def skimage_mask(points, height, width):
+    draw = pytest.importorskip('skimage.draw')
+    mask = np.zeros((height, width), np.uint8)
+    rows, columns = draw.polygon([y for _, y in points], [x for x, _ in points], (height, width))
+    mask[rows, columns] = 1
+    return mask
+
+
+@pytest.mark.parametrize('seed', [0, 1, 2])
+@pytest.mark.parametrize('integer', [True, False], ids=['integer', 'float'])
+def test_polygon_runs_match_skimage(seed, integer):
+    for points, height, width in simple_polygons(seed, integer):
+        assert np.array_equal(polygon_mask([points], height, width), skimage_mask(points, height, width)), points
+
+@pytest.mark.parametrize('points', [
+    [(1, 1), (1, 5), (9, 5), (9, 1)],
+    [(0.5, 0.5), (8.5, 0.5), (8.5, 4.5), (0.5, 4.5)],
+    [(2, 1), (8, 1), (8, 8), (5, 4), (2, 8)],
+    [(-3, -3), (20, -3), (20, 20), (-3, 20)],
+    [(3, 3), (4, 3), (4, 4)],
+    [(3.2, 3.2), (3.8, 3.2), (3.8, 3.8)],
+])
+def test_polygon_runs_match_skimage_on_edges(points):
+    assert np.array_equal(polygon_mask([points], 10, 12), skimage_mask(points, 10, 12))
+
+@pytest.mark.parametrize('points', [
+    [(8, 2), (4, 2), (2, 2)],
+    [(2, 1), (2, 5), (2, 9)],
+    [(1, 1), (3, 3), (5, 5)],
+    [(1.5, 2), (4.5, 2), (7.5, 2)],
+    [(1, 3), (9, 3)],
+    [(3, 3)],
+    [],
+])
+def test_polygons_without_area_have_no_pixels(points):
+    assert not polygon_mask([points], 12, 12).any()
+    # and leave the other polygons alone
+    instances, _, _, _ = geometry.polygon_runs([x for x, _ in points] + [1, 1, 5], [y for _, y in points] + [1, 5, 5],
+                                               [0, len(points), len(points) + 3], 12, 12)
+    assert set(instances.tolist()) == {1}
+
+def test_instances_are_filled_independently():
+    polygons = [points for points, _, _ in simple_polygons(3, False, 10)]
+    xs = [x for points in polygons for x, _ in points]
+    ys = [y for points in polygons for _, y in points]
+    offsets = np.cumsum([0] + [len(points) for points in polygons])
+    instances, columns, start, stop = geometry.polygon_runs(xs, ys, offsets, 40, 40)
+    # column-major order, runs of an instance do not overlap or touch
+    keys = (instances * 40 + columns) * 41 + start
+    assert np.all(np.diff(keys) > 0)
+    for idx, part in enumerate(geometry.split_runs(instances, len(polygons))):
+        assert np.array_equal(geometry.runs_to_mask(columns[part], start[part], stop[part], 40, 40, value=1),
+                              polygon_mask([polygons[idx]], 40, 40))
+
+def test_paint_runs_matches_runs_to_mask():
+    points = simple_polygons(4, False, 1)[0][0]
+    _, columns, start, stop = geometry.polygon_runs([x for x, _ in points], [y for _, y in points],
+                                                    [0, len(points)], 40, 40)
+    painted = geometry.paint_runs(np.zeros((40, 40), np.uint8), columns, start, stop, 7)
+    assert np.array_equal(painted, geometry.runs_to_mask(columns, start, stop, 40, 40, value=7))
+
+
+def rle_masks():
+    masks = [np.zeros((5, 7), np.uint8), np.ones((5, 7), np.uint8)]
+    first = np.zeros((5, 7), np.uint8)
+    first[0, 0] = 1
+    last = np.zeros((5, 7), np.uint8)
+    last[-1, -1] = 1
+    masks += [first, last]
+    # columns running into each other and long runs, for multi-character counts
+    stripes = np.zeros((300, 200), np.uint8)
+    stripes[150:, 10] = 1
+    stripes[:20, 11] = 1
+    stripes[:, 50:120] = 1
+    stripes[7, 190:] = 1
+    masks.append(stripes)
+    for points, height, width in simple_polygons(5, False, 20):
+        masks.append(polygon_mask([points], height, width))
+    rng = np.random.default_rng(0)
+    masks.append((rng.random((64, 48)) < 0.3).astype(np.uint8))
+    return masks
+
+def mask_runs(mask):
+    # (column, start, stop) runs of a mask, column by column
+    columns, start, stop = [], [], []
+    for column in range(mask.shape[1]):
+        changes = np.flatnonzero(np.diff(np.concatenate([[0], mask[:, column], [0]])))
+        columns += [column] * (len(changes) // 2)
+        start += changes[0::2].tolist()
+        stop += changes[1::2].tolist()
+    return tuple(np.array(values, dtype=np.int64) for values in (columns, start, stop))
+
+@pytest.mark.parametrize('mask', rle_masks())
+def test_rle_matches_pycocotools(mask):
+    mask_utils = pytest.importorskip('pycocotools.mask')
+    height, width = mask.shape
+    counts = geometry.runs_to_rle(*mask_runs(mask), height, width)
+    assert counts.sum() == height * width
+    encoded = mask_utils.encode(np.asfortranarray(mask))
+    assert geometry.rle_to_string(counts) == encoded['counts'].decode('ascii')
+    assert mask_utils.frPyObjects({'counts': counts.tolist(), 'size': [height, width]}, height, width) == encoded
+    decoded = mask_utils.decode({'counts': geometry.rle_to_string(counts).encode('ascii'), 'size': [height, width]})
+    assert np.array_equal(decoded, mask)
+
+def test_polygon_rle_matches_pycocotools():
+    mask_utils = pytest.importorskip('pycocotools.mask')
+    for points, height, width in simple_polygons(6, True, 30):
+        _, columns, start, stop = geometry.polygon_runs([x for x, _ in points], [y for _, y in points],
+                                                        [0, len(points)], height, width)
+        counts = geometry.runs_to_rle(columns, start, stop, height, width)
+        encoded = mask_utils.encode(np.asfortranarray(skimage_mask(points, height, width)))
+        assert geometry.rle_to_string(counts) == encoded['counts'].decode('ascii')
+
+
+def test_polygon_areas():
+    xs = [0, 4, 4, 0, 0, 3, 0, 1, 2]
+    ys = [0, 0, 2, 2, 0, 0, 1, 1, 1]
+    assert geometry.polygon_areas(xs, ys, [0, 4, 4, 6, 9]).tolist() == [8.0, 0.0, 0.0, 0.0]
@@ -0,0 +1,87 @@
+import io
+import json
+import pytest
+from vott_tools import json_stream, vott2coco
+from vott_tools.cli_utils import parse_args
+
+
+DOCUMENTS = [
+    {},
+    {'assets': {}},
+    {'assets': []},
+    {'a': 1, 'b': -12.5, 'c': 1e-300, 'd': -0.0, 'e': 12345678901234567890, 'f': 2.5E+10},
+    {'t': True, 'f': False, 'n': None, 's': '', 'l': [], 'o': {}},
+    {'name': '画像 "1"\\\n\t\u0001 \U0001f408', 'esc': '\\u00e9 / \\/'},
+    {'tags': [{'name': 'tag1', 'color': '#5b1837'}], 'version': '2.1.0',
+     'assets': {'a' * 32: {'id': 'a' * 32, 'name': '%E7%94%BB.jpg', 'size': {'width': 640, 'height': 480},
+                           'points': [[0.5, 1], [1e3, -2.25]], 'nested': {'assets': {'x': 1}}},
+                'b' * 32: {'id': 'b' * 32, 'name': 'b.jpg', 'size': {'width': 12, 'height': 7}}},
+     'lastVisitedAssetId': 'b' * 32},
+    {'numbers': [0, 1, 12, 123.25, -7, 1e5, 3.0e-7], 'last': 9876543210},
+]
+
+
+def expected_items(document, stream_keys=('assets',)):
+    items = []
+    for key, value in document.items():
+        if key in stream_keys and isinstance(value, dict):
+            items.extend(((key, member_key), member) for member_key, member in value.items())
+        else:
+            items.append(((key,), value))
+    return items
+
+def dumps(document, style):
+    if style == 'compact':
+        return json.dumps(document, separators=(',', ':'), ensure_ascii=False)
+    if style == 'indent':
+        return json.dumps(document, indent=4)
+    return ' \n' + json.dumps(document, separators=(' ,\t', ' :\r\n ')) + '\n '
+
+
+@pytest.mark.parametrize('chunk_size', [1, 2, 3, 7, json_stream.CHUNK_SIZE])
+@pytest.mark.parametrize('style', ['compact', 'indent', 'spaced'])
+@pytest.mark.parametrize('document', DOCUMENTS)
+def test_iter_items_matches_json_loads(document, style, chunk_size):
+    text = dumps(document, style)
+    items = list(json_stream.iter_items(io.StringIO(text), ('assets',), chunk_size))
+    assert items == expected_items(json.loads(text))
+    # floats come back as the same type and value, not cut at a chunk end
+    assert [type(value) for _, value in items] == [type(value) for _, value in expected_items(json.loads(text))]
+
+@pytest.mark.parametrize('chunk_size', [1, 3, 7])
+def test_numbers_at_the_end(chunk_size):
+    for number in ['1', '12', '12.5', '-1.25e-10', '123456789']:
+        text = '{"a": ' + number + '}'
+        assert list(json_stream.iter_items(io.StringIO(text), (), chunk_size)) == [(('a',), json.loads(number))]
+
+@pytest.mark.parametrize('text', ['', '[]', '{"a": 1', '{"a": 1,', '{"a" 1}', '{"a": [1, 2}', '{"assets": {"x": 1'])
+@pytest.mark.parametrize('chunk_size', [1, 7])
+def test_invalid_documents(text, chunk_size):
+    with pytest.raises(ValueError):
+        list(json_stream.iter_items(io.StringIO(text), ('assets',), chunk_size))
+
+
+def test_read_vott_header(project):
+    with open(project) as f:
+        vott = json.load(f)
+    header, num_assets = json_stream.read_vott_header(project)
+    assert num_assets == len(vott.pop('assets'))
+    assert header == vott
+
+@pytest.mark.parametrize('ratio', [None, '60:20:20'])
+def test_stream_coco_matches_load_json(project, tmp_path, ratio):
+    ratio_args = ['-r', ratio] if ratio else []
+    for stream_args, prefix in (([], 'loaded'), (['--stream'], 'streamed')):
+        vott2coco.main(parse_args('coco', ['-f', str(project), '-o', str(tmp_path), '-p', prefix] + ratio_args +
+                                  stream_args))
+    outputs = sorted(path.name for path in tmp_path.glob('loaded*.json'))
+    assert outputs
+    for name in outputs:
+        with open(tmp_path / name) as f:
+            loaded = json.load(f)
+        with open(tmp_path / name.replace('loaded', 'streamed')) as f:
+            streamed = json.load(f)
+        for coco in (loaded, streamed):
+            for image in coco['images']:
+                image.pop('date_captured')
+        assert streamed == loaded
@@ -0,0 +1,52 @@
+import json
+import numpy as np
+import pytest
+from vott_tools import geometry
+
+cv2 = pytest.importorskip('cv2')
+from vott_tools import cutout, make_masks
+from vott_tools.project_index import read_asset
+
+
+def polygon_mask(record, new_height, new_width):
+    # The pixels of an asset's polygons by the scanline rule
+    polygons = [region for region in record['regions'] if region['type'] == 'POLYGON']
+    columns, start, stop, _ = geometry.rasterize_polygons(polygons, record['asset']['size']['height'],
+                                                          record['asset']['size']['width'], new_height, new_width)
+    return geometry.runs_to_mask(columns, start, stop, new_height, new_width)
+
+def decode(encoded):
+    return cv2.imdecode(np.frombuffer(encoded, np.uint8), cv2.IMREAD_UNCHANGED)
+
+
+@pytest.mark.parametrize('mode', ['binary', 'instance'])
+@pytest.mark.parametrize('new_size', [None, (30, 20)])
+def test_masks_and_export_share_pixels(project, new_size, mode):
+    for asset_file in sorted(project.parent.glob('*-asset.json')):
+        record = read_asset(asset_file)
+        height, width = new_size or (record['asset']['size']['height'], record['asset']['size']['width'])
+        polygons = [region for region in record['regions'] if region['type'] == 'POLYGON']
+        mask = decode(make_masks.render_mask(record, new_size, mode))
+        rasterized = geometry.rasterize_polygons(polygons, record['asset']['size']['height'],
+                                                 record['asset']['size']['width'], height, width)
+        assert np.array_equal(mask, decode(make_masks.render_rasterized_mask(polygons, rasterized, height, width,
+                                                                             mode)))
+        assert np.array_equal(mask > 0, polygon_mask(record, height, width) > 0)
+
+@pytest.mark.parametrize('crops', [False, True])
+def test_cutout_and_export_share_pixels(project, crops):
+    with open(sorted(project.parent.glob('*-asset.json'))[0]) as f:
+        record = json.load(f)
+    height, width = record['asset']['size']['height'], record['asset']['size']['width']
+    image = np.full((height, width, 3), 200, np.uint8)
+    polygons = [region for region in record['regions'] if region['type'] == 'POLYGON']
+    rasterized = geometry.rasterize_polygons(polygons, height, width, height, width)
+    outputs = [(filename, encoded.tobytes()) for filename, encoded in cutout.render_decoded_image(record, image, crops)]
+    assert outputs == [(filename, encoded.tobytes())
+                       for filename, encoded in cutout.render_decoded_image(record, image, crops, rasterized)]
+    if not crops:
+        kept = decode(outputs[0][1]).max(axis=2) > 100
+        # JPEG blurs the outline, the inside is kept and the outside blacked out
+        inside = cv2.erode(polygon_mask(record, height, width), np.ones((3, 3), np.uint8)) > 0
+        outside = cv2.dilate(polygon_mask(record, height, width), np.ones((3, 3), np.uint8)) == 0
+        assert kept[inside].all() and not kept[outside].any()
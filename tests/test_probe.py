@@ -0,0 +1,96 @@
+import io
+import struct
+import pytest
+from vott_tools import probe
+
+
+def encode(ext, height, width, params=()):
+    cv2 = pytest.importorskip('cv2')
+    np = pytest.importorskip('numpy')
+    ok, encoded = cv2.imencode(ext, np.zeros((height, width, 3), np.uint8), list(params))
+    if not ok:
+        pytest.skip('OpenCV cannot write {}'.format(ext))
+    return encoded.tobytes()
+
+def write(tmp_path, name, data):
+    path = tmp_path / name
+    path.write_bytes(data)
+    return path
+
+def asset_record(name, height, width, image_format='jpg'):
+    return {'asset': {'id': 'a', 'name': name, 'format': image_format, 'type': 1,
+                      'size': {'height': height, 'width': width}},
+            'regions': []}
+
+
+def test_jpeg_size():
+    assert probe.jpeg_size(io.BytesIO(encode('.jpg', 37, 53)[2:])) == (37, 53)
+
+def test_jpeg_size_progressive():
+    cv2 = pytest.importorskip('cv2')
+    assert probe.jpeg_size(io.BytesIO(encode('.jpg', 37, 53, (cv2.IMWRITE_JPEG_PROGRESSIVE, 1))[2:])) == (37, 53)
+
+def test_jpeg_size_skips_segments_and_fill_bytes():
+    # an EXIF segment holding an SOF-like byte, then padding before the next marker
+    exif = b'Exif\x00\x00' + b'\xff\xc0' * 10
+    data = encode('.jpg', 37, 53)
+    data = b'\xff\xe1' + struct.pack('>H', len(exif) + 2) + exif + b'\xff\xff' + data[2:]
+    assert probe.jpeg_size(io.BytesIO(data)) == (37, 53)
+
+def test_jpeg_size_without_frame_header():
+    with pytest.raises(ValueError):
+        probe.jpeg_size(io.BytesIO(b'\xff\xd9'))
+    with pytest.raises(ValueError):
+        probe.jpeg_size(io.BytesIO(b'\xff\xe0\x00'))
+
+
+@pytest.mark.parametrize('ext, image_format', [('.jpg', 'jpeg'), ('.png', 'png'), ('.bmp', 'bmp')])
+def test_image_header(tmp_path, ext, image_format):
+    path = write(tmp_path, 'image' + ext, encode(ext, 37, 53))
+    assert probe.image_header(path) == (image_format, 37, 53)
+
+def test_gif_header(tmp_path):
+    path = write(tmp_path, 'image.gif', b'GIF89a' + struct.pack('<HH', 53, 37) + b'\x00' * 10)
+    assert probe.image_header(path) == ('gif', 37, 53)
+
+def test_top_down_bmp_header(tmp_path):
+    path = write(tmp_path, 'image.bmp', b'BM' + bytes(16) + struct.pack('<ii', 53, -37) + bytes(28))
+    assert probe.image_header(path) == ('bmp', 37, 53)
+
+def test_truncated_png_header(tmp_path):
+    path = write(tmp_path, 'image.png', encode('.png', 37, 53)[:20])
+    with pytest.raises(ValueError):
+        probe.image_header(path)
+
+@pytest.mark.parametrize('ext', ['.tiff', '.webp'])
+def test_unknown_format(tmp_path, ext):
+    path = write(tmp_path, 'image' + ext, encode(ext, 37, 53))
+    with pytest.raises(probe.UnknownFormatError):
+        probe.image_header(path)
+
+
+def test_check_record(tmp_path):
+    write(tmp_path, 'a b.jpg', encode('.jpg', 37, 53))
+    assert probe.check_record(asset_record('a%20b.jpg', 37, 53), tmp_path, probe.ProbeCache()) == ('a b.jpg', [])
+    _, problems = probe.check_record(asset_record('a%20b.jpg', 53, 37, 'png'), tmp_path, probe.ProbeCache())
+    assert [kind for kind, _ in problems] == ['size', 'format']
+    assert probe.count_problems([('a b.jpg', problems)]) == (1, 1)
+    assert probe.check_record(asset_record('c.jpg', 37, 53), tmp_path, probe.ProbeCache())[1][0][0] == 'missing'
+
+@pytest.mark.parametrize('ext', ['.tiff', '.webp'])
+def test_unknown_format_is_a_warning(tmp_path, ext):
+    write(tmp_path, 'image' + ext, encode(ext, 37, 53))
+    # the recorded size is not checked
+    results = [probe.check_record(asset_record('image' + ext, 1, 1, ext[1:]), tmp_path, probe.ProbeCache())]
+    assert [kind for kind, _ in results[0][1]] == ['format']
+    assert probe.count_problems(results) == (0, 1)
+
+def test_cache_reuses_headers(tmp_path):
+    path = write(tmp_path, 'image.png', encode('.png', 37, 53))
+    cache_path = str(tmp_path / 'probe.json')
+    cache = probe.ProbeCache(cache_path)
+    assert cache.header(path) == ('png', 37, 53)
+    cache.save()
+    cache = probe.ProbeCache(cache_path)
+    assert cache.header(path) == ('png', 37, 53)
+    assert cache.hits == 1
@@ -0,0 +1,78 @@
+import json
+import os
+import pickle
+import numpy as np
+from vott_tools import geometry, project_index, vott2coco
+from vott_tools.cli_utils import parse_args
+
+
+def bump_mtime(path):
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+
+
+def test_records_match_asset_files(project, tmp_path):
+    index = project_index.open_project(project, tmp_path / 'index.npz')
+    asset_files = sorted(project.parent.glob('*-asset.json'))
+    records = index.file_records()
+    assert len(records) == len(asset_files)
+    for asset_file, record in zip(asset_files, records):
+        expected = project_index.read_asset(asset_file)
+        assert record['asset']['id'] + '-asset.json' == asset_file.name
+        assert record['regions'] == expected['regions']
+    assert [record['asset']['id'] for record in records[2:5]] == [path.name[:-len('-asset.json')]
+                                                                  for path in asset_files[2:5]]
+
+def test_index_regions_hand_over_columns(project, tmp_path):
+    index = project_index.open_project(project, tmp_path / 'index.npz')
+    for record in index.records():
+        regions = record['regions']
+        expected = [dict(region) for region in regions]
+        for got, want in zip(geometry.region_arrays(regions), geometry.region_arrays(expected)):
+            assert np.array_equal(got, want)
+        assert regions.types() == [region['type'] for region in expected]
+        assert regions.first_tags() == [region['tags'][0] for region in expected]
+        # sent to worker processes as a plain list
+        unpickled = pickle.loads(pickle.dumps(regions))
+        assert type(unpickled) is list and unpickled == expected
+
+def test_index_coco_matches_load_json(project, tmp_path):
+    for index_args, prefix in (([], 'loaded'), (['-x', str(tmp_path / 'index.npz')], 'indexed')):
+        vott2coco.main(parse_args('coco', ['-f', str(project), '-o', str(tmp_path), '-p', prefix] + index_args))
+    with open(tmp_path / 'loaded.json') as f:
+        loaded = json.load(f)
+    with open(tmp_path / 'indexed.json') as f:
+        indexed = json.load(f)
+    for coco in (loaded, indexed):
+        for image in coco['images']:
+            image.pop('date_captured')
+    assert indexed == loaded
+
+
+def test_index_goes_stale(project, tmp_path):
+    index_path = tmp_path / 'index.npz'
+    index = project_index.open_project(project, index_path)
+    assert index.is_current(project)
+    # an asset file edited in place is not noticed
+    asset_files = sorted(project.parent.glob('*-asset.json'))
+    bump_mtime(asset_files[0])
+    assert index.is_current(project)
+
+    bump_mtime(project)
+    assert not index.is_current(project)
+    index = project_index.open_project(project, index_path)
+    assert index.is_current(project)
+
+    # VoTT saving an asset file replaces it
+    replaced = asset_files[1].with_suffix('.tmp')
+    replaced.write_bytes(asset_files[1].read_bytes())
+    os.replace(replaced, asset_files[1])
+    assert not index.is_current(project)
+
+def test_index_without_file_order_is_rebuilt(project, tmp_path):
+    index_path = tmp_path / 'index.npz'
+    index = project_index.open_project(project, index_path)
+    with open(index_path, 'wb') as f:
+        np.savez(f, **{name: getattr(index, name) for name in index.ARRAYS if name != 'asset_file_order'})
+    index = project_index.open_project(project, index_path)
+    assert np.array_equal(project_index.ProjectIndex.load(index_path).asset_file_order, index.asset_file_order)
@@ -0,0 +1,123 @@
+import json
+import os
+import threading
+import pytest
+from vott_tools import serve, vott2coco
+from vott_tools.cli_utils import parse_args
+from vott_tools.tfrecord_io import IndexedReader
+
+pytest.importorskip('cv2')
+
+
+@pytest.fixture(params=['tcp', 'unix'])
+def server(request, project, tmp_path):
+    # A daemon over the synthetic project, served from a thread
+    state = serve.ProjectState(project, project.parent / 'images', tmp_path / 'out', 'serve_', backend='lite')
+    state.output_dir.mkdir()
+    with state.lock:
+        state.refresh()
+        state.warm()
+    if request.param == 'unix':
+        socket_path = tmp_path / 'serve.sock'
+        server = serve.UnixHTTPServer(str(socket_path), serve.RequestHandler)
+        server.call = lambda path, method='GET': serve.request(path, method, socket_path=socket_path, timeout=30)
+    else:
+        server = serve.ThreadingHTTPServer(('127.0.0.1', 0), serve.RequestHandler)
+        host, port = server.server_address[:2]
+        server.call = lambda path, method='GET': serve.request(path, method, host, port, timeout=30)
+    server.state = state
+    server.thread = threading.Thread(target=server.serve_forever, daemon=True)
+    server.thread.start()
+    yield server
+    if server.thread.is_alive():
+        server.shutdown()
+        server.thread.join()
+    server.server_close()
+
+
+def without_dates(coco):
+    for image in coco['images']:
+        image.pop('date_captured')
+    return coco
+
+def edit_asset(asset_file):
+    # Moves the box of the first region by a pixel, as VoTT saves it: a new
+    # file replaces the old one
+    with open(asset_file) as f:
+        record = json.load(f)
+    record['regions'][0]['boundingBox']['left'] += 1
+    tmp_file = asset_file.with_name(asset_file.name + '.tmp')
+    with open(tmp_file, 'w') as f:
+        json.dump(record, f)
+    stat = os.stat(asset_file)
+    os.utime(tmp_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    os.replace(tmp_file, asset_file)
+    return record['asset']['id']
+
+def read_examples(paths):
+    with IndexedReader(paths) as reader:
+        return {asset_id: reader.read(asset_id) for asset_id in reader.ids()}
+
+
+def test_status(server, project):
+    status, body = server.call('/status')
+    assert status == 200
+    assert body['vott_file'] == str(project)
+    assert body['assets'] == body['vott_assets'] == 12
+    assert body['categories'] == 5
+    # warmed up: every conversion is cached
+    assert body['coco_cached'] == body['examples_cached'] == 12
+    assert body['examples_pending'] == 0
+    assert body['refreshes'] >= 2
+
+@pytest.mark.parametrize('ratio, subset', [(None, None), ('60:20:20', 'train'), ('60:20:20', 'val'),
+                                           ('60:20:20', 'test')])
+def test_coco_matches_create_cocos(server, project, tmp_path, ratio, subset):
+    args = ['-f', str(project), '-o', str(tmp_path), '-p', 'coco_', '--seed', '3']
+    query = '?seed=3'
+    if ratio:
+        args += ['-r', ratio]
+        query += '&ratio={}&subset={}'.format(ratio, subset)
+    vott2coco.main(parse_args('coco', args))
+    with open(tmp_path / 'coco_{}.json'.format(subset or '')) as f:
+        expected = json.load(f)
+    status, body = server.call('/coco' + query)
+    assert status == 200
+    assert without_dates(body) == without_dates(expected)
+
+def test_tfrecords_rebuilds_the_changed_example(server, project):
+    status, body = server.call('/tfrecords', 'POST')
+    assert status == 200
+    assert body['built'] == 0 and body['sizes'] == {'': 12}
+    before = read_examples(body['outputs'])
+    assert len(before) == 12
+
+    asset_files = sorted(project.parent.glob('*-asset.json'))
+    # a file touched but not changed is read again, not rebuilt
+    os.utime(asset_files[2], ns=(0, os.stat(asset_files[2]).st_mtime_ns + 10 ** 9))
+    status, body = server.call('/tfrecords', 'POST')
+    assert body['built'] == 0
+    assert read_examples(body['outputs']) == before
+
+    edited = edit_asset(asset_files[5])
+    status, body = server.call('/tfrecords', 'POST')
+    assert status == 200 and body['built'] == 1
+    after = read_examples(body['outputs'])
+    assert [asset_id for asset_id in before if after[asset_id] != before[asset_id]] == [edited]
+
+def test_unknown_routes_and_methods(server):
+    assert server.call('/nothing')[0] == 404
+    assert server.call('/nothing', 'POST')[0] == 404
+    status, body = server.call('/status', 'POST')
+    assert status == 405 and 'error' in body
+    assert server.call('/tfrecords')[0] == 405
+    assert server.call('/shutdown')[0] == 405
+    assert server.call('/coco?ratio=half&subset=train')[0] == 400
+    assert server.call('/coco?ratio=60:40&subset=test')[0] == 400
+    # still serving
+    assert server.call('/status')[0] == 200
+
+def test_shutdown(server):
+    assert server.call('/shutdown', 'POST') == (200, {'shutdown': True})
+    server.thread.join(timeout=30)
+    assert not server.thread.is_alive()
@@ -0,0 +1,141 @@
+import os
+import random
+import pytest
+from vott_tools import tfrecord_io
+
+
+# RFC 3720 (iSCSI) CRC32C test vectors and the usual check value
+CRC32C_VECTORS = [
+    (b'', 0x00000000),
+    (b'123456789', 0xe3069283),
+    (bytes(32), 0x8a9136aa),
+    (b'\xff' * 32, 0x62a8ab43),
+    (bytes(range(32)), 0x46dd794e),
+    (bytes(range(31, -1, -1)), 0x113fdb5c),
+]
+
+
+def random_bytes(length, seed=0):
+    rng = random.Random(seed)
+    return bytes(rng.getrandbits(8) for _ in range(length))
+
+def example_features():
+    return {
+        'image/encoded': tfrecord_io.bytes_list_feature([random_bytes(5000)]),
+        'image/filename': tfrecord_io.bytes_list_feature(['画像 1.jpg'.encode('utf-8')]),
+        'image/height': tfrecord_io.int64_list_feature([480]),
+        'image/object/bbox/xmin': tfrecord_io.float_list_feature([0.0, 0.25, 0.5]),
+        'image/object/class/label': tfrecord_io.int64_list_feature([1, -2, 2 ** 40]),
+        'image/object/class/text': tfrecord_io.bytes_list_feature([b'cat', b'', b'dog']),
+        'image/object/mask': tfrecord_io.bytes_list_feature([]),
+        'image/object/area': tfrecord_io.float_list_feature([]),
+        'image/object/is_crowd': tfrecord_io.int64_list_feature([]),
+    }
+
+
+@pytest.mark.parametrize('data, expected', CRC32C_VECTORS)
+def test_crc32c_vectors(data, expected):
+    assert tfrecord_io.crc32c(data) == expected
+    assert tfrecord_io._crc32c(data) == expected
+    assert tfrecord_io._crc32c_fallback(data) == expected
+
+@pytest.mark.parametrize('length', [4096, 4097, 5000, 65536, 100003])
+def test_crc32c_lanes_match_table(length):
+    data = os.urandom(length)
+    assert tfrecord_io._crc32c_lanes(data) == tfrecord_io._crc32c(data)
+
+
+def test_serialize_parse_round_trip():
+    features = example_features()
+    # the floats are exact in float32
+    assert tfrecord_io.parse_example(tfrecord_io.serialize_example(features)) == features
+
+def test_serialize_matches_protobuf():
+    example_pb2 = pytest.importorskip('tensorflow.core.example.example_pb2')
+    features = example_features()
+    serialized = tfrecord_io.serialize_example(features)
+    example = example_pb2.Example.FromString(serialized)
+    assert example.SerializeToString(deterministic=True) == serialized
+    assert example.features.feature['image/object/class/label'].int64_list.value == [1, -2, 2 ** 40]
+    assert example.features.feature['image/filename'].bytes_list.value == ['画像 1.jpg'.encode('utf-8')]
+    assert tfrecord_io.parse_example(example.SerializeToString(deterministic=True)) == \
+        tfrecord_io.parse_example(serialized)
+
+
+def test_frame_read_round_trip(tmp_path):
+    path = tmp_path / 'data.tfrecord'
+    records = [b'', b'x', random_bytes(100), random_bytes(70000, 1)]
+    with tfrecord_io.TFRecordWriter(str(path)) as writer:
+        for record in records:
+            writer.write(record)
+    assert list(tfrecord_io.read_records(str(path))) == records
+    assert path.stat().st_size == sum(len(record) + tfrecord_io.RECORD_OVERHEAD for record in records)
+
+def test_read_detects_corruption(tmp_path):
+    path = tmp_path / 'data.tfrecord'
+    framed = bytearray(tfrecord_io.frame_record(random_bytes(100)))
+    framed[20] ^= 1
+    path.write_bytes(bytes(framed))
+    with pytest.raises(tfrecord_io.CorruptRecordError):
+        list(tfrecord_io.read_records(str(path)))
+    assert len(list(tfrecord_io.read_records(str(path), verify=False))) == 1
+
+
+def test_records_readable_by_tensorflow(tmp_path):
+    tf = pytest.importorskip('tensorflow')
+    path = tmp_path / 'data.tfrecord'
+    records = [tfrecord_io.serialize_example(example_features()), b'', random_bytes(70000, 2)]
+    with tfrecord_io.TFRecordWriter(str(path)) as writer:
+        for record in records:
+            writer.write(record)
+    assert [record.numpy() for record in tf.data.TFRecordDataset(str(path))] == records
+
+def test_reads_tensorflow_records(tmp_path):
+    tf = pytest.importorskip('tensorflow')
+    path = tmp_path / 'data.tfrecord'
+    records = [tfrecord_io.serialize_example(example_features()), b'', random_bytes(70000, 3)]
+    with tf.io.TFRecordWriter(str(path)) as writer:
+        for record in records:
+            writer.write(record)
+    assert list(tfrecord_io.read_records(str(path))) == records
+    with open(path, 'rb') as f:
+        assert f.read() == b''.join(tfrecord_io.frame_record(record) for record in records)
+
+
+def test_indexed_reader(tmp_path):
+    path = str(tmp_path / 'data.tfrecord')
+    records = {'a': random_bytes(10), 'b': random_bytes(5000, 1), 'c': b''}
+    with tfrecord_io.IndexedWriter(tfrecord_io.TFRecordWriter(path), path) as writer:
+        for asset_id, record in records.items():
+            writer.write(record, asset_id, '{} 1.jpg'.format(asset_id))
+    with tfrecord_io.IndexedReader(path) as reader:
+        assert len(reader) == 3
+        assert [reader.read(asset_id) for asset_id in 'cab'] == [records[asset_id] for asset_id in 'cab']
+
+def test_index_is_readable_as_offset_size_pairs(tmp_path):
+    # DALI reads the .idx as a whitespace separated stream of offset, size
+    path = str(tmp_path / 'data.tfrecord')
+    records = [random_bytes(10), b'', random_bytes(5000, 1)]
+    with tfrecord_io.IndexedWriter(tfrecord_io.TFRecordWriter(path), path) as writer:
+        for idx, record in enumerate(records):
+            writer.write(record, 'id{}'.format(idx), 'image {}.jpg'.format(idx))
+    with open(tfrecord_io.index_path(path)) as f:
+        numbers = [int(token) for token in f.read().split()]
+    pairs = list(zip(numbers[::2], numbers[1::2]))
+    assert len(pairs) == len(records)
+    with open(path, 'rb') as f:
+        data = f.read()
+    assert [data[offset:offset + size] for offset, size in pairs] == [tfrecord_io.frame_record(record)
+                                                                      for record in records]
+    assert list(tfrecord_io.read_index(path)) == [(offset, size, 'id{}'.format(idx), 'image {}.jpg'.format(idx))
+                                                  for idx, (offset, size) in enumerate(pairs)]
+
+def test_index_sidecars_must_match(tmp_path):
+    path = str(tmp_path / 'data.tfrecord')
+    with tfrecord_io.IndexedWriter(tfrecord_io.TFRecordWriter(path), path) as writer:
+        writer.write(b'a', 'a', 'a.jpg')
+        writer.write(b'b', 'b', 'b.jpg')
+    with open(tfrecord_io.ids_path(path), 'w') as f:
+        f.write('a\ta.jpg\n')
+    with pytest.raises(tfrecord_io.CorruptRecordError):
+        tfrecord_io.IndexedReader(path)
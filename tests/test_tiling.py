@@ -0,0 +1,70 @@
+import pytest
+from vott_tools import tiling
+from vott_tools.vott2coco import polygon_area
+
+
+TRIANGLE = [(0.0, 0.0), (10.0, 0.0), (0.0, 10.0)]
+
+
+@pytest.mark.parametrize('length, tile_length, overlap, starts', [
+    (30, 50, 0, [0]),
+    (50, 50, 0, [0]),
+    (100, 50, 0, [0, 50]),
+    (120, 50, 0, [0, 50, 70]),
+    (120, 50, 10, [0, 40, 70]),
+    (51, 50, 49, [0, 1]),
+    (200, 50, 25, [0, 25, 50, 75, 100, 125, 150]),
+])
+def test_tile_starts(length, tile_length, overlap, starts):
+    assert tiling.tile_starts(length, tile_length, overlap) == starts
+
+@pytest.mark.parametrize('length', [1, 49, 50, 51, 99, 100, 101, 333])
+@pytest.mark.parametrize('tile_length, overlap', [(50, 0), (50, 10), (50, 49), (7, 3)])
+def test_tiles_cover_the_image_with_the_overlap(length, tile_length, overlap):
+    starts = tiling.tile_starts(length, tile_length, overlap)
+    ends = [min(start + tile_length, length) for start in starts]
+    assert starts[0] == 0 and ends[-1] == length
+    assert starts == sorted(set(starts))
+    for start, previous_end in zip(starts[1:], ends):
+        # neighbours share at least the overlap, so there is no gap
+        assert previous_end - start >= overlap
+    if length >= tile_length:
+        assert all(end - start == tile_length for start, end in zip(starts, ends))
+
+def test_tile_windows():
+    assert tiling.tile_windows(30, 120, (50, 50), 10) == [(0, 0, 30, 50), (0, 40, 30, 50), (0, 70, 30, 50)]
+
+
+def test_clip_triangle_across_tile_edge():
+    clipped = tiling.clip_polygon(TRIANGLE, 0, 0, 5, 10)
+    assert sorted(clipped) == [(0.0, 0.0), (0.0, 10.0), (5.0, 0.0), (5.0, 5.0)]
+    assert polygon_area(clipped) == pytest.approx(37.5)
+    right = tiling.clip_polygon(TRIANGLE, 5, 0, 10, 10)
+    assert sorted(right) == [(5.0, 0.0), (5.0, 5.0), (10.0, 0.0)]
+    assert polygon_area(clipped) + polygon_area(right) == pytest.approx(polygon_area(TRIANGLE))
+
+def test_clip_polygon_inside_and_outside():
+    assert tiling.clip_polygon(TRIANGLE, -1, -1, 11, 11) == TRIANGLE
+    assert tiling.clip_polygon(TRIANGLE, 20, 20, 30, 30) == []
+    assert tiling.clip_polygon([], 0, 0, 10, 10) == []
+
+def test_clip_region_in_tile_coordinates():
+    region = {'id': 'r', 'type': 'POLYGON', 'tags': ['cat'], 'points': [{'x': x, 'y': y} for x, y in TRIANGLE]}
+    # a tile at top 2, left 5, 10 high and 10 wide
+    clipped = tiling.clip_region(region, (2, 5, 10, 10))
+    assert sorted((point['x'], point['y']) for point in clipped['points']) == [(0.0, 0.0), (0.0, 3.0), (3.0, 0.0)]
+    assert clipped['boundingBox'] == {'left': 0.0, 'top': 0.0, 'width': 3.0, 'height': 3.0}
+    assert clipped['tags'] == ['cat'] and clipped['id'] == 'r'
+    # 4.5 of 50 is visible
+    assert tiling.clip_region(region, (2, 5, 10, 10), min_visible=0.1) is None
+    assert tiling.clip_region(region, (2, 5, 10, 10), min_visible=0.05) is not None
+    assert tiling.clip_region(region, (20, 20, 10, 10)) is None
+
+def test_plan_tiles_drops_empty_tiles():
+    record = {'asset': {'id': 'a', 'name': 'img%201.jpg', 'size': {'height': 20, 'width': 40}},
+              'regions': [{'type': 'POLYGON', 'tags': ['cat'], 'points': [{'x': x, 'y': y} for x, y in TRIANGLE]}]}
+    tiles = tiling.plan_tiles(record, (20, 20))
+    assert [window for window, _ in tiles] == [(0, 0, 20, 20), (0, 20, 20, 20)]
+    assert tiles[0][1]['asset']['name'] == 'img%201_0_0.jpg'
+    assert [len(tile['regions']) for _, tile in tiles] == [1, 0]
+    assert [window for window, _ in tiling.plan_tiles(record, (20, 20), drop_empty=True)] == [(0, 0, 20, 20)]
@@ -0,0 +1,107 @@
+import random
+import pytest
+from vott_tools import instrument, video
+
+cv2 = pytest.importorskip('cv2')
+np = pytest.importorskip('numpy')
+
+NUM_FRAMES = 8
+FPS = 10.0
+
+
+@pytest.fixture
+def clip(tmp_path):
+    # Frame i is flat grey at 25 * i, so a decoded frame tells its index
+    path = tmp_path / 'clip.avi'
+    writer = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*'MJPG'), FPS, (32, 24))
+    if not writer.isOpened():
+        pytest.skip('OpenCV cannot write MJPG video')
+    for idx in range(NUM_FRAMES):
+        writer.write(np.full((24, 32, 3), 25 * idx, np.uint8))
+    writer.release()
+    return path
+
+@pytest.fixture
+def counters():
+    instrument.drain()
+    instrument.enable()
+    yield lambda: instrument.drain()[1]
+    instrument.enable(False)
+    instrument.drain()
+
+
+def frame_number(encoded):
+    image = cv2.imdecode(np.frombuffer(encoded, np.uint8), cv2.IMREAD_GRAYSCALE)
+    return int(round(image.mean() / 25))
+
+def timestamp(idx):
+    return idx / FPS
+
+def frame_record(idx, name='clip.avi'):
+    return {'asset': {'id': '{}-{}'.format(name, idx), 'type': video.VIDEO_FRAME_ASSET, 'timestamp': timestamp(idx),
+                      'parent': {'id': name, 'name': name}, 'name': 'frame.jpg'},
+            'regions': []}
+
+
+def test_frame_index():
+    # 0.2 s at 30 fps is frame 6, not 5.999...
+    assert video.frame_index(0.2, 30) == 6
+    assert [video.frame_index(timestamp(idx), FPS) for idx in range(NUM_FRAMES)] == list(range(NUM_FRAMES))
+
+def test_reads_frames_in_order(clip, counters):
+    indexes = [1, 2, 4, 7]
+    frames = video.VideoFrames(clip, [timestamp(idx) for idx in indexes])
+    assert [frame_number(frames.read(timestamp(idx))) for idx in indexes] == indexes
+    assert counters().get('reopened', 0) == 0
+    assert frames.decoded == {} and frames.capture is None
+
+@pytest.mark.parametrize('seed', [0, 1, 2])
+def test_reads_announced_frames_shuffled(clip, counters, seed):
+    indexes = list(range(NUM_FRAMES))
+    random.Random(seed).shuffle(indexes)
+    frames = video.VideoFrames(clip, [timestamp(idx) for idx in indexes])
+    assert [frame_number(frames.read(timestamp(idx))) for idx in indexes] == indexes
+    # frames passed on the way were kept, the video is decoded once
+    assert counters().get('reopened', 0) == 0
+    assert frames.decoded == {}
+
+def test_reopens_for_frames_not_announced(clip, counters):
+    frames = video.VideoFrames(clip, [timestamp(5)])
+    assert frame_number(frames.read(timestamp(5))) == 5
+    assert frame_number(frames.read(timestamp(2))) == 2
+    assert counters()['reopened'] == 1
+    frames.close()
+
+def test_skipped_frames_are_not_kept(clip):
+    frames = video.VideoFrames(clip, [timestamp(idx) for idx in (2, 3, 6)])
+    frames.skip(timestamp(3))
+    assert frame_number(frames.read(timestamp(6))) == 6
+    assert list(frames.decoded) == [2]
+    assert frame_number(frames.read(timestamp(2))) == 2
+    assert frames.decoded == {}
+
+def test_repeated_timestamps(clip):
+    frames = video.VideoFrames(clip, [timestamp(4), timestamp(4)])
+    assert frame_number(frames.read(timestamp(4))) == 4
+    assert frame_number(frames.read(timestamp(4))) == 4
+    assert frames.decoded == {}
+
+def test_missing_frame(clip):
+    frames = video.VideoFrames(clip, [timestamp(NUM_FRAMES + 5)])
+    with pytest.raises(ValueError):
+        frames.read(timestamp(NUM_FRAMES + 5))
+    frames.close()
+
+
+def test_image_source(clip, tmp_path):
+    records = [frame_record(idx) for idx in (6, 1, 3)]
+    images = video.ImageSource(tmp_path, records)
+    ordered = video.order_records(records + [{'asset': {'id': 'v', 'type': video.VIDEO_ASSET}, 'regions': []}])
+    assert [record['asset']['timestamp'] for record in ordered] == [timestamp(idx) for idx in (1, 3, 6)]
+    assert images.path(records[0]) == clip
+    assert [frame_number(images.read(record)) for record in ordered] == [1, 3, 6]
+    images.close()
+
+def test_frame_asset_names():
+    asset = video.frame_asset(frame_record(3, 'my clip.mp4')['asset'])
+    assert asset['name'] == 'my%20clip_t000000.300.jpg'
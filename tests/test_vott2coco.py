@@ -0,0 +1,83 @@
+import copy
+import json
+from datetime import datetime
+import pytest
+from vott_tools import vott2coco
+from vott_tools.project_index import load_json, open_project
+
+
+NOW = datetime(2021, 3, 4, 5, 6, 7)
+CATEGORIES = [{'id': 1, 'name': 'cat', 'supercategory': 'cat'}, {'id': 2, 'name': '猫', 'supercategory': '猫'}]
+
+
+def image(name):
+    return {'license': 1, 'file_name': name, 'coco_url': None, 'height': 480, 'width': 640,
+            'date_captured': None, 'flicker_url': None, 'id': None}
+
+def annotation(category_id, polygon=True):
+    annotation = {'area': 12.5, 'iscrowd': 0, 'image_id': None, 'bbox': [1.0, 2.0, 3.5, 4.0],
+                  'category_id': category_id, 'id': None}
+    if polygon:
+        annotation['segmentation'] = [[1.0, 2.0, 4.5, 2.0, 4.5, 6.0]]
+    return annotation
+
+def expected_json(samples):
+    # The coco dict as create_coco built it before CocoWriter streamed it
+    images = []
+    annotations = []
+    for image_id, (image, image_annotations) in enumerate(copy.deepcopy(samples), start=1):
+        image['date_captured'] = NOW.strftime('%Y-%m-%d %H:%M:%S')
+        image['id'] = image_id
+        images.append(image)
+        for image_annotation in image_annotations:
+            image_annotation['image_id'] = image_id
+            image_annotation['id'] = len(annotations) + 1
+            annotations.append(image_annotation)
+    return json.dumps({'info': vott2coco.coco_info(NOW), 'licenses': vott2coco.COCO_LICENSES, 'images': images,
+                       'annotations': annotations, 'categories': CATEGORIES})
+
+
+@pytest.mark.parametrize('samples', [
+    [],
+    [(image('a.jpg'), [])],
+    [(image('a.jpg'), []), (image('b c.jpg'), [])],
+    [(image('a.jpg'), [annotation(1)])],
+    [(image('a.jpg'), [annotation(1), annotation(2, False)]), (image('画像.jpg'), []),
+     (image('b.jpg'), [annotation(2)])],
+], ids=['no images', 'no annotations', 'two images', 'one annotation', 'mixed'])
+def test_coco_writer_matches_json_dumps(tmp_path, samples):
+    path = tmp_path / 'coco.json'
+    with vott2coco.CocoWriter(path, CATEGORIES, NOW) as writer:
+        for image, annotations in copy.deepcopy(samples):
+            writer.write(image, annotations)
+    assert writer.num_images == len(samples)
+    assert path.read_text() == expected_json(samples)
+    assert list(tmp_path.iterdir()) == [path]
+
+
+def legacy_asset_to_coco(asset, cat2id):
+    # the conversion before the geometry module, region by region
+    annotations = []
+    for region in asset['regions']:
+        points = [(int(p['x'] + 0.5), int(p['y'] + 0.5)) for p in region['points']]
+        annotation = {'area': vott2coco.polygon_area(points), 'iscrowd': 0, 'image_id': None,
+                      'bbox': [int(region['boundingBox'][key] + 0.5) for key in ('left', 'top', 'width', 'height')],
+                      'category_id': cat2id[region['tags'][0]], 'id': None}
+        if region['type'] == 'POLYGON':
+            annotation['segmentation'] = [[coordinate for point in points for coordinate in point]]
+        annotations.append(annotation)
+    return vott2coco.coco_image(asset), annotations
+
+@pytest.mark.parametrize('batch_size', [1, 5, 256])
+def test_batched_conversion_matches_per_asset(project, tmp_path, batch_size):
+    vott = load_json(project)
+    cat2id = {cat['name']: cat['id'] for cat in vott2coco.tags2categories(vott)}
+    assets = list(vott['assets'].values())
+    # with an asset without regions in the middle
+    assets.insert(3, dict(assets[0], regions=[]))
+    expected = [legacy_asset_to_coco(asset, cat2id) for asset in assets]
+    assert [vott2coco.asset_to_coco(asset, cat2id) for asset in assets] == expected
+    assert [coco for batch in vott2coco.batches(assets, batch_size)
+            for coco in vott2coco.assets_to_coco(batch, cat2id)] == expected
+    indexed = list(open_project(project, tmp_path / 'index.npz').to_vott_json()['assets'].values())
+    assert vott2coco.assets_to_coco(indexed, cat2id) == expected[:3] + expected[4:]
@@ -0,0 +1,7 @@
+# Runs vott_tools.tiling from a checkout, as `python tiling.py ...`
+from vott_tools.cli_utils import parse_args
+from vott_tools.tiling import main
+
+
+if __name__ == '__main__':
+    main(parse_args('tile'))
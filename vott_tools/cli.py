@@ -0,0 +1,20 @@
+import argparse
+import importlib
+from . import cli_utils
+
+
+def main(argv=None):
+    # The tool module of the chosen command, and with it numpy, OpenCV or
+    # TensorFlow, is only imported after the arguments have been checked.
+    parser = argparse.ArgumentParser(prog='vott_tools', description="Tools to manipulate VoTT annotation files.")
+    subparsers = parser.add_subparsers(dest='command', metavar='command', required=True)
+    for command, (_, description, add_arguments) in cli_utils.COMMANDS.items():
+        add_arguments(subparsers.add_parser(command, help=description, description=description))
+
+    args = parser.parse_args(argv)
+    module = importlib.import_module('.' + cli_utils.COMMANDS[args.command][0], __package__)
+    module.main(args)
+
+
+if __name__ == '__main__':
+    main()
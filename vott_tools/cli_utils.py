@@ -0,0 +1,285 @@
+import argparse
+import pathlib
+import re
+import sys
+
+# Argument handling shared by the tools and the vott_tools command. This
+# module only imports the standard library, so --help and argument errors
+# never pay for numpy, OpenCV or TensorFlow.
+
+MASK_FORMATS = ('png', 'png_crop', 'rle')
+MASK_MODES = ('binary', 'class', 'instance')
+TFRECORD_BACKENDS = ('lite', 'tf')
+EXPORT_FORMATS = ('coco', 'tfrecords', 'labelmap', 'masks', 'cutout')
+TILE_FORMATS = ('coco', 'tfrecords')
+SPLIT_KEYS = ('name', 'id')
+
+RATIO_PATTERN = re.compile(r'(?P<train>\d+):(?P<val>\d+)(?::(?P<test>\d+))*')
+
+
+def parse_ratio(ratio_arg):
+    ratio_match = RATIO_PATTERN.match(ratio_arg)
+
+    if not ratio_match:
+        return None
+
+    n_total = int(ratio_match['train']) + int(ratio_match['val']) + \
+        int(ratio_match['test'] if ratio_match['test'] else 0)
+    if not n_total:
+        return None
+    ratio = {}
+    ratio['train'] = float(ratio_match['train']) / n_total
+    ratio['val'] = float(ratio_match['val']) / n_total
+    ratio['test'] = float(ratio_match['test'] if ratio_match['test'] else 0) / n_total
+    return ratio
+
+
+def ratio_type(value):
+    ratio = parse_ratio(value)
+    if not ratio:
+        raise argparse.ArgumentTypeError('ratio must follow pattern like 99:99 or 99:99:99')
+    return ratio
+
+def file_type(value):
+    path = pathlib.Path(value)
+    if not path.is_file():
+        raise argparse.ArgumentTypeError('{} is not found'.format(value))
+    return path
+
+def dir_type(value):
+    path = pathlib.Path(value)
+    if not path.is_dir():
+        raise argparse.ArgumentTypeError('{} is not a directory'.format(value))
+    return path
+
+def positive_int(value):
+    try:
+        number = int(value)
+    except ValueError:
+        number = 0
+    if number < 1:
+        raise argparse.ArgumentTypeError('{} is not a positive integer'.format(value))
+    return number
+
+def non_negative_int(value):
+    try:
+        number = int(value)
+    except ValueError:
+        number = -1
+    if number < 0:
+        raise argparse.ArgumentTypeError('{} is not a non-negative integer'.format(value))
+    return number
+
+def fraction_type(value):
+    try:
+        number = float(value)
+    except ValueError:
+        number = -1
+    if not 0 <= number <= 1:
+        raise argparse.ArgumentTypeError('{} is not a number between 0 and 1'.format(value))
+    return number
+
+
+def check_overwrite(output_paths, overwrite=False):
+    for output_path in output_paths:
+        if pathlib.Path(output_path).exists() and not overwrite:
+            sys.exit('Output file {} exists. Add --overwrite flag to overwrite.'.format(output_path))
+
+
+def add_project_arguments(parser):
+    parser.add_argument('-f', '--vott_file', type=file_type, help="*.vott file path", required=True)
+    parser.add_argument('-x', '--index', default=None, help="project index (.npz) to read from, built if missing or stale (the .vott file or the asset directory changed)")
+
+def add_profile_argument(parser):
+    parser.add_argument('--profile', default=None, metavar='PATH',
+                        help="write per-stage timings to PATH as json, or as csv when PATH ends in .csv")
+
+def add_split_arguments(parser):
+    parser.add_argument('--seed', type=int, default=0, help="seed of the hash based dataset split")
+    parser.add_argument('--stratify', help='balance the split within groups of assets sharing their most frequent tag',
+                        action='store_true')
+    parser.add_argument('--split_by', default='name', choices=SPLIT_KEYS,
+                        help="hash the asset file name (stable when the project moves) or the VoTT asset id")
+
+def add_io_arguments(parser):
+    parser.add_argument('--io_threads', type=non_negative_int, default=8,
+                        help="threads reading inputs ahead of and writing outputs behind the workers, 0 to read and write inline")
+    parser.add_argument('--prefetch', type=positive_int, default=16,
+                        help="maximum number of assets read ahead of the workers or waiting to be written")
+
+def add_validate_argument(parser):
+    parser.add_argument('--validate', help='check the images and regions from the image headers before converting',
+                        action='store_true')
+
+def add_size_argument(parser, name='--new_size', help="new size (height, width)", multiple=False):
+    # with multiple, the option can be repeated and gives a list of sizes
+    parser.add_argument('-n', name, type=positive_int, default=None, nargs=2, metavar=('height', 'width'), help=help,
+                        action='append' if multiple else 'store')
+
+
+def add_coco_arguments(parser):
+    add_project_arguments(parser)
+    parser.add_argument('-o', '--output_dir', type=dir_type, help="output directory", required=True)
+    parser.add_argument('-p', '--output_prefix', help="coco annotation files' prefix", required=True)
+    split = parser.add_mutually_exclusive_group()
+    split.add_argument('-r', '--ratio', type=ratio_type, default=None, help="dataset size ratio Ex. 80:10:10 default=None")
+    split.add_argument('-i', '--imagesets_dir', type=dir_type, default=None, help="imagesets dir")
+    add_split_arguments(parser)
+    parser.add_argument('-j', '--num_workers', type=positive_int, default=None, help="number of threads reading asset files")
+    parser.add_argument('--stream', help='read the project one asset at a time instead of loading it whole (ignored with --index)',
+                        action='store_true')
+    parser.add_argument('--incremental', help='reuse annotations of unchanged assets from the previous run (implies --overwrite)', action='store_true')
+    parser.add_argument('--overwrite', help='overwrite output files', action='store_true')
+    add_profile_argument(parser)
+
+def add_tfrecords_arguments(parser):
+    add_project_arguments(parser)
+    parser.add_argument('-i', '--image_dir', type=dir_type, help="the directory contains images", required=True)
+    parser.add_argument('-o', '--output_dir', type=dir_type, help="output directory", required=True)
+    parser.add_argument('-p', '--output_prefix', help="tfrecord files' prefix", required=True)
+    parser.add_argument('-r', '--ratio', type=ratio_type, default=None, help="dataset size ratio Ex. 80:10:10 default=None")
+    add_split_arguments(parser)
+    add_size_argument(parser, help="new size (height, width), repeat to write one set of tfrecords per size", multiple=True)
+    parser.add_argument('--reencode', help='re-encode images as jpeg even when they are not resized', action='store_true')
+    parser.add_argument('-m', '--mask_format', default='png', choices=MASK_FORMATS,
+                        help="instance mask encoding: full frame png, png cropped to the mask, or coco rle")
+    parser.add_argument('-b', '--backend', default='tf', choices=TFRECORD_BACKENDS,
+                        help="tf: TensorFlow image ops and writer, lite: OpenCV and a built-in tfrecord writer")
+    parser.add_argument('-j', '--num_workers', type=positive_int, default=1, help="number of worker processes building examples")
+    add_io_arguments(parser)
+    parser.add_argument('-s', '--num_shards', type=positive_int, default=1, help="number of tfrecord shards per dataset")
+    parser.add_argument('--incremental', help='reuse examples of unchanged assets from the previous run (implies --overwrite)', action='store_true')
+    parser.add_argument('--overwrite', help='overwrite output files', action='store_true')
+    add_validate_argument(parser)
+    add_profile_argument(parser)
+
+def add_masks_arguments(parser):
+    add_project_arguments(parser)
+    parser.add_argument('-o', '--output_dir', type=dir_type, help="output directory", required=True)
+    add_size_argument(parser, '--size', help="mask size (height, width)")
+    parser.add_argument('-m', '--mode', default='binary', choices=MASK_MODES,
+                        help="binary masks, or label maps holding class ids or instance indices")
+    parser.add_argument('-j', '--num_workers', type=positive_int, default=1, help="number of worker processes")
+    add_io_arguments(parser)
+    parser.add_argument('--incremental', help='skip assets whose masks are up to date', action='store_true')
+    parser.add_argument('--overwrite', help='overwrite output files', action='store_true')
+    add_profile_argument(parser)
+
+def add_cutout_arguments(parser):
+    add_project_arguments(parser)
+    parser.add_argument('-i', '--image_dir', type=dir_type, help="the directory contains images", required=True)
+    parser.add_argument('-o', '--output_dir', type=dir_type, help="output directory", required=True)
+    add_size_argument(parser)
+    parser.add_argument('-c', '--crops', help='write one image per region cropped to the region', action='store_true')
+    parser.add_argument('-j', '--num_workers', type=positive_int, default=1, help="number of worker processes")
+    add_io_arguments(parser)
+    parser.add_argument('--incremental', help='skip assets whose masked images are up to date', action='store_true')
+    parser.add_argument('--overwrite', help='overwrite output files', action='store_true')
+    add_validate_argument(parser)
+    add_profile_argument(parser)
+
+def add_labelmap_arguments(parser):
+    add_project_arguments(parser)
+    parser.add_argument('-l', '--label_map_file', help="label_map.pbtxt file path", required=True)
+    parser.add_argument('--overwrite', help='overwrite output files', action='store_true')
+
+def add_export_arguments(parser):
+    add_project_arguments(parser)
+    parser.add_argument('-t', '--formats', nargs='+', choices=EXPORT_FORMATS, required=True, help="outputs to write")
+    parser.add_argument('-i', '--image_dir', type=dir_type, default=None, help="the directory contains images (tfrecords, cutout)")
+    parser.add_argument('-o', '--output_dir', type=dir_type, help="output directory", required=True)
+    parser.add_argument('-p', '--output_prefix', help="prefix of the output files and directories", required=True)
+    parser.add_argument('-r', '--ratio', type=ratio_type, default=None, help="dataset size ratio Ex. 80:10:10 default=None")
+    add_split_arguments(parser)
+    add_size_argument(parser, help="new size (height, width) of tfrecords images, masks and cutouts")
+    parser.add_argument('--reencode', help='re-encode tfrecords images as jpeg even when they are not resized', action='store_true')
+    parser.add_argument('-m', '--mask_format', default='png', choices=MASK_FORMATS, help="tfrecords instance mask encoding")
+    parser.add_argument('--mask_mode', default='binary', choices=MASK_MODES, help="masks: binary masks or label maps")
+    parser.add_argument('-c', '--crops', help='cutout: one image per region cropped to the region', action='store_true')
+    parser.add_argument('-j', '--num_workers', type=positive_int, default=1, help="number of worker processes")
+    add_io_arguments(parser)
+    parser.add_argument('-s', '--num_shards', type=positive_int, default=1, help="number of tfrecord shards per dataset")
+    parser.add_argument('--overwrite', help='overwrite output files', action='store_true')
+    add_validate_argument(parser)
+    add_profile_argument(parser)
+
+def add_tile_arguments(parser):
+    add_project_arguments(parser)
+    parser.add_argument('-t', '--formats', nargs='+', choices=TILE_FORMATS, required=True, help="outputs to write")
+    parser.add_argument('-i', '--image_dir', type=dir_type, help="the directory contains images", required=True)
+    parser.add_argument('-o', '--output_dir', type=dir_type, help="output directory", required=True)
+    parser.add_argument('-p', '--output_prefix', help="prefix of the output files and of the tile image directory", required=True)
+    parser.add_argument('-r', '--ratio', type=ratio_type, default=None, help="dataset size ratio Ex. 80:10:10 default=None")
+    add_split_arguments(parser)
+    parser.add_argument('-z', '--tile_size', type=positive_int, nargs=2, metavar=('height', 'width'), required=True,
+                        help="tile size (height, width)")
+    parser.add_argument('--overlap', type=non_negative_int, default=0, help="pixels shared by neighbouring tiles")
+    parser.add_argument('--drop_empty', help='skip tiles without regions', action='store_true')
+    parser.add_argument('--min_visible', type=fraction_type, default=0.0,
+                        help="drop clipped regions keeping less than this fraction of their area")
+    parser.add_argument('-m', '--mask_format', default='png', choices=MASK_FORMATS, help="tfrecords instance mask encoding")
+    parser.add_argument('-b', '--backend', default='lite', choices=TFRECORD_BACKENDS,
+                        help="tf: TensorFlow image ops (partial JPEG decode) and writer, lite: OpenCV and a built-in tfrecord writer")
+    parser.add_argument('-j', '--num_workers', type=positive_int, default=1, help="number of worker processes")
+    add_io_arguments(parser)
+    parser.add_argument('-s', '--num_shards', type=positive_int, default=1, help="number of tfrecord shards per dataset")
+    parser.add_argument('--overwrite', help='overwrite output files', action='store_true')
+    add_validate_argument(parser)
+    add_profile_argument(parser)
+
+def add_probe_arguments(parser):
+    add_project_arguments(parser)
+    parser.add_argument('-i', '--image_dir', type=dir_type, help="the directory contains images", required=True)
+    parser.add_argument('-j', '--num_threads', type=positive_int, default=16, help="number of threads reading image headers")
+    parser.add_argument('--cache', default=None, metavar='PATH', help="header cache file, default <project>.probe.json")
+    parser.add_argument('--no_cache', help='read every header again and keep no cache', action='store_true')
+    parser.add_argument('--json', help='print the results as json', action='store_true')
+
+def add_serve_arguments(parser):
+    parser.add_argument('-f', '--vott_file', type=file_type, help="*.vott file path", required=True)
+    parser.add_argument('-i', '--image_dir', type=dir_type, default=None, help="the directory contains images (tfrecords)")
+    parser.add_argument('-o', '--output_dir', type=dir_type, default=None, help="output directory of the tfrecords")
+    parser.add_argument('-p', '--output_prefix', default='', help="tfrecord files' prefix")
+    add_size_argument(parser)
+    parser.add_argument('--reencode', help='re-encode images as jpeg even when they are not resized', action='store_true')
+    parser.add_argument('-m', '--mask_format', default='png', choices=MASK_FORMATS,
+                        help="instance mask encoding: full frame png, png cropped to the mask, or coco rle")
+    parser.add_argument('-b', '--backend', default='tf', choices=TFRECORD_BACKENDS,
+                        help="tf: TensorFlow image ops and writer, lite: OpenCV and a built-in tfrecord writer")
+    parser.add_argument('-j', '--num_workers', type=positive_int, default=1, help="number of worker processes building examples")
+    parser.add_argument('-s', '--num_shards', type=positive_int, default=1, help="number of tfrecord shards per dataset")
+    parser.add_argument('--host', default='127.0.0.1', help="address to listen on")
+    parser.add_argument('--port', type=non_negative_int, default=8765, help="port to listen on, 0 for any free port")
+    parser.add_argument('--socket', default=None, metavar='PATH', help="listen on a unix socket at PATH instead")
+    parser.add_argument('--poll', type=float, default=1.0, help="seconds between scans of the annotation directory")
+
+
+# command: (module, description, argument definitions)
+COMMANDS = {
+    'coco': ('vott2coco', "Create coco formatted annotation file from VoTT's *.vott, *-asset.json files.",
+             add_coco_arguments),
+    'tfrecords': ('vott2tfrecords', "Create tfrecord datasets from VoTT's *.vott, *-asset.json files.",
+                  add_tfrecords_arguments),
+    'masks': ('make_masks', "Create mask files from VoTT's *.vott, *-asset.json files.",
+              add_masks_arguments),
+    'cutout': ('cutout', "Create masked image files from VoTT's *.vott, *-asset.json files.",
+               add_cutout_arguments),
+    'labelmap': ('create_label_map', "Create a label_map.pbtxt file from VoTT's *.vott file.",
+                 add_labelmap_arguments),
+    'probe': ('probe', "Check the images of VoTT's *-asset.json files from their headers.",
+              add_probe_arguments),
+    'tile': ('tiling', "Cut the images of VoTT's *-asset.json files into tiles with clipped regions.",
+             add_tile_arguments),
+    'serve': ('serve', "Serve coco json and tfrecords of VoTT's *.vott, *-asset.json files, kept up to date in memory.",
+              add_serve_arguments),
+    'export': ('export', "Write several of the above outputs in one pass over VoTT's *.vott, *-asset.json files.",
+               add_export_arguments),
+}
+
+
+def parse_args(command, argv=None):
+    # The parser of a standalone tool script
+    _, description, add_arguments = COMMANDS[command]
+    parser = argparse.ArgumentParser(description=description)
+    add_arguments(parser)
+    return parser.parse_args(argv)
@@ -0,0 +1,44 @@
+from .cli_utils import check_overwrite, parse_args
+from .json_stream import read_vott_header
+
+
+# Escapes of protobuf's text format for string fields
+LABEL_MAP_ESCAPES = {code: '\\{:03o}'.format(code) for code in list(range(32)) + [127]}
+LABEL_MAP_ESCAPES.update({ord('\t'): '\\t', ord('\n'): '\\n', ord('\r'): '\\r', ord('"'): '\\"', ord("'"): "\\'",
+                          ord('\\'): '\\\\'})
+
+
+def get_tags(vott_file, index_file=None):
+    if index_file:
+        # the index needs numpy, kept out of the plain label map's start up
+        from .project_index import open_project
+        vott = {'tags': open_project(vott_file, index_file).tags}
+    else:
+        vott = read_vott_header(vott_file)[0]
+    
+    tags = [t['name'] for t in vott['tags']]
+    return tags
+
+
+def convert_classes(classes, start=1):
+    # A StringIntLabelMap in protobuf's text format, as object_detection
+    # writes it, without object_detection or protobuf
+    items = ['item {{\n  name: "{}"\n  id: {}\n}}\n'.format(name.translate(LABEL_MAP_ESCAPES), id)
+             for id, name in enumerate(classes, start=start)]
+    return ''.join(items)
+
+
+def main(args):
+    label_map_path = args.label_map_file
+
+    check_overwrite([label_map_path], args.overwrite)
+
+    tags = get_tags(args.vott_file, args.index)
+    txt = convert_classes(tags)
+    print(txt)
+    with open(label_map_path, 'w') as f:
+        f.write(txt)
+
+
+if __name__ == '__main__':
+    main(parse_args('labelmap'))
@@ -0,0 +1,192 @@
+import pathlib
+import urllib
+import multiprocessing
+import cv2
+import numpy as np
+from . import geometry, instrument, prefetch, probe, video
+from .cli_utils import parse_args
+from .manifest import Manifest, record_json
+from .project_index import has_video, open_project, read_asset
+
+
+REDUCED_READ_FLAGS = ((8, cv2.IMREAD_REDUCED_COLOR_8), (4, cv2.IMREAD_REDUCED_COLOR_4), (2, cv2.IMREAD_REDUCED_COLOR_2))
+
+
+def decode_image(encoded, height=None, width=None, new_height=None, new_width=None):
+    # Decodes at the smallest reduced scale (JPEG DCT scaling) that still
+    # covers the target size, or at full size without one.
+    flag = cv2.IMREAD_COLOR
+    if new_height:
+        for ratio, reduced_flag in REDUCED_READ_FLAGS:
+            if -(-height // ratio) >= new_height and -(-width // ratio) >= new_width:
+                flag = reduced_flag
+                break
+    with instrument.stage('decode'):
+        return cv2.imdecode(np.frombuffer(encoded, dtype=np.uint8), flag)
+
+def read_image(image_file, height=None, width=None, new_height=None, new_width=None):
+    return decode_image(prefetch.read_file(image_file), height, width, new_height, new_width)
+
+def encode_image(output_file, image):
+    with instrument.stage('encode'):
+        return cv2.imencode(pathlib.PurePath(output_file).suffix, image, [cv2.IMWRITE_JPEG_QUALITY, 75])[1]
+
+def scaled_points(region, scale_x, scale_y):
+    return np.array([[point['x'] * scale_x, point['y'] * scale_y] for point in region['points']]).astype(np.int32)
+
+def crop_filename(filename, idx):
+    path = pathlib.PurePath(filename)
+    return '{}_{}{}'.format(path.stem, idx, path.suffix)
+
+def output_filenames(example_dict, crops=False):
+    filename = urllib.parse.unquote(example_dict['asset']['name'])
+    if crops:
+        return [crop_filename(filename, idx) for idx in range(len(example_dict['regions']))]
+    return [filename]
+
+def render_masked_image(example_dict, encoded_image, new_size=None, crops=False):
+    # Returns (output filename, encoded image) pairs: the image with
+    # everything outside the polygons blacked out, or with crops=True one
+    # image per region cropped to the region's bounds, with polygon regions
+    # masked inside the crop.
+    height = example_dict['asset']['size']['height']
+    width = example_dict['asset']['size']['width']
+    if new_size:
+        new_height = new_size[0]
+        new_width = new_size[1]
+        decoded_jpeg = decode_image(encoded_image, height, width, new_height, new_width)
+        if decoded_jpeg.shape[:2] != (new_height, new_width):
+            with instrument.stage('resize'):
+                decoded_jpeg = cv2.resize(decoded_jpeg, (new_width, new_height), interpolation=cv2.INTER_NEAREST)
+    else:
+        decoded_jpeg = decode_image(encoded_image)
+    instrument.count('regions', len(example_dict['regions']))
+    return render_decoded_image(example_dict, decoded_jpeg, crops)
+
+def render_decoded_image(example_dict, image, crops=False, rasterized=None):
+    # render_masked_image for an image already decoded at its new size.
+    # rasterized is the result of geometry.rasterize_polygons for the
+    # asset's polygons at that size, otherwise they are rasterized here.
+    filename = urllib.parse.unquote(example_dict['asset']['name'])
+    new_height, new_width = image.shape[:2]
+    scale_x = new_width / example_dict['asset']['size']['width']
+    scale_y = new_height / example_dict['asset']['size']['height']
+
+    regions = example_dict['regions']
+    if rasterized is None:
+        rasterized = geometry.rasterize_polygons([region for region in regions if region['type'] == 'POLYGON'],
+                                                 example_dict['asset']['size']['height'],
+                                                 example_dict['asset']['size']['width'], new_height, new_width)
+    columns, start, stop, runs = rasterized
+    polygon_runs = iter(runs)
+
+    outputs = []
+    if crops:
+        for output_filename, region in zip(output_filenames(example_dict, crops), regions):
+            all_points = scaled_points(region, scale_x, scale_y)
+            xmin, ymin = np.clip(all_points.min(axis=0), 0, [new_width - 1, new_height - 1])
+            xmax, ymax = np.clip(all_points.max(axis=0), 0, [new_width - 1, new_height - 1])
+            crop = image[ymin:ymax + 1, xmin:xmax + 1]
+            if region['type'] == 'POLYGON':
+                with instrument.stage('rasterize'):
+                    mask = np.zeros(crop.shape[:2], dtype=np.uint8)
+                    run = next(polygon_runs)
+                    geometry.paint_runs(mask, columns[run] - xmin, start[run] - ymin, stop[run] - ymin)
+                    crop = cv2.bitwise_and(crop, crop, mask=mask)
+            outputs.append((output_filename, encode_image(output_filename, crop)))
+    else:
+        with instrument.stage('rasterize'):
+            mask = np.zeros(image.shape[:2], dtype=np.uint8)
+            geometry.paint_runs(mask, columns, start, stop)
+            result = cv2.bitwise_and(image, image, mask=mask)
+        outputs.append((filename, encode_image(filename, result)))
+    return outputs
+
+def create_masked_image(image_path, asset_json_file, output_path, new_size=None, crops=False):
+    example_dict = read_asset(asset_json_file)
+    encoded_image = video.ImageSource(image_path, [example_dict]).read(example_dict)
+    for output_filename, encoded in render_masked_image(example_dict, encoded_image, new_size, crops):
+        prefetch.write_file(output_path.joinpath(output_filename), encoded)
+    return example_dict['asset']['id']
+
+
+def render_masked_image_task(task):
+    return task[0]['asset']['id'], render_masked_image(*task)
+
+
+def main(args):
+    vott_path = args.vott_file
+    annotation_dir = vott_path.parent
+    image_dir = args.image_dir
+    output_dir = args.output_dir
+    new_size = args.new_size
+    num_workers = args.num_workers
+    if args.validate:
+        probe.preflight(vott_path, image_dir, args.index)
+
+    if args.index:
+        index = open_project(vott_path, args.index)
+        asset_files = index.records()
+        num_assets = len(index)
+    else:
+        index = None
+        asset_files = set(annotation_dir.glob('*-asset.json'))
+        num_assets = len(asset_files)
+    if has_video(vott_path, index):
+        # frames are grouped by video, so each video is decoded once
+        asset_files = video.order_records(prefetch.read_ahead(read_asset, asset_files, args.io_threads, args.prefetch))
+        num_assets = len(asset_files)
+        images = video.ImageSource(image_dir, asset_files)
+    else:
+        # index.records() is a generator, read once by pending_samples
+        images = video.ImageSource(image_dir)
+
+    manifest = Manifest(output_dir, '.cutout', {'new_size': new_size, 'crops': args.crops}) if args.incremental else None
+    keys = {}
+
+    def pending_samples():
+        for sample in prefetch.read_ahead(read_asset, asset_files, args.io_threads, args.prefetch):
+            if manifest:
+                asset_id = sample['asset']['id']
+                key = manifest.key(record_json(sample), manifest.file_digest(images.path(sample)))
+                if manifest.lookup(asset_id, key) and all(output_dir.joinpath(output_filename).exists()
+                                                          for output_filename in output_filenames(sample, args.crops)):
+                    progress.total -= 1
+                    images.skip(sample)
+                    continue
+                keys[asset_id] = key
+            yield sample
+
+    def load_image(sample):
+        return sample, images.read(sample), new_size, args.crops
+
+    # images are read by the io threads after the manifest check, outputs
+    # are written by them
+    tasks = prefetch.read_ahead(load_image, pending_samples(), args.io_threads, args.prefetch)
+
+    instrument.enable(bool(args.profile))
+    progress = instrument.Progress(num_assets)
+    pool = multiprocessing.Pool(num_workers) if num_workers > 1 else None
+    try:
+        with prefetch.WriteBehind(args.io_threads, args.prefetch) as writer, progress:
+            for asset_id, outputs in instrument.imap(render_masked_image_task, tasks, pool, 2 * num_workers):
+                for output_filename, encoded in outputs:
+                    writer.submit(prefetch.write_file, output_dir.joinpath(output_filename), encoded)
+                progress.update()
+                if manifest:
+                    manifest.store(asset_id, keys.pop(asset_id))
+    finally:
+        images.close()
+        if pool:
+            pool.close()
+            pool.join()
+
+    if manifest:
+        manifest.save()
+
+    if args.profile:
+        instrument.write_report(args.profile, instrument.report(progress.elapsed, progress.done))
+
+
+if __name__ == '__main__':
+    main(parse_args('cutout'))
@@ -0,0 +1,99 @@
+import collections
+import hashlib
+import urllib.parse
+from . import video
+
+# Deterministic train/val/test assignment. An asset's split comes from a
+# hash of its file name (or id) and a seed, so it does not depend on the
+# other assets, their order or the Python version, and it is decided while
+# streaming over the assets.
+
+SPLITS = ('train', 'val', 'test')
+
+
+def split_fraction(key, seed=0):
+    # Uniform in [0, 1) for a key and seed
+    digest = hashlib.blake2b('{}:{}'.format(seed, key).encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big') / 2 ** 64
+
+def hash_split(key, ratio, seed=0):
+    splits = [split for split in SPLITS if ratio.get(split)]
+    fraction = split_fraction(key, seed)
+    bound = 0.0
+    for split in splits[:-1]:
+        bound += ratio[split]
+        if fraction < bound:
+            return split
+    return splits[-1]
+
+
+def split_key(asset, split_by='name'):
+    # asset is the 'asset' part of an *-asset.json file or a .vott asset.
+    # Video frames are split by their video, so near identical frames never
+    # end up in different splits.
+    if video.is_video_frame(asset):
+        asset = asset['parent']
+    if split_by == 'id':
+        return asset['id']
+    return urllib.parse.unquote(asset['name'])
+
+def primary_tag(regions):
+    # The most frequent tag of an asset's regions, None without regions
+    tags = collections.Counter(tag for region in regions for tag in region['tags'])
+    if not tags:
+        return None
+    return min(tags, key=lambda tag: (-tags[tag], tag))
+
+
+class Splitter:
+    # Assigns assets to splits by hash_split. With stratify, assets are
+    # grouped by primary_tag and an asset is moved to the split furthest
+    # below its share when the hashed split would put its group more than
+    # slack assets over that split's share. Only those moves depend on the
+    # order of the assets, see split_all.
+
+    def __init__(self, ratio, seed=0, stratify=False, split_by='name', slack=3):
+        self.ratio = ratio
+        self.seed = seed
+        self.stratify = stratify
+        self.split_by = split_by
+        self.slack = slack
+        self.splits = [split for split in SPLITS if ratio.get(split)]
+        self.counts = collections.defaultdict(collections.Counter)
+
+    def assign(self, key, stratum=None):
+        split = hash_split(key, self.ratio, self.seed)
+        if self.stratify:
+            counts = self.counts[stratum]
+            total = sum(counts.values()) + 1
+            if counts[split] + 1 > self.ratio[split] * total + self.slack:
+                split = max(self.splits, key=lambda s: self.ratio[s] * total - counts[s])
+            counts[split] += 1
+        return split
+
+    def split(self, asset, regions=None):
+        return self.assign(split_key(asset, self.split_by), primary_tag(regions or []) if self.stratify else None)
+
+    def record_split(self, record):
+        # record is the contents of an *-asset.json file
+        return self.split(record['asset'], record['regions'])
+
+
+def split_all(splitter, entries):
+    # Yields (handle, split) for (handle, asset, regions) entries. Without
+    # stratify every asset is split as it streams by. With stratify the
+    # assets are split in split key order, so all tools agree whatever order
+    # they read the project in; only (key, tag, handle) of each asset is
+    # held for that.
+    if not splitter.stratify:
+        for handle, asset, regions in entries:
+            yield handle, splitter.split(asset, regions)
+        return
+    handles = []
+    keyed = []
+    for handle, asset, regions in entries:
+        keyed.append((split_key(asset, splitter.split_by), len(handles), primary_tag(regions or [])))
+        handles.append(handle)
+    keyed.sort()
+    for key, idx, stratum in keyed:
+        yield handles[idx], splitter.assign(key, stratum)
@@ -0,0 +1,215 @@
+import sys
+import time
+import urllib
+import multiprocessing
+from datetime import datetime
+from . import instrument, prefetch, probe, tfrecord_io, video
+from .cli_utils import check_overwrite, parse_args
+from .create_label_map import convert_classes
+from .dataset_split import Splitter, split_all
+from .project_index import has_video, open_project, read_asset, read_vott_header
+from .vott2coco import CocoWriter, asset_to_coco, print_dataset_size, tags2categories
+from .geometry import rasterize_polygons
+from .vott2tfrecords import build_example, decode_image, get_backend, get_image_format, shard_paths
+
+# One pass export to several formats. The project is read and split once,
+# and every asset is visited once: its image is read and decoded once and
+# its polygons are rasterized once, at the output size, for the tfrecords
+# masks, the mask files and the cutouts alike. Images are handled with the
+# lite tfrecords backend, so TensorFlow is never imported. make_masks and
+# cutout (and with them OpenCV) are only imported when their outputs are
+# requested.
+
+IMAGE_FORMATS = ('tfrecords', 'cutout')
+# the formats drawing the polygon regions
+RASTER_FORMATS = ('tfrecords', 'masks', 'cutout')
+
+
+def export_asset(task):
+    # Returns (subset, asset, {format: output}) for one asset
+    record, subset, encoded_image_data, options = task
+    formats = options['formats']
+    asset = record['asset']
+    filename = urllib.parse.unquote(asset['name'])
+    height = asset['size']['height']
+    width = asset['size']['width']
+    new_height, new_width = options['new_size'] or (height, width)
+    regions = record['regions']
+    instrument.count('regions', len(regions))
+    outputs = {}
+
+    if 'coco' in formats:
+        with instrument.stage('convert'):
+            outputs['coco'] = asset_to_coco(dict(asset, regions=regions), options['class_id'])
+
+    polygons = [region for region in regions if region['type'] == 'POLYGON']
+    rasterized = None
+    if formats.intersection(RASTER_FORMATS):
+        rasterized = rasterize_polygons(polygons, height, width, new_height, new_width)
+
+    image_format = get_image_format(encoded_image_data) if encoded_image_data is not None else None
+    passthrough = options['passthrough'] and image_format and (new_height, new_width) == (height, width)
+    image = None
+    if 'cutout' in formats or ('tfrecords' in formats and not passthrough):
+        image_io = get_backend('lite')
+        image = decode_image(encoded_image_data, image_format, height, width, new_height, new_width, 'lite')
+        if image.shape[0] != new_height or image.shape[1] != new_width:
+            with instrument.stage('resize'):
+                image = image_io.resize(image, new_height, new_width)
+
+    if 'tfrecords' in formats:
+        if passthrough:
+            encoded_image = encoded_image_data
+        else:
+            with instrument.stage('encode'):
+                encoded_image = image_io.encode_jpeg(image)
+            image_format = b'jpeg'
+        example = build_example(record, options['class_id'], new_height, new_width, encoded_image, image_format,
+                                options['mask_format'], 'lite', rasterized)
+        with instrument.stage('serialize'):
+            outputs['tfrecords'] = example.SerializeToString(deterministic=True)
+
+    if 'masks' in formats:
+        from . import make_masks
+        outputs['masks'] = [(make_masks.mask_filename(filename),
+                             make_masks.render_rasterized_mask(polygons, rasterized, new_height, new_width,
+                                                               options['mask_mode'], options['class_id']))]
+
+    if 'cutout' in formats:
+        from . import cutout
+        outputs['cutout'] = cutout.render_decoded_image(record, image, options['crops'], rasterized)
+
+    return subset, asset, outputs
+
+
+def main(args):
+    vott_path = args.vott_file
+    annotation_dir = vott_path.parent
+    image_dir = args.image_dir
+    output_dir = args.output_dir
+    output_prefix = args.output_prefix
+    formats = set(args.formats)
+    num_workers = args.num_workers
+    instrument.enable(bool(args.profile))
+    start = time.perf_counter()
+
+    if formats.intersection(IMAGE_FORMATS) and not image_dir:
+        sys.exit('--image_dir is needed for {}'.format(', '.join(sorted(formats.intersection(IMAGE_FORMATS)))))
+    if args.validate:
+        if not image_dir:
+            sys.exit('--validate needs --image_dir')
+        probe.preflight(vott_path, image_dir, args.index)
+
+    if args.index:
+        index = open_project(vott_path, args.index)
+        tags = index.tags
+        asset_files = index.file_records()
+    else:
+        index = None
+        tags = read_vott_header(vott_path)[0]['tags']
+        asset_files = sorted(annotation_dir.glob('*-asset.json'))
+    if has_video(vott_path, index):
+        # frames are grouped by video, so each video is decoded once
+        asset_files = video.order_records(prefetch.read_ahead(read_asset, asset_files, args.io_threads, args.prefetch))
+    images = video.ImageSource(image_dir, asset_files) if image_dir else None
+    categories = tags2categories({'tags': tags})
+    class_id = {cat['name']: cat['id'] for cat in categories}
+
+    splitter = Splitter(args.ratio, args.seed, args.stratify, args.split_by) if args.ratio else None
+    subsets = splitter.splits if splitter else ['']
+
+    coco_paths = {subset: output_dir.joinpath(output_prefix + subset + '.json') for subset in subsets}
+    tfrecord_paths = {subset: shard_paths(output_dir, output_prefix + subset, args.num_shards) for subset in subsets}
+    label_map_path = output_dir.joinpath(output_prefix + 'label_map.pbtxt')
+    file_dirs = {'masks': output_dir.joinpath(output_prefix + 'masks'),
+                 'cutout': output_dir.joinpath(output_prefix + 'cutout')}
+    output_paths = []
+    if 'coco' in formats:
+        output_paths.extend(coco_paths.values())
+    if 'tfrecords' in formats:
+        output_paths.extend(path for paths in tfrecord_paths.values() for path in paths)
+    if 'labelmap' in formats:
+        output_paths.append(label_map_path)
+    check_overwrite(output_paths, args.overwrite)
+
+    if 'labelmap' in formats:
+        with open(label_map_path, 'w') as f:
+            f.write(convert_classes([category['name'] for category in categories]))
+    for output_format, file_dir in file_dirs.items():
+        if output_format in formats:
+            file_dir.mkdir(exist_ok=True)
+
+    options = {'formats': formats, 'class_id': class_id, 'new_size': args.new_size, 'passthrough': not args.reencode,
+               'mask_format': args.mask_format, 'mask_mode': args.mask_mode, 'crops': args.crops}
+
+    # asset files and images are read by the io threads, splits are decided
+    # as the records stream by (stratified splits after all were read)
+    records = prefetch.read_ahead(read_asset, asset_files, args.io_threads, args.prefetch)
+    if splitter:
+        entries = split_all(splitter, ((record, record['asset'], record['regions']) for record in records))
+    else:
+        entries = ((record, '') for record in records)
+
+    def load_task(entry):
+        record, subset = entry
+        encoded_image_data = None
+        if formats.intersection(IMAGE_FORMATS):
+            encoded_image_data = images.read(record)
+        return record, subset, encoded_image_data, options
+
+    tasks = prefetch.read_ahead(load_task, entries, args.io_threads, args.prefetch)
+
+    def write_record(writer, serialized, asset):
+        with instrument.stage('write'):
+            writer.write(serialized, asset['id'], urllib.parse.unquote(asset['name']))
+
+    now = datetime.now()
+    sizes = {subset: 0 for subset in subsets}
+    coco_writers = {}
+    tfrecord_writers = {}
+    progress = instrument.Progress(len(asset_files))
+    pool = multiprocessing.Pool(num_workers) if num_workers > 1 else None
+    try:
+        if 'coco' in formats:
+            coco_writers = {subset: CocoWriter(path, categories, now) for subset, path in coco_paths.items()}
+        if 'tfrecords' in formats:
+            image_io = get_backend('lite')
+            tfrecord_writers = {subset: [tfrecord_io.IndexedWriter(image_io.writer(path), path) for path in paths]
+                                for subset, paths in tfrecord_paths.items()}
+        # files are written by the io threads, records by one more thread,
+        # which keeps their order
+        with prefetch.WriteBehind(args.io_threads, args.prefetch) as file_writer, \
+                prefetch.WriteBehind(min(args.io_threads, 1), args.prefetch) as record_writer, progress:
+            for subset, asset, outputs in instrument.imap(export_asset, tasks, pool, max(args.prefetch, 2 * num_workers)):
+                if 'coco' in outputs:
+                    with instrument.stage('write'):
+                        coco_writers[subset].write(*outputs['coco'])
+                if 'tfrecords' in outputs:
+                    shards = tfrecord_writers[subset]
+                    record_writer.submit(write_record, shards[sizes[subset] % len(shards)], outputs['tfrecords'], asset)
+                for output_format in ('masks', 'cutout'):
+                    for output_filename, encoded in outputs.get(output_format, []):
+                        file_writer.submit(prefetch.write_file, file_dirs[output_format].joinpath(output_filename), encoded)
+                sizes[subset] += 1
+                progress.update()
+    finally:
+        if images:
+            images.close()
+        if pool:
+            pool.close()
+            pool.join()
+        for writer in coco_writers.values():
+            writer.close()
+        for shards in tfrecord_writers.values():
+            for writer in shards:
+                writer.close()
+
+    print_dataset_size(sizes)
+    elapsed = time.perf_counter() - start
+    print('Exported {} assets to {} in {:.2f} s'.format(progress.done, ', '.join(sorted(formats)), elapsed))
+    if args.profile:
+        instrument.write_report(args.profile, instrument.report(elapsed, progress.done))
+
+
+if __name__ == '__main__':
+    main(parse_args('export'))
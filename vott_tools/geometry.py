@@ -0,0 +1,230 @@
+import numpy as np
+from . import instrument
+
+
+def polygon_runs(xs, ys, offsets, height, width):
+    # Scanline fill of every polygon at once. Pixels are sampled at their
+    # integer coordinates and filled with the even-odd rule; pixels on an
+    # edge are filled too, the pixels skimage.draw.polygon fills for simple
+    # polygons. A polygon without area (all its vertices on one line) has no
+    # pixels, skimage versions disagree on its outline. The scan runs down
+    # the columns, so the runs come out in COCO's column-major order.
+    # Returns (instance, column, start_row, stop_row) arrays sorted in that
+    # order, runs of an instance not overlapping.
+    xs = np.asarray(xs, dtype=np.float64)
+    ys = np.asarray(ys, dtype=np.float64)
+    offsets = np.asarray(offsets, dtype=np.int64)
+    counts = np.diff(offsets)
+    instances = np.repeat(np.arange(len(counts)), counts)
+    # index of the next vertex, wrapping around inside each polygon
+    following = np.arange(len(xs)) + 1
+    following[offsets[1:][counts > 0] - 1] = offsets[:-1][counts > 0]
+
+    x0, y0 = xs, ys
+    x1, y1 = xs[following], ys[following]
+    crossing = x0 != x1
+    interior = fill_runs(x0[crossing], y0[crossing], x1[crossing], y1[crossing], instances[crossing], height, width)
+    boundary = edge_runs(x0, y0, x1, y1, instances, height, width)
+    instances, columns, start, stop = merge_runs(*[np.concatenate(parts) for parts in zip(interior, boundary)],
+                                                 height, width)
+    kept = polygon_areas(xs, ys, offsets)[instances] > 0
+    return instances[kept], columns[kept], start[kept], stop[kept]
+
+def fill_runs(x0, y0, x1, y1, instances, height, width):
+    # Runs between pairs of crossings of the column centres with the
+    # non-vertical edges. Columns are half-open along each edge, so a vertex
+    # is crossed once where the outline passes through it; rows are closed.
+    first = np.clip(np.ceil(np.minimum(x0, x1)), 0, width).astype(np.int64)
+    last = np.clip(np.ceil(np.maximum(x0, x1)), 0, width).astype(np.int64)
+    num_columns = last - first
+    edges = np.repeat(np.arange(len(first)), num_columns)
+    columns = first[edges] + np.arange(len(edges)) - np.repeat(np.cumsum(num_columns) - num_columns, num_columns)
+    t = (columns - x0[edges]) / (x1[edges] - x0[edges])
+    rows = y0[edges] + t * (y1[edges] - y0[edges])
+    instances = instances[edges]
+
+    # one sort on a key of instance, column and row; rows off the image are
+    # clipped just outside it, where their order no longer matters
+    key = (instances * width + columns) * (height + 3.0) + np.clip(rows, -1, height + 1) + 1
+    order = np.argsort(key)
+    instances, columns, rows = instances[order], columns[order], rows[order]
+    start = np.clip(np.ceil(rows[0::2]), 0, height).astype(np.int64)
+    stop = np.clip(np.floor(rows[1::2]) + 1, 0, height).astype(np.int64)
+    return instances[0::2], columns[0::2], start, stop
+
+def edge_runs(x0, y0, x1, y1, instances, height, width):
+    # Pixels on the outline that fill_runs misses: the integer rows of
+    # vertical edges and the vertices at integer coordinates (a crossing
+    # always starts or ends a run, so the other edge pixels are filled)
+    vertical = (x0 == x1) & (x0 == np.round(x0))
+    corner = (x0 == np.round(x0)) & (y0 == np.round(y0))
+    instances = np.concatenate([instances[vertical], instances[corner]])
+    columns = np.concatenate([x0[vertical], x0[corner]]).astype(np.int64)
+    start = np.concatenate([np.ceil(np.minimum(y0, y1)[vertical]), y0[corner]]).astype(np.int64)
+    stop = np.concatenate([np.floor(np.maximum(y0, y1)[vertical]) + 1, y0[corner] + 1]).astype(np.int64)
+    inside = (columns >= 0) & (columns < width)
+    return instances[inside], columns[inside], np.clip(start[inside], 0, height), np.clip(stop[inside], 0, height)
+
+def merge_runs(instances, columns, start, stop, height, width):
+    # Sorts runs by instance, column and start row and joins the runs of a
+    # column that overlap or touch
+    filled = stop > start
+    instances, columns, start, stop = instances[filled], columns[filled], start[filled], stop[filled]
+    # rows offset by column, so one sort and one running maximum cover every
+    # column; the runs of fill_runs come sorted, which a stable sort exploits
+    base = (instances * width + columns) * (height + 1)
+    order = np.argsort(base + start, kind='stable')
+    instances, columns, start, stop, base = instances[order], columns[order], start[order], stop[order], base[order]
+    reach = np.maximum.accumulate(base + stop)
+    new = np.ones(len(start), dtype=bool)
+    new[1:] = base[1:] + start[1:] > reach[:-1]
+    firsts = np.flatnonzero(new)
+    lasts = np.append(firsts[1:], len(start))[:len(firsts)] - 1
+    return instances[firsts], columns[firsts], start[firsts], reach[lasts] - base[firsts]
+
+
+def runs_to_mask(columns, start, stop, height, width, dtype=np.uint8, value=255):
+    edges = np.zeros((height + 1, width), dtype=np.int32)
+    np.add.at(edges, (start, columns), 1)
+    np.add.at(edges, (stop, columns), -1)
+    mask = np.zeros((height, width), dtype=dtype)
+    mask[np.cumsum(edges[:-1], axis=0) > 0] = value
+    return mask
+
+
+def paint_runs(mask, columns, start, stop, value=255):
+    # Sets the pixels of the runs to value, over what mask already holds
+    lengths = stop - start
+    firsts = np.cumsum(lengths) - lengths
+    width = mask.shape[1]
+    pixels = np.repeat((start - firsts) * width + columns, lengths) + np.arange(lengths.sum()) * width
+    if mask.flags.c_contiguous:
+        mask.reshape(-1)[pixels] = value
+    else:
+        np.put(mask, pixels, value)
+    return mask
+
+
+def runs_to_rle(columns, start, stop, height, width):
+    begin = columns * height + start
+    end = columns * height + stop
+    # runs touching across a column boundary are one run in COCO RLE
+    joined = begin[1:] == end[:-1]
+    begin = np.concatenate([begin[:1], begin[1:][~joined]])
+    end = np.concatenate([end[:-1][~joined], end[-1:]])
+    boundaries = np.empty(len(begin) * 2 + 2, dtype=np.int64)
+    boundaries[0] = 0
+    boundaries[1:-1:2] = begin
+    boundaries[2:-1:2] = end
+    boundaries[-1] = height * width
+    counts = np.diff(boundaries)
+    if len(counts) > 1 and counts[-1] == 0:
+        counts = counts[:-1]
+    return counts
+
+
+def rle_to_string(counts):
+    # Same LEB128-like compression as pycocotools' rleToString.
+    chars = []
+    for idx, count in enumerate(int(c) for c in counts):
+        if idx > 2:
+            count -= int(counts[idx - 2])
+        more = True
+        while more:
+            c = count & 0x1f
+            count >>= 5
+            more = count != -1 if c & 0x10 else count != 0
+            if more:
+                c |= 0x20
+            chars.append(chr(c + 48))
+    return ''.join(chars)
+
+
+def split_runs(instances, num_instances):
+    bounds = np.searchsorted(instances, np.arange(num_instances + 1))
+    return [slice(bounds[idx], bounds[idx + 1]) for idx in range(num_instances)]
+
+
+def region_arrays(regions):
+    # Flattens VoTT regions into one coordinate array per axis, the polygon
+    # offsets into them and an (n, 4) array of left, top, width, height boxes.
+    # Regions read from a project index hand over their columns as they are.
+    if hasattr(regions, 'arrays'):
+        return regions.arrays()
+    counts = [len(region['points']) for region in regions]
+    num_points = sum(counts)
+    xs = np.fromiter((point['x'] for region in regions for point in region['points']), np.float64, num_points)
+    ys = np.fromiter((point['y'] for region in regions for point in region['points']), np.float64, num_points)
+    offsets = np.zeros(len(regions) + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    boxes = np.array([[region['boundingBox']['left'], region['boundingBox']['top'],
+                       region['boundingBox']['width'], region['boundingBox']['height']]
+                      for region in regions], dtype=np.float64).reshape(-1, 4)
+    return xs, ys, offsets, boxes
+
+
+def batch_region_arrays(region_lists):
+    # Same as region_arrays for the regions of many assets at once, plus the
+    # offsets of each asset's regions.
+    region_offsets = np.zeros(len(region_lists) + 1, dtype=np.int64)
+    np.cumsum([len(asset_regions) for asset_regions in region_lists], out=region_offsets[1:])
+    if region_lists and all(hasattr(asset_regions, 'arrays') for asset_regions in region_lists):
+        # columns of a project index, joined
+        xs, ys, asset_offsets, boxes = zip(*[asset_regions.arrays() for asset_regions in region_lists])
+        offsets = np.zeros(region_offsets[-1] + 1, dtype=np.int64)
+        np.cumsum(np.concatenate([np.diff(point_offsets) for point_offsets in asset_offsets]), out=offsets[1:])
+        return np.concatenate(xs), np.concatenate(ys), offsets, np.concatenate(boxes), region_offsets
+    regions = [region for asset_regions in region_lists for region in asset_regions]
+    return region_arrays(regions) + (region_offsets,)
+
+
+def rasterize_polygons(polygons, height, width, new_height, new_width):
+    # Scanline runs of the polygons scaled to the new size: (columns, start,
+    # stop) arrays and the slice of them holding each polygon's runs
+    xs, ys, offsets, _ = region_arrays(polygons)
+    all_points_x = (xs * new_width / width).astype(np.int64)
+    all_points_y = (ys * new_height / height).astype(np.int64)
+    with instrument.stage('rasterize'):
+        instances, columns, start, stop = polygon_runs(all_points_x, all_points_y, offsets, new_height, new_width)
+        runs = split_runs(instances, len(polygons))
+    return columns, start, stop, runs
+
+
+def round_half_up(values):
+    # int(value + 0.5), which truncates toward zero
+    return np.trunc(np.asarray(values, dtype=np.float64) + 0.5).astype(np.int64)
+
+
+def polygon_areas(xs, ys, offsets):
+    offsets = np.asarray(offsets, dtype=np.int64)
+    counts = np.diff(offsets)
+    instances = np.repeat(np.arange(len(counts)), counts)
+    previous = np.arange(len(xs)) - 1
+    previous[offsets[:-1][counts > 0]] = offsets[1:][counts > 0] - 1
+    xs = np.asarray(xs)
+    ys = np.asarray(ys)
+    cross = xs * ys[previous] - ys * xs[previous]
+    return np.abs(np.bincount(instances, weights=cross, minlength=len(counts))) / 2.0
+
+
+def coco_bboxes(boxes):
+    return round_half_up(boxes)
+
+
+def normalized_boxes(boxes, image_width, image_height):
+    # xmin, xmax, ymin, ymax as written to tfrecords
+    left, top, width, height = boxes.T
+    xmins = left / image_width
+    xmaxs = (left + width - 1) / image_width
+    ymins = top / image_height
+    ymaxs = (top + height - 1) / image_height
+    return xmins, xmaxs, ymins, ymaxs
+
+
+def flat_segmentations(xs, ys, offsets):
+    points = np.empty(len(xs) * 2, dtype=np.asarray(xs).dtype)
+    points[0::2] = xs
+    points[1::2] = ys
+    points = points.tolist()
+    bounds = (np.asarray(offsets) * 2).tolist()
+    return [points[bounds[n]:bounds[n + 1]] for n in range(len(bounds) - 1)]
@@ -0,0 +1,192 @@
+import collections
+import csv
+import json
+import math
+import sys
+import time
+
+# Stage timers and counters for the converters. Timing is off until
+# enable() is called, and a disabled stage() costs one attribute check.
+# Worker processes send what they recorded back with each result, see
+# imap().
+
+STAGES = ('load_json', 'read', 'decode', 'resize', 'convert', 'rasterize', 'encode', 'serialize', 'write')
+
+_enabled = False
+_timings = collections.defaultdict(list)
+_counters = collections.Counter()
+
+
+def enable(enabled=True):
+    global _enabled
+    _enabled = enabled
+
+def is_enabled():
+    return _enabled
+
+
+class stage:
+    # with stage('decode'): ... adds the time spent in the block to 'decode'
+    __slots__ = ('name', 'start')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        if _enabled:
+            self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        if _enabled:
+            _timings[self.name].append(time.perf_counter() - self.start)
+
+
+def count(name, n=1):
+    if _enabled:
+        _counters[name] += n
+
+
+def drain():
+    # Returns and clears what was recorded so far
+    snapshot = ({name: values[:] for name, values in _timings.items()}, dict(_counters))
+    _timings.clear()
+    _counters.clear()
+    return snapshot
+
+def merge(snapshot):
+    timings, counters = snapshot
+    for name, values in timings.items():
+        _timings[name].extend(values)
+    _counters.update(counters)
+
+
+class ProfiledTask:
+    # Pool task wrapper returning (result, recorded timings)
+    def __init__(self, func, enabled):
+        self.func = func
+        self.enabled = enabled
+
+    def __call__(self, task):
+        enable(self.enabled)
+        result = self.func(task)
+        return result, drain() if self.enabled else None
+
+def imap(func, iterable, pool=None, depth=16):
+    # Ordered map of func on a multiprocessing pool, or map without a pool,
+    # with the timings of the workers merged into this process. Unlike
+    # pool.imap, at most depth tasks are handed to the pool ahead of the
+    # consumer, so the input is not read faster than it is processed.
+    if pool is None:
+        yield from map(func, iterable)
+        return
+    task = ProfiledTask(func, _enabled)
+    pending = collections.deque()
+
+    def result():
+        value, snapshot = pending.popleft().get()
+        if snapshot:
+            merge(snapshot)
+        return value
+
+    for item in iterable:
+        pending.append(pool.apply_async(task, (item,)))
+        if len(pending) >= depth:
+            yield result()
+    while pending:
+        yield result()
+
+
+def percentile(sorted_values, q):
+    # Nearest rank percentile of an ascending list
+    if not sorted_values:
+        return 0.0
+    rank = max(math.ceil(q / 100 * len(sorted_values)), 1)
+    return sorted_values[rank - 1]
+
+def report(wall_seconds, items=None, unit='assets'):
+    stages = {}
+    names = [name for name in STAGES if name in _timings] + sorted(set(_timings) - set(STAGES))
+    for name in names:
+        values = sorted(_timings[name])
+        total = sum(values)
+        stages[name] = {'count': len(values), 'total': total, 'mean': total / len(values),
+                        'p50': percentile(values, 50), 'p90': percentile(values, 90),
+                        'p99': percentile(values, 99), 'max': values[-1]}
+    result = {'wall_seconds': wall_seconds, 'stages': stages, 'counters': dict(_counters)}
+    if items is not None:
+        result[unit] = items
+        result[unit + '_per_second'] = items / wall_seconds if wall_seconds else 0.0
+    return result
+
+REPORT_COLUMNS = ('stage', 'count', 'total', 'mean', 'p50', 'p90', 'p99', 'max')
+
+def write_report(path, result):
+    # csv when path ends in .csv, json otherwise
+    if str(path).endswith('.csv'):
+        with open(path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(REPORT_COLUMNS)
+            for name, values in result['stages'].items():
+                writer.writerow([name] + [values[column] for column in REPORT_COLUMNS[1:]])
+    else:
+        with open(path, 'w') as f:
+            json.dump(result, f, indent=2)
+
+
+def format_seconds(seconds):
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return '{}:{:02d}:{:02d}'.format(seconds // 3600, seconds // 60 % 60, seconds % 60)
+    return '{}:{:02d}'.format(seconds // 60, seconds % 60)
+
+
+class Progress:
+    # A single progress line with the rate and ETA, redrawn at most every
+    # interval seconds. Nothing is drawn unless stream is a terminal.
+
+    def __init__(self, total=None, unit='assets', stream=None, interval=0.2):
+        self.total = total
+        self.unit = unit
+        self.stream = stream or sys.stderr
+        self.interval = interval
+        self.live = self.stream.isatty()
+        self.done = 0
+        self.start = time.perf_counter()
+        self.last_draw = 0.0
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.start
+
+    def update(self, n=1):
+        self.done += n
+        now = time.perf_counter()
+        if self.live and now - self.last_draw >= self.interval:
+            self.last_draw = now
+            self.draw()
+
+    def line(self):
+        elapsed = self.elapsed
+        rate = self.done / elapsed if elapsed else 0.0
+        if self.total:
+            eta = (self.total - self.done) / rate if rate else 0.0
+            return '{}/{} {} {:.1f} {}/s ETA {}'.format(self.done, self.total, self.unit, rate, self.unit,
+                                                        format_seconds(eta))
+        return '{} {} {:.1f} {}/s'.format(self.done, self.unit, rate, self.unit)
+
+    def draw(self):
+        self.stream.write('\r\033[K' + self.line())
+        self.stream.flush()
+
+    def close(self):
+        if self.live:
+            self.draw()
+            self.stream.write('\n')
+            self.stream.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
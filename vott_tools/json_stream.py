@@ -0,0 +1,110 @@
+import json
+
+# Incremental reading of a top-level JSON object. Member values are decoded
+# one at a time with json's C scanner, and the members of selected nested
+# objects (the assets of a .vott file) are decoded one entry at a time, so
+# memory is bounded by the largest single value, not by the file.
+
+CHUNK_SIZE = 1 << 16
+WHITESPACE = ' \t\n\r'
+NUMBER_CHARS = '0123456789+-.eE'
+
+
+class Scanner:
+    def __init__(self, f, chunk_size=CHUNK_SIZE):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder()
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+
+    def fill(self, size=None):
+        # Reads more input, dropping what was consumed. False at end of file.
+        if self.eof:
+            return False
+        chunk = self.f.read(size or self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self):
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self.fill():
+                return ''
+
+    def expect(self, chars):
+        char = self.peek()
+        if not char or char not in chars:
+            raise ValueError('expected {!r} at {!r}'.format(chars, self.buf[self.pos:self.pos + 20]))
+        self.pos += 1
+        return char
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                # incomplete value, read at least as much again as is buffered
+                if not self.fill(max(self.chunk_size, len(self.buf))):
+                    raise
+                continue
+            if (end == len(self.buf) or self.buf[end] in NUMBER_CHARS) and self.fill():
+                # a number cut by the end of the chunk, as in '12' of '12.5'
+                continue
+            self.pos = end
+            return value
+
+    def members(self):
+        # Yields the keys of the object starting here; the caller consumes
+        # each member's value before asking for the next key.
+        self.expect('{')
+        if self.peek() == '}':
+            self.pos += 1
+            return
+        while True:
+            key = self.value()
+            self.expect(':')
+            yield key
+            if self.expect(',}') == '}':
+                return
+
+
+def iter_items(f, stream_keys=(), chunk_size=CHUNK_SIZE):
+    # Yields (path, value) for the members of the top-level object in f.
+    # path is (key,) for ordinary members and (key, member_key) for each
+    # member of an object under one of stream_keys.
+    scanner = Scanner(f, chunk_size)
+    for key in scanner.members():
+        if key in stream_keys and scanner.peek() == '{':
+            for member_key in scanner.members():
+                yield (key, member_key), scanner.value()
+        else:
+            yield (key,), scanner.value()
+
+
+def iter_vott(vott_path):
+    # (path, value) of the .vott's top-level members, with each asset
+    # yielded on its own as (('assets', asset_id), asset)
+    with open(vott_path, 'r') as f:
+        yield from iter_items(f, ('assets',))
+
+def read_vott_header(vott_path):
+    # The .vott without its assets, and the number of assets
+    header = {}
+    num_assets = 0
+    for path, value in iter_vott(vott_path):
+        if len(path) == 1:
+            header[path[0]] = value
+        else:
+            num_assets += 1
+    header.pop('assets', None)
+    return header, num_assets
@@ -0,0 +1,137 @@
+import pathlib
+import urllib
+import multiprocessing
+import cv2
+import numpy as np
+from . import geometry, instrument, prefetch, video
+from .cli_utils import parse_args
+from .manifest import Manifest, record_json
+from .project_index import open_project, read_asset, read_vott_header
+
+
+
+def mask_filename(filename):
+    return str(pathlib.PurePath(filename).with_suffix('.png'))
+
+def mask_labels(polygons, mode='binary', class_id=None):
+    if mode == 'class':
+        labels = [class_id[polygon['tags'][0]] for polygon in polygons]
+    elif mode == 'instance':
+        labels = list(range(1, len(polygons) + 1))
+    else:
+        labels = [255] * len(polygons)
+    dtype = np.uint16 if labels and max(labels) > 255 else np.uint8
+    return labels, dtype
+
+def render_mask(example_dict, new_size=None, mode='binary', class_id=None):
+    # Returns the PNG encoded mask of an asset. binary: 255 inside every
+    # polygon, class: the class id of the polygon's tag, instance: the
+    # polygon's 1-based index. Later polygons are drawn over earlier ones.
+    # Label maps switch to 16 bit when the labels do not fit in 8 bits.
+    height = example_dict['asset']['size']['height']
+    width = example_dict['asset']['size']['width']
+    if new_size:
+        new_height = new_size[0]
+        new_width = new_size[1]
+    else:
+        new_height = height
+        new_width = width
+
+    regions = [region for region in example_dict['regions'] if region['type'] == 'POLYGON']
+    instrument.count('regions', len(regions))
+
+    rasterized = geometry.rasterize_polygons(regions, height, width, new_height, new_width)
+    return render_rasterized_mask(regions, rasterized, new_height, new_width, mode, class_id)
+
+def render_rasterized_mask(polygons, rasterized, new_height, new_width, mode='binary', class_id=None):
+    # Same as render_mask for polygons already rasterized at the mask size
+    # by geometry.rasterize_polygons
+    columns, start, stop, runs = rasterized
+    labels, dtype = mask_labels(polygons, mode, class_id)
+    mask = np.zeros((new_height, new_width), dtype=dtype)
+    with instrument.stage('rasterize'):
+        if mode == 'binary':
+            geometry.paint_runs(mask, columns, start, stop)
+        else:
+            for run, label in zip(runs, labels):
+                geometry.paint_runs(mask, columns[run], start[run], stop[run], label)
+    with instrument.stage('encode'):
+        return cv2.imencode('.png', mask)[1]
+
+def create_mask(asset_json_file, output_path, new_size=None, mode='binary', class_id=None):
+    example_dict = read_asset(asset_json_file)
+    filename = urllib.parse.unquote(example_dict['asset']['name'])
+    prefetch.write_file(output_path.joinpath(mask_filename(filename)), render_mask(example_dict, new_size, mode, class_id))
+    return example_dict['asset']['id']
+
+
+def render_mask_task(task):
+    example_dict = task[0]
+    filename = mask_filename(urllib.parse.unquote(example_dict['asset']['name']))
+    return example_dict['asset']['id'], filename, render_mask(*task)
+
+
+def main(args):
+    vott_path = args.vott_file
+    annotation_dir = vott_path.parent
+    output_dir = args.output_dir
+    size = args.size
+    num_workers = args.num_workers
+
+    if args.index:
+        index = open_project(vott_path, args.index)
+        tags = index.tags
+        asset_files = index.records()
+        num_assets = len(index)
+    else:
+        tags = read_vott_header(vott_path)[0]['tags']
+        asset_files = set(annotation_dir.glob('*-asset.json'))
+        num_assets = len(asset_files)
+    class_id = {tag['name']: idx for idx, tag in enumerate(tags, start=1)}
+
+    manifest = Manifest(output_dir, '.masks', {'size': size, 'mode': args.mode, 'tags': tags}) if args.incremental else None
+    keys = {}
+
+    def pending_tasks():
+        # asset files are read by the io threads, masks are written by them
+        for sample in prefetch.read_ahead(read_asset, asset_files, args.io_threads, args.prefetch):
+            if video.is_video(sample['asset']):
+                # only the tagged frames of a video get masks
+                progress.total -= 1
+                continue
+            if manifest:
+                asset_id = sample['asset']['id']
+                key = manifest.key(record_json(sample))
+                filename = mask_filename(urllib.parse.unquote(sample['asset']['name']))
+                if manifest.lookup(asset_id, key) and output_dir.joinpath(filename).exists():
+                    progress.total -= 1
+                    continue
+                keys[asset_id] = key
+            yield sample, size, args.mode, class_id
+
+    instrument.enable(bool(args.profile))
+    progress = instrument.Progress(num_assets, unit='masks')
+    pool = multiprocessing.Pool(num_workers) if num_workers > 1 else None
+    try:
+        with prefetch.WriteBehind(args.io_threads, args.prefetch) as writer, progress:
+            for asset_id, filename, encoded in instrument.imap(render_mask_task, pending_tasks(), pool, 2 * num_workers):
+                writer.submit(prefetch.write_file, output_dir.joinpath(filename), encoded)
+                progress.update()
+                if manifest:
+                    manifest.store(asset_id, keys.pop(asset_id))
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+
+    if manifest:
+        manifest.save()
+
+    elapsed = progress.elapsed
+    print('Wrote {} masks in {:.2f} s ({:.1f} masks/s)'.format(progress.done, elapsed, progress.done / elapsed if elapsed else 0.0))
+    if args.profile:
+        instrument.write_report(args.profile, instrument.report(elapsed, progress.done, unit='masks'))
+
+
+if __name__ == '__main__':
+    main(parse_args('masks'))
@@ -0,0 +1,126 @@
+import os
+import pathlib
+import hashlib
+import json
+from . import video
+
+
+def digest(*parts):
+    h = hashlib.sha1()
+    for part in parts:
+        if isinstance(part, str):
+            part = part.encode('utf-8')
+        h.update(hashlib.sha1(part).digest())
+    return h.hexdigest()
+
+
+def file_digest(path, chunk_size=1 << 20):
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def record_json(record):
+    # The parts of an *-asset.json record that conversions depend on, as
+    # canonical json for keys. A record rebuilt from a project index gives
+    # the same string as the file it was built from: fields the index does
+    # not keep (e.g. state, path) are left out and coordinates are floats.
+    asset = record['asset']
+    normalized = {'id': asset['id'], 'name': asset['name'], 'format': asset.get('format', ''),
+                  'type': asset.get('type', 1),
+                  'size': {'width': int(asset['size']['width']), 'height': int(asset['size']['height'])}}
+    if video.is_video_frame(asset):
+        normalized['parent'] = {'id': asset['parent'].get('id', ''), 'name': asset['parent']['name']}
+        normalized['timestamp'] = float(asset['timestamp'])
+    regions = [{'id': region['id'], 'type': region['type'], 'tags': region['tags'],
+                'boundingBox': {key: float(value) for key, value in region['boundingBox'].items()},
+                'points': [[float(point['x']), float(point['y'])] for point in region['points']]}
+               for region in record.get('regions') or []]
+    return json.dumps({'asset': normalized, 'regions': regions}, sort_keys=True)
+
+
+class Manifest:
+    # Maps each asset to a key derived from its asset json, its source image
+    # and the conversion parameters, and keeps a cache of the per-asset
+    # results next to the outputs. Keys include the parameters, so changing
+    # them invalidates every entry. Entries for assets that were not looked
+    # up during a run are dropped on save().
+
+    def __init__(self, output_dir, name, params):
+        output_dir = pathlib.Path(output_dir)
+        self.path = output_dir/'{}.manifest.json'.format(name)
+        self.cache_dir = output_dir/'{}.cache'.format(name)
+        self.params = digest(json.dumps(params, sort_keys=True, default=str))
+        self.assets = {}
+        self.files = {}
+        if self.path.is_file():
+            with open(self.path, 'r') as f:
+                manifest = json.load(f)
+            self.assets = manifest['assets']
+            self.files = manifest['files']
+        self.seen = set()
+        self.seen_files = set()
+
+    def file_digest(self, path):
+        # Content hashes of source files are reused while their size and
+        # mtime are unchanged, so unchanged images are never read.
+        stat = os.stat(path)
+        self.seen_files.add(str(path))
+        entry = self.files.get(str(path))
+        if not entry or entry['size'] != stat.st_size or entry['mtime_ns'] != stat.st_mtime_ns:
+            entry = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha1': file_digest(path)}
+            self.files[str(path)] = entry
+        return entry['sha1']
+
+    def key(self, *parts):
+        return digest(self.params, *parts)
+
+    def cache_path(self, asset_id):
+        return self.cache_dir/'{}.bin'.format(digest(asset_id))
+
+    def lookup(self, asset_id, key):
+        self.seen.add(asset_id)
+        entry = self.assets.get(asset_id)
+        return entry is not None and entry['key'] == key
+
+    def load(self, asset_id, key):
+        if not self.lookup(asset_id, key):
+            return None
+        try:
+            with open(self.cache_path(asset_id), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def store(self, asset_id, key, data=None):
+        self.seen.add(asset_id)
+        if data is not None:
+            self.cache_dir.mkdir(exist_ok=True)
+            cache_path = self.cache_path(asset_id)
+            tmp_path = cache_path.with_suffix('.tmp')
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, cache_path)
+        self.assets[asset_id] = {'key': key}
+
+    def start_run(self):
+        # Forgets which assets were looked up, so a long-running process can
+        # save() after every run and drop the entries of deleted assets
+        self.seen = set()
+        self.seen_files = set()
+
+    def save(self):
+        for asset_id in set(self.assets) - self.seen:
+            del self.assets[asset_id]
+            try:
+                os.remove(self.cache_path(asset_id))
+            except FileNotFoundError:
+                pass
+        self.files = {path: entry for path, entry in self.files.items() if path in self.seen_files}
+        manifest = {'params': self.params, 'assets': self.assets, 'files': self.files}
+        tmp_path = self.path.with_suffix('.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,87 @@
+import collections
+import concurrent.futures
+import threading
+from . import instrument
+
+# Bounded producer/consumer stages for the image tools. Input files are
+# read by a thread pool ahead of the CPU work and outputs are written by
+# another one behind it, so waiting on slow (network) storage overlaps
+# with decoding and encoding. Every stage holds a fixed number of items at
+# most; a slow consumer blocks its producer instead of growing a buffer.
+
+NUM_THREADS = 8
+DEPTH = 16
+
+
+def read_file(path):
+    with instrument.stage('read'), open(path, 'rb') as f:
+        return f.read()
+
+def write_file(path, data):
+    with instrument.stage('write'), open(path, 'wb') as f:
+        f.write(data)
+
+
+def read_ahead(func, iterable, num_threads=NUM_THREADS, depth=DEPTH):
+    # Yields func(item) for every item, in order. func runs on num_threads
+    # threads at most depth items ahead of the consumer, or inline without
+    # threads.
+    if not num_threads:
+        yield from map(func, iterable)
+        return
+    executor = concurrent.futures.ThreadPoolExecutor(num_threads)
+    pending = collections.deque()
+    try:
+        for item in iterable:
+            pending.append(executor.submit(func, item))
+            if len(pending) >= depth:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        for future in pending:
+            future.cancel()
+        executor.shutdown()
+
+
+class WriteBehind:
+    # Runs func(*args) of each submit() on num_threads threads, blocking
+    # while depth calls are pending. A failed call is raised by the next
+    # submit() or by close(). Without threads the calls run inline; with one
+    # thread they run in submission order.
+
+    def __init__(self, num_threads=NUM_THREADS, depth=DEPTH):
+        self.executor = concurrent.futures.ThreadPoolExecutor(num_threads) if num_threads else None
+        self.slots = threading.Semaphore(depth)
+        self.errors = []
+
+    def submit(self, func, *args):
+        if self.executor is None:
+            func(*args)
+            return
+        self.check()
+        self.slots.acquire()
+        self.executor.submit(func, *args).add_done_callback(self.done)
+
+    def done(self, future):
+        if future.exception() is not None:
+            self.errors.append(future.exception())
+        self.slots.release()
+
+    def check(self):
+        if self.errors:
+            raise self.errors[0]
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+        self.check()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc_info):
+        if exc_type is None:
+            self.close()
+        elif self.executor is not None:
+            self.executor.shutdown()
@@ -0,0 +1,230 @@
+import json
+import os
+import struct
+import sys
+import time
+import urllib
+from . import prefetch, video
+from .cli_utils import parse_args
+from .project_index import open_project, read_asset
+
+# Pre-flight check of a project's images from their headers alone (JPEG
+# SOF, PNG IHDR, GIF and BMP headers), so missing, truncated or resized
+# images are found in seconds instead of deep into a conversion. Headers
+# are read by a thread pool and cached by file size and mtime.
+
+ERRORS = ('missing', 'unreadable', 'size')
+WARNINGS = ('format', 'region')
+
+# SOF markers; C4 (DHT), C8 (JPG) and CC (DAC) share the range
+JPEG_SOF_MARKERS = set(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+JPEG_STANDALONE_MARKERS = set(range(0xD0, 0xD9)) | {0x01}
+FORMAT_ALIASES = {'jpg': 'jpeg', 'jpe': 'jpeg', 'jfif': 'jpeg'}
+
+
+class UnknownFormatError(ValueError):
+    pass
+
+
+def read_exactly(f, size):
+    data = f.read(size)
+    if len(data) != size:
+        raise ValueError('truncated header')
+    return data
+
+def jpeg_size(f):
+    # Walks the marker segments up to the first SOF, skipping the others
+    # (EXIF, ICC profiles, tables) without reading them.
+    while True:
+        if read_exactly(f, 1) != b'\xff':
+            raise ValueError('bad JPEG marker')
+        marker = read_exactly(f, 1)[0]
+        while marker == 0xFF:
+            marker = read_exactly(f, 1)[0]
+        if marker in JPEG_STANDALONE_MARKERS:
+            continue
+        if marker in (0xD9, 0xDA):
+            raise ValueError('no JPEG frame header')
+        length, = struct.unpack('>H', read_exactly(f, 2))
+        if marker in JPEG_SOF_MARKERS:
+            _, height, width = struct.unpack('>BHH', read_exactly(f, 5))
+            return height, width
+        f.seek(length - 2, os.SEEK_CUR)
+
+def image_header(path):
+    # (format, height, width) of an image file. Raises ValueError for
+    # broken headers and UnknownFormatError for other formats.
+    with open(path, 'rb') as f:
+        signature = f.read(8)
+        if signature[:3] == b'\xff\xd8\xff':
+            f.seek(2)
+            return ('jpeg',) + jpeg_size(f)
+        if signature == b'\x89PNG\r\n\x1a\n':
+            _, chunk_type, width, height = struct.unpack('>I4sII', read_exactly(f, 16))
+            if chunk_type != b'IHDR':
+                raise ValueError('no PNG IHDR chunk')
+            return 'png', height, width
+        if signature[:6] in (b'GIF87a', b'GIF89a'):
+            width, height = struct.unpack('<HH', signature[6:8] + read_exactly(f, 2))
+            return 'gif', height, width
+        if signature[:2] == b'BM':
+            f.seek(18)
+            width, height = struct.unpack('<ii', read_exactly(f, 8))
+            return 'bmp', abs(height), width
+    raise UnknownFormatError('unknown image format')
+
+
+class ProbeCache:
+    # Image headers by path, reused while a file's size and mtime are
+    # unchanged. Entries of files not probed in a run are dropped on save().
+
+    def __init__(self, path=None):
+        self.path = path
+        self.entries = {}
+        if path and os.path.isfile(path):
+            try:
+                with open(path, 'r') as f:
+                    self.entries = json.load(f)
+            except ValueError:
+                self.entries = {}
+        self.seen = set()
+        self.hits = 0
+
+    def header(self, path):
+        # (format, height, width); OSError for missing files and ValueError
+        # for broken headers are not cached
+        stat = os.stat(path)
+        key = str(path)
+        self.seen.add(key)
+        entry = self.entries.get(key)
+        if entry and entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns:
+            self.hits += 1
+            return entry['format'], entry['height'], entry['width']
+        image_format, height, width = image_header(path)
+        self.entries[key] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns,
+                             'format': image_format, 'height': height, 'width': width}
+        return image_format, height, width
+
+    def save(self):
+        if not self.path:
+            return
+        entries = {key: entry for key, entry in self.entries.items() if key in self.seen}
+        tmp_path = '{}.tmp'.format(self.path)
+        with open(tmp_path, 'w') as f:
+            json.dump(entries, f)
+        os.replace(tmp_path, self.path)
+
+
+def check_record(record, image_dir, cache):
+    # Returns (filename, [(kind, message)]) for one *-asset.json record
+    asset = record['asset']
+    filename = urllib.parse.unquote(asset['name'])
+    recorded = (asset['size']['height'], asset['size']['width'])
+    problems = []
+    if video.is_video(asset):
+        return filename, []
+    if video.is_video_frame(asset):
+        # only the video is checked, its frames are not probed
+        if not image_dir.joinpath(video.video_filename(asset)).is_file():
+            return filename, [('missing', 'video {} not found'.format(video.video_filename(asset)))]
+        image_format = None
+        height, width = recorded
+    else:
+        try:
+            image_format, height, width = cache.header(image_dir.joinpath(filename))
+        except FileNotFoundError:
+            return filename, [('missing', 'image not found')]
+        except UnknownFormatError:
+            # TIFF, WebP and others decoded by OpenCV and TensorFlow
+            problems.append(('format', 'unknown image format, size not checked'))
+            image_format = None
+            height, width = recorded
+        except (OSError, ValueError) as e:
+            return filename, [('unreadable', str(e))]
+
+    if (height, width) != recorded:
+        message = 'image is {}x{}, recorded as {}x{}'.format(height, width, *recorded)
+        if (width, height) == recorded:
+            message += ' (rotated by EXIF orientation?)'
+        problems.append(('size', message))
+    recorded_format = str(asset.get('format', '')).lower()
+    if image_format and recorded_format and FORMAT_ALIASES.get(recorded_format, recorded_format) != image_format:
+        problems.append(('format', 'image is {}, recorded as {}'.format(image_format, recorded_format)))
+    for idx, region in enumerate(record['regions']):
+        outside = [point for point in region['points']
+                   if not (0 <= point['x'] <= width and 0 <= point['y'] <= height)]
+        if outside:
+            problems.append(('region', 'region {} ({}) has {} of {} points outside the image'.format(
+                idx, region.get('id', ''), len(outside), len(region['points']))))
+    return filename, problems
+
+
+def probe_records(records, image_dir, cache=None, num_threads=16):
+    # Yields (filename, problems) for every record, checked on num_threads
+    # threads
+    cache = cache or ProbeCache()
+
+    def check(record):
+        return check_record(read_asset(record), image_dir, cache)
+
+    return prefetch.read_ahead(check, records, num_threads, 4 * num_threads)
+
+
+def project_records(vott_path, index_file=None):
+    if index_file:
+        return open_project(vott_path, index_file).records()
+    return sorted(vott_path.parent.glob('*-asset.json'))
+
+def cache_path(vott_path):
+    return str(vott_path.with_suffix('.probe.json'))
+
+
+def count_problems(results):
+    errors = sum(1 for _, problems in results for kind, _ in problems if kind in ERRORS)
+    warnings = sum(1 for _, problems in results for kind, _ in problems if kind in WARNINGS)
+    return errors, warnings
+
+def print_problems(results, stream=None):
+    stream = stream or sys.stdout
+    for filename, problems in results:
+        for kind, message in problems:
+            stream.write('{}: {}: {}\n'.format(filename, kind, message))
+
+
+def preflight(vott_path, image_dir, index_file=None, num_threads=16):
+    # Probes the project before a conversion and exits listing the
+    # problems when any is an error
+    cache = ProbeCache(cache_path(vott_path))
+    results = [result for result in probe_records(project_records(vott_path, index_file), image_dir, cache, num_threads)
+               if result[1]]
+    cache.save()
+    errors, _ = count_problems(results)
+    if errors:
+        print_problems(results, sys.stderr)
+        sys.exit('{} image errors found, see above'.format(errors))
+
+
+def main(args):
+    start = time.perf_counter()
+    cache = ProbeCache(None if args.no_cache else (args.cache or cache_path(args.vott_file)))
+    results = list(probe_records(project_records(args.vott_file, args.index), args.image_dir, cache, args.num_threads))
+    cache.save()
+    elapsed = time.perf_counter() - start
+    failed = [result for result in results if result[1]]
+    errors, warnings = count_problems(failed)
+
+    if args.json:
+        print(json.dumps({'images': len(results), 'cached': cache.hits, 'seconds': elapsed, 'errors': errors,
+                          'warnings': warnings,
+                          'problems': [{'file': filename, 'kind': kind, 'message': message}
+                                       for filename, problems in failed for kind, message in problems]}))
+    else:
+        print_problems(failed)
+        print('Probed {} images ({} cached) in {:.2f} s: {} errors, {} warnings'.format(
+            len(results), cache.hits, elapsed, errors, warnings))
+    if errors:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main(parse_args('probe'))
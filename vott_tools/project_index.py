@@ -0,0 +1,414 @@
+import os
+import pathlib
+import json
+import collections.abc
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from . import instrument
+from .json_stream import iter_vott, read_vott_header
+from . import prefetch, video
+
+try:
+    import orjson as fast_json
+except ImportError:
+    try:
+        import ujson as fast_json
+    except ImportError:
+        fast_json = json
+
+
+class AssetLoadError(Exception):
+    def __init__(self, errors):
+        self.errors = errors
+        lines = ['{}: {}'.format(path, reason) for path, reason in errors]
+        super().__init__('{} asset files could not be loaded\n'.format(len(errors)) + '\n'.join(lines))
+
+
+def read_asset_json(asset_path):
+    # video frame assets are renamed, see video.frame_asset
+    with instrument.stage('load_json'), open(asset_path, 'rb') as f:
+        record = fast_json.loads(f.read())
+    if isinstance(record, dict) and isinstance(record.get('asset'), dict):
+        video.frame_asset(record['asset'])
+    return record
+
+def read_asset(sample):
+    # Tools accept either an *-asset.json path or an already loaded record.
+    if isinstance(sample, dict):
+        return sample
+    return read_asset_json(sample)
+
+def asset_file(annotation_dir, asset_id):
+    return pathlib.Path(annotation_dir)/"{}-asset.json".format(asset_id)
+
+def load_assets(annotation_dir, asset_ids, num_workers=None):
+    asset_paths = [asset_file(annotation_dir, asset_id) for asset_id in asset_ids]
+    assets = {}
+    errors = []
+    with ThreadPoolExecutor(max_workers=num_workers) as executor:
+        futures = [executor.submit(read_asset_json, asset_path) for asset_path in asset_paths]
+        for asset_id, asset_path, future in zip(asset_ids, asset_paths, futures):
+            try:
+                asset = future.result()
+                assets[asset_id] = asset['regions']
+            except FileNotFoundError:
+                errors.append((asset_path, 'missing'))
+            except (OSError, ValueError, KeyError, TypeError) as e:
+                errors.append((asset_path, 'corrupt ({})'.format(e)))
+    if errors:
+        raise AssetLoadError(errors)
+    return assets
+
+def load_json(path, num_workers=None):
+    with open(path, 'r') as f:
+        vott_json = json.load(f)
+    for asset in vott_json['assets'].values():
+        video.frame_asset(asset)
+
+    if vott_json['sourceConnection']:
+        vott_path = pathlib.Path(path)
+        annotation_dir = vott_path.parent
+        asset_ids = list(vott_json['assets'].keys())
+        regions = load_assets(annotation_dir, asset_ids, num_workers)
+        for asset_id in asset_ids:
+            vott_json['assets'][asset_id]['regions'] = regions[asset_id]
+            vott_json['assets'][asset_id]['version'] = vott_json['version']
+
+    return vott_json
+
+
+def stream_json(path, num_workers=None):
+    # Like load_json, but the assets are read from disk and merged with
+    # their regions one at a time whenever they are iterated.
+    header, num_assets = read_vott_header(path)
+    vott_json = dict(header)
+    vott_json['assets'] = StreamedAssets(path, header, num_assets, num_workers)
+    return vott_json
+
+
+class StreamedAssets(collections.abc.Mapping):
+    # The assets of a .vott file as a mapping that re-reads the file on
+    # every iteration. Asset files are read by num_workers threads at most
+    # 2 * num_workers assets ahead of the consumer. Keyed lookups scan the
+    # file too, iterate items() instead.
+
+    def __init__(self, vott_path, header, num_assets, num_workers=None):
+        self.vott_path = pathlib.Path(vott_path)
+        self.merge_regions = bool(header.get('sourceConnection'))
+        self.version = header.get('version')
+        self.num_assets = num_assets
+        self.num_workers = num_workers or min(32, (os.cpu_count() or 1) + 4)
+
+    def __len__(self):
+        return self.num_assets
+
+    def __iter__(self):
+        for asset_id, _ in self.items():
+            yield asset_id
+
+    def __getitem__(self, asset_id):
+        for key, asset in self.items():
+            if key == asset_id:
+                return asset
+        raise KeyError(asset_id)
+
+    def raw_assets(self):
+        for path, value in iter_vott(self.vott_path):
+            if len(path) == 2:
+                yield path[1], video.frame_asset(value)
+
+    def merged(self, item):
+        asset_id, asset = item
+        asset_path = asset_file(self.vott_path.parent, asset_id)
+        try:
+            asset['regions'] = read_asset_json(asset_path)['regions']
+        except FileNotFoundError:
+            raise AssetLoadError([(asset_path, 'missing')])
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            raise AssetLoadError([(asset_path, 'corrupt ({})'.format(e))])
+        asset['version'] = self.version
+        return asset_id, asset
+
+    def items(self):
+        if not self.merge_regions:
+            return self.raw_assets()
+        return prefetch.read_ahead(self.merged, self.raw_assets(), self.num_workers, 2 * self.num_workers)
+
+    def values(self):
+        for _, asset in self.items():
+            yield asset
+
+
+def has_video(vott_path, index=None):
+    # Whether the project has video or video frame assets
+    if index is not None:
+        return bool(np.isin(index.asset_types, (video.VIDEO_ASSET, video.VIDEO_FRAME_ASSET)).any())
+    return any(len(path) == 2 and (video.is_video(value) or video.is_video_frame(value))
+               for path, value in iter_vott(vott_path))
+
+
+def source_stats(vott_path):
+    # (size, mtime_ns) of the .vott file and of the directory holding the
+    # asset files. VoTT rewrites the .vott file whenever it saves an asset,
+    # and adding, removing or replacing an asset file changes the directory;
+    # an asset file edited in place by hand goes unnoticed.
+    vott_path = pathlib.Path(vott_path)
+    stats = np.full((2, 2), -1, dtype=np.int64)
+    for idx, path in enumerate((vott_path, vott_path.parent)):
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            continue
+        stats[idx] = stat.st_size, stat.st_mtime_ns
+    return stats
+
+
+class ProjectIndex:
+    # Columnar copy of a merged VoTT project: an asset table, a region table,
+    # a flat point array with per-region offsets and flat tag ids with
+    # per-region offsets. It is persisted as an .npz file so later runs
+    # skip parsing the .vott and asset files. asset_file_order lists the
+    # assets in the order of their asset file names, the order the tools
+    # read a project's asset files in.
+
+    ARRAYS = ('asset_ids', 'asset_names', 'asset_paths', 'asset_formats', 'asset_types',
+              'asset_widths', 'asset_heights', 'asset_region_offsets', 'asset_file_order',
+              'asset_parent_ids', 'asset_parent_names', 'asset_timestamps',
+              'region_ids', 'region_types', 'region_boxes', 'region_point_offsets', 'region_tag_offsets',
+              'points_x', 'points_y', 'tag_ids', 'tag_names', 'tag_colors', 'num_project_tags', 'version',
+              'source_stats')
+
+    def __init__(self, **arrays):
+        for name in self.ARRAYS:
+            setattr(self, name, arrays[name])
+
+    @classmethod
+    def from_vott_json(cls, vott_json, source_stats=None):
+        tag_names = [tag['name'] for tag in vott_json['tags']]
+        tag_colors = [tag.get('color', '') for tag in vott_json['tags']]
+        num_project_tags = len(tag_names)
+        tag2id = {name: idx for idx, name in enumerate(tag_names)}
+
+        assets = list(vott_json['assets'].values())
+        regions = [region for asset in assets for region in asset.get('regions', [])]
+        region_tags = [tag for region in regions for tag in region['tags']]
+        for tag in region_tags:
+            if tag not in tag2id:
+                tag2id[tag] = len(tag_names)
+                tag_names.append(tag)
+                tag_colors.append('')
+        num_points = sum(len(region['points']) for region in regions)
+        asset_filenames = np.array([asset_file('', asset['id']).name for asset in assets], dtype=str)
+
+        return cls(
+            asset_ids=np.array([asset['id'] for asset in assets], dtype=str),
+            asset_names=np.array([asset['name'] for asset in assets], dtype=str),
+            asset_paths=np.array([asset.get('path', '') for asset in assets], dtype=str),
+            asset_formats=np.array([asset.get('format', '') for asset in assets], dtype=str),
+            asset_types=np.array([asset.get('type', 1) for asset in assets], dtype=np.int32),
+            asset_widths=np.array([asset['size']['width'] for asset in assets], dtype=np.int64),
+            asset_heights=np.array([asset['size']['height'] for asset in assets], dtype=np.int64),
+            asset_region_offsets=np.cumsum([0] + [len(asset.get('regions', [])) for asset in assets], dtype=np.int64),
+            asset_file_order=np.argsort(asset_filenames, kind='stable').astype(np.int64),
+            asset_parent_ids=np.array([(asset.get('parent') or {}).get('id', '') for asset in assets], dtype=str),
+            asset_parent_names=np.array([(asset.get('parent') or {}).get('name', '') for asset in assets], dtype=str),
+            asset_timestamps=np.array([asset.get('timestamp') or 0.0 for asset in assets], dtype=np.float64),
+            region_ids=np.array([region['id'] for region in regions], dtype=str),
+            region_types=np.array([region['type'] for region in regions], dtype=str),
+            region_boxes=np.array([[region['boundingBox']['left'], region['boundingBox']['top'],
+                                    region['boundingBox']['width'], region['boundingBox']['height']]
+                                   for region in regions], dtype=np.float64).reshape(-1, 4),
+            region_point_offsets=np.cumsum([0] + [len(region['points']) for region in regions], dtype=np.int64),
+            region_tag_offsets=np.cumsum([0] + [len(region['tags']) for region in regions], dtype=np.int64),
+            points_x=np.fromiter((point['x'] for region in regions for point in region['points']), np.float64, num_points),
+            points_y=np.fromiter((point['y'] for region in regions for point in region['points']), np.float64, num_points),
+            tag_ids=np.array([tag2id[tag] for tag in region_tags], dtype=np.int32),
+            tag_names=np.array(tag_names, dtype=str),
+            tag_colors=np.array(tag_colors, dtype=str),
+            num_project_tags=np.int64(num_project_tags),
+            version=np.array(vott_json.get('version', '')),
+            source_stats=source_stats if source_stats is not None else np.zeros((0, 2), dtype=np.int64),
+        )
+
+    @classmethod
+    def build(cls, vott_path, num_workers=None):
+        # stat first, so files changed while they are read make the index stale
+        stats = source_stats(vott_path)
+        return cls.from_vott_json(load_json(vott_path, num_workers), stats)
+
+    @classmethod
+    def load(cls, index_path):
+        with np.load(index_path, allow_pickle=False) as npz:
+            return cls(**{name: npz[name] for name in cls.ARRAYS})
+
+    def save(self, index_path):
+        # np.savez appends .npz to other names, so write through a file object
+        tmp_path = pathlib.Path(str(index_path) + '.tmp')
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, **{name: getattr(self, name) for name in self.ARRAYS})
+        os.replace(tmp_path, index_path)
+
+    def is_current(self, vott_path):
+        stats = source_stats(vott_path)
+        return stats.shape == self.source_stats.shape and bool((stats == self.source_stats).all())
+
+    def __len__(self):
+        return len(self.asset_ids)
+
+    @property
+    def tags(self):
+        return [{'name': name, 'color': color} for name, color
+                in zip(self.tag_names[:self.num_project_tags].tolist(), self.tag_colors[:self.num_project_tags].tolist())]
+
+    def regions(self, idx):
+        first, last = self.asset_region_offsets[idx], self.asset_region_offsets[idx + 1]
+        point_offsets = self.region_point_offsets[first:last + 1].tolist()
+        tag_offsets = self.region_tag_offsets[first:last + 1].tolist()
+        points_x = self.points_x[point_offsets[0]:point_offsets[-1]].tolist()
+        points_y = self.points_y[point_offsets[0]:point_offsets[-1]].tolist()
+        tag_ids = self.tag_ids[tag_offsets[0]:tag_offsets[-1]].tolist()
+        tag_names = self.tag_names.tolist()
+        regions = []
+        for n, (region_id, region_type, box) in enumerate(zip(self.region_ids[first:last].tolist(),
+                                                              self.region_types[first:last].tolist(),
+                                                              self.region_boxes[first:last].tolist())):
+            points = slice(point_offsets[n] - point_offsets[0], point_offsets[n + 1] - point_offsets[0])
+            tags = slice(tag_offsets[n] - tag_offsets[0], tag_offsets[n + 1] - tag_offsets[0])
+            regions.append({
+                'id': region_id,
+                'type': region_type,
+                'tags': [tag_names[tag_id] for tag_id in tag_ids[tags]],
+                'boundingBox': {'height': box[3], 'width': box[2], 'left': box[0], 'top': box[1]},
+                'points': [{'x': x, 'y': y} for x, y in zip(points_x[points], points_y[points])],
+            })
+        return regions
+
+    def asset(self, idx):
+        asset = {
+            'format': str(self.asset_formats[idx]),
+            'id': str(self.asset_ids[idx]),
+            'name': str(self.asset_names[idx]),
+            'path': str(self.asset_paths[idx]),
+            'size': {'width': int(self.asset_widths[idx]), 'height': int(self.asset_heights[idx])},
+            'type': int(self.asset_types[idx]),
+        }
+        if asset['type'] == video.VIDEO_FRAME_ASSET:
+            asset['parent'] = {'id': str(self.asset_parent_ids[idx]), 'name': str(self.asset_parent_names[idx])}
+            asset['timestamp'] = float(self.asset_timestamps[idx])
+        return asset
+
+    def record(self, idx):
+        # The contents of the asset's *-asset.json file
+        return {'asset': self.asset(idx), 'regions': IndexRegions(self, idx), 'version': str(self.version)}
+
+    def records(self):
+        for idx in range(len(self)):
+            yield self.record(idx)
+
+    def file_records(self):
+        # The records in asset file order, as the tools glob *-asset.json
+        return IndexRecords(self)
+
+    def to_vott_json(self):
+        # A .vott dict as returned by load_json; assets are materialized lazily
+        return {'tags': self.tags, 'version': str(self.version), 'sourceConnection': True,
+                'assets': IndexAssets(self)}
+
+
+class IndexRegions(collections.abc.Sequence):
+    # The regions of one asset, read from the index columns. The region
+    # dicts are only built when they are looked at: arrays() gives
+    # geometry.region_arrays the slices of the point and box columns, and
+    # types() and first_tags() the labels. Pickles as a plain list, so
+    # worker processes are not sent the whole index.
+
+    def __init__(self, index, idx):
+        self.index = index
+        self.idx = idx
+        self.first, self.last = index.asset_region_offsets[idx:idx + 2].tolist()
+        self.dicts = None
+
+    def __len__(self):
+        return self.last - self.first
+
+    def __getitem__(self, item):
+        if self.dicts is None:
+            self.dicts = self.index.regions(self.idx)
+        return self.dicts[item]
+
+    def __eq__(self, other):
+        if isinstance(other, IndexRegions):
+            other = list(other)
+        return list(self) == other
+
+    def __reduce__(self):
+        return list, (list(self),)
+
+    def arrays(self):
+        point_offsets = self.index.region_point_offsets[self.first:self.last + 1]
+        first_point, last_point = point_offsets[0], point_offsets[-1]
+        return (self.index.points_x[first_point:last_point], self.index.points_y[first_point:last_point],
+                point_offsets - first_point, self.index.region_boxes[self.first:self.last])
+
+    def types(self):
+        return self.index.region_types[self.first:self.last].tolist()
+
+    def first_tags(self):
+        tag_offsets = self.index.region_tag_offsets[self.first:self.last + 1]
+        if (np.diff(tag_offsets) == 0).any():
+            # fails on the untagged region like the region dicts would
+            return [region['tags'][0] for region in self]
+        return self.index.tag_names[self.index.tag_ids[tag_offsets[:-1]]].tolist()
+
+
+class IndexRecords(collections.abc.Sequence):
+    def __init__(self, index):
+        self.index = index
+
+    def __len__(self):
+        return len(self.index)
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return [self[n] for n in range(*item.indices(len(self)))]
+        return self.index.record(int(self.index.asset_file_order[item]))
+
+    def __iter__(self):
+        for idx in self.index.asset_file_order.tolist():
+            yield self.index.record(idx)
+
+
+class IndexAssets(collections.abc.Mapping):
+    def __init__(self, index):
+        self.index = index
+        self.positions = {asset_id: idx for idx, asset_id in enumerate(index.asset_ids.tolist())}
+
+    def __getitem__(self, asset_id):
+        idx = self.positions[asset_id]
+        asset = self.index.asset(idx)
+        asset['regions'] = IndexRegions(self.index, idx)
+        asset['version'] = str(self.index.version)
+        return asset
+
+    def __iter__(self):
+        return iter(self.positions)
+
+    def __len__(self):
+        return len(self.positions)
+
+
+def open_project(vott_path, index_path=None, num_workers=None):
+    # Loads the project index from index_path while it matches the project
+    # files, otherwise rebuilds it from the .vott and asset files.
+    if index_path and pathlib.Path(index_path).is_file():
+        try:
+            index = ProjectIndex.load(index_path)
+        except KeyError:
+            # written by an older version
+            index = None
+        if index is not None and index.is_current(vott_path):
+            return index
+    index = ProjectIndex.build(vott_path, num_workers)
+    if index_path:
+        index.save(index_path)
+    return index
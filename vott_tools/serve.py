@@ -0,0 +1,458 @@
+import http.client
+import http.server
+import json
+import os
+import socket
+import socketserver
+import stat
+import sys
+import threading
+import time
+import urllib
+import multiprocessing
+from datetime import datetime
+from . import instrument, prefetch, tfrecord_io, video
+from .cli_utils import SPLIT_KEYS, parse_args, parse_ratio
+from .dataset_split import Splitter, split_all
+from .manifest import Manifest
+from .project_index import iter_vott, read_asset_json
+from .vott2coco import COCO_LICENSES, assets_to_coco, batches, coco_info, tags2categories
+from .vott2tfrecords import asset_key, serialize_examples, shard_paths
+
+# A long-running conversion daemon. The project's .vott header, its asset
+# files, their coco annotations and their tfrecord examples are kept in
+# memory, and the annotation directory is polled for changed asset files.
+# Examples are cached on disk by a Manifest, shared with
+# `tfrecords --incremental` for the same output prefix and parameters, and
+# in memory as framed records, so rebuilding the shards is a matter of
+# writing bytes out (without the crc32c package, checksums are expensive).
+# Requests are served over HTTP on localhost or on a Unix socket:
+#
+#   GET  /status                         project and cache state
+#   GET  /coco[?ratio=&seed=&stratify=&split_by=&subset=]
+#                                        coco json of the current annotations
+#   POST /tfrecords[?ratio=&seed=&stratify=&split_by=]
+#                                        rebuild the tfrecord shards
+#   POST /shutdown
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+ASSET_SUFFIX = '-asset.json'
+
+
+class RequestError(Exception):
+    pass
+
+
+class ProjectState:
+    # The project as of the last refresh(). Not thread-safe, callers hold
+    # the lock.
+
+    def __init__(self, vott_path, image_dir=None, output_dir=None, output_prefix='', new_size=None, reencode=False,
+                 mask_format='png', backend='tf', num_shards=1, pool=None):
+        self.vott_path = vott_path
+        self.annotation_dir = vott_path.parent
+        self.image_dir = image_dir
+        self.output_dir = output_dir
+        self.output_prefix = output_prefix
+        self.new_size = new_size
+        self.reencode = reencode
+        self.mask_format = mask_format
+        self.backend = backend
+        self.num_shards = num_shards
+        self.pool = pool
+        self.lock = threading.RLock()
+        self.vott_stat = None
+        self.header = {}
+        self.vott_assets = {}
+        self.categories = []
+        self.class_id = {}
+        self.manifest = None
+        # per asset id: *-asset.json contents, (size, mtime_ns) of the file,
+        # coco (image, annotations) and (key, framed record) of the example
+        self.records = {}
+        self.stats = {}
+        self.coco = {}
+        self.frames = {}
+        self.changed = set()
+        self.last_refresh = None
+        self.num_refreshes = 0
+
+    def load_vott(self):
+        header = {}
+        assets = {}
+        for path, value in iter_vott(self.vott_path):
+            if len(path) == 1:
+                header[path[0]] = value
+            else:
+                assets[path[1]] = video.frame_asset(value)
+        header.pop('assets', None)
+        self.header = header
+        self.vott_assets = assets
+        categories = tags2categories(header)
+        if categories != self.categories:
+            # category ids are part of every annotation and example
+            self.categories = categories
+            self.class_id = {cat['name']: cat['id'] for cat in categories}
+            self.coco = {}
+            self.frames = {}
+            self.changed = set(self.records)
+            if self.output_dir:
+                self.manifest = Manifest(self.output_dir, self.output_prefix + '.tfrecords',
+                                         {'categories': categories, 'new_size': self.new_size,
+                                          'reencode': self.reencode, 'mask_format': self.mask_format,
+                                          'backend': self.backend})
+
+    def scan(self):
+        stats = {}
+        with os.scandir(self.annotation_dir) as entries:
+            for entry in entries:
+                if entry.name.endswith(ASSET_SUFFIX):
+                    stat = entry.stat()
+                    stats[entry.name[:-len(ASSET_SUFFIX)]] = (stat.st_size, stat.st_mtime_ns)
+        return stats
+
+    def refresh(self):
+        # Re-reads the .vott file when it changed and every asset file that
+        # changed since the last call. Returns the number of changed assets.
+        stat = os.stat(self.vott_path)
+        if (stat.st_size, stat.st_mtime_ns) != self.vott_stat:
+            self.load_vott()
+            self.vott_stat = (stat.st_size, stat.st_mtime_ns)
+
+        stats = self.scan()
+        removed = set(self.records) - set(stats)
+        for asset_id in removed:
+            for cache in (self.records, self.stats, self.coco, self.frames):
+                cache.pop(asset_id, None)
+            self.changed.discard(asset_id)
+
+        changed = [asset_id for asset_id, asset_stat in stats.items() if self.stats.get(asset_id) != asset_stat]
+
+        def load(asset_id):
+            try:
+                return read_asset_json(self.annotation_dir.joinpath(asset_id + ASSET_SUFFIX))
+            except (OSError, ValueError):
+                # removed or still being written, tried again on the next poll
+                return None
+
+        loaded = 0
+        for asset_id, record in zip(changed, prefetch.read_ahead(load, changed)):
+            if record is None:
+                continue
+            self.records[asset_id] = record
+            self.stats[asset_id] = stats[asset_id]
+            self.coco.pop(asset_id, None)
+            self.changed.add(asset_id)
+            loaded += 1
+        self.last_refresh = time.time()
+        self.num_refreshes += 1
+        return loaded + len(removed)
+
+    def coco_assets(self):
+        # (asset_id, .vott asset with its regions) in .vott order, as
+        # load_json merges them; assets without an asset file yet are left out
+        version = self.header.get('version')
+        return [(asset_id, dict(asset, regions=self.records[asset_id]['regions'], version=version))
+                for asset_id, asset in self.vott_assets.items()
+                if asset_id in self.records and not video.is_video(asset)]
+
+    def coco_fragments(self, assets):
+        # (image, annotations) of (asset_id, asset) items, the ones not
+        # cached converted in batches
+        missing = [(asset_id, asset) for asset_id, asset in assets if asset_id not in self.coco]
+        for batch in batches(missing):
+            self.coco.update(zip([asset_id for asset_id, _ in batch],
+                                 assets_to_coco([asset for _, asset in batch], self.class_id)))
+        return [self.coco[asset_id] for asset_id, _ in assets]
+
+    def coco_json(self, splitter=None, subset=None):
+        now = datetime.now()
+        date_captured = now.strftime('%Y-%m-%d %H:%M:%S')
+        assets = self.coco_assets()
+        if splitter:
+            entries = split_all(splitter, ((item, item[1], item[1]['regions']) for item in assets))
+            assets = [item for item, split in entries if split == subset]
+        images = []
+        annotations = []
+        for image, image_annotations in self.coco_fragments(assets):
+            images.append(dict(image, date_captured=date_captured, id=len(images) + 1))
+            for annotation in image_annotations:
+                annotations.append(dict(annotation, image_id=len(images), id=len(annotations) + 1))
+        return json.dumps({'info': coco_info(now), 'licenses': COCO_LICENSES, 'images': images,
+                           'annotations': annotations, 'categories': self.categories})
+
+    def tfrecord_samples(self):
+        # The records in the order of the tfrecords tool
+        samples = [self.records[asset_id] for asset_id in sorted(self.records, key=lambda asset_id: asset_id + ASSET_SUFFIX)]
+        if any(video.is_video(sample['asset']) or video.is_video_frame(sample['asset']) for sample in samples):
+            samples = video.order_records(samples)
+        return samples
+
+    def build_examples(self, samples):
+        # Brings the framed records of the samples up to date, from the
+        # manifest's cache or built anew. Returns the number built.
+        images = video.ImageSource(self.image_dir, samples)
+        stale = []
+        for sample in samples:
+            asset_id = sample['asset']['id']
+            # the image may have changed without its asset file
+            key = asset_key(self.manifest, images.path(sample), sample)
+            self.changed.discard(asset_id)
+            if self.manifest.lookup(asset_id, key) and self.frames.get(asset_id, (None,))[0] == key:
+                images.skip(sample)
+                continue
+            serialized = self.manifest.load(asset_id, key)
+            if serialized is None:
+                stale.append((sample, key))
+            else:
+                images.skip(sample)
+                self.frames[asset_id] = (key, tfrecord_io.frame_record(serialized))
+
+        def load_task(entry):
+            sample, _ = entry
+            return (self.image_dir, sample, self.class_id, [self.new_size], not self.reencode, self.mask_format,
+                    self.backend, images.read(sample))
+
+        tasks = prefetch.read_ahead(load_task, stale)
+        try:
+            for (sample, key), serialized in zip(stale, instrument.imap(serialize_examples, tasks, self.pool)):
+                asset_id = sample['asset']['id']
+                self.manifest.store(asset_id, key, serialized[0])
+                self.frames[asset_id] = (key, tfrecord_io.frame_record(serialized[0]))
+        finally:
+            images.close()
+        return len(stale)
+
+    def warm(self):
+        # Converts what changed since the last call, so requests only
+        # assemble outputs
+        self.coco_fragments(self.coco_assets())
+        if self.manifest and self.image_dir and self.changed:
+            self.build_examples([sample for sample in self.tfrecord_samples() if sample['asset']['id'] in self.changed])
+            # video assets have no example
+            self.changed = set()
+
+    def write_tfrecords(self, splitter=None):
+        # Rebuilds every shard from the cached examples. Shards are written
+        # next to their final paths and moved in place when complete.
+        if not (self.manifest and self.image_dir):
+            raise RequestError('tfrecords need --image_dir and --output_dir')
+        start = time.perf_counter()
+        samples = self.tfrecord_samples()
+        self.manifest.start_run()
+        built = self.build_examples(samples)
+        if splitter:
+            dataset = {split: [] for split in splitter.splits}
+            for sample, split in split_all(splitter, ((sample, sample['asset'], sample['regions']) for sample in samples)):
+                dataset[split].append(sample)
+        else:
+            dataset = {'': samples}
+
+        outputs = []
+        for subset, subset_samples in dataset.items():
+            paths = shard_paths(self.output_dir, self.output_prefix + subset, self.num_shards)
+            tmp_paths = ['{}.tmp'.format(path) for path in paths]
+            # the records are framed already, whatever the backend
+            writers = [tfrecord_io.IndexedWriter(tfrecord_io.TFRecordWriter(tmp_path), tmp_path)
+                       for tmp_path in tmp_paths]
+            try:
+                for idx, sample in enumerate(subset_samples):
+                    asset = sample['asset']
+                    writers[idx % len(writers)].write_framed(self.frames[asset['id']][1], asset['id'],
+                                                             urllib.parse.unquote(asset['name']))
+            finally:
+                for writer in writers:
+                    writer.close()
+            for path, tmp_path in zip(paths, tmp_paths):
+                os.replace(tmp_path, path)
+                for tmp_sidecar, sidecar in zip(tfrecord_io.index_paths(tmp_path), tfrecord_io.index_paths(path)):
+                    os.replace(tmp_sidecar, sidecar)
+            outputs.extend(str(path) for path in paths)
+        self.manifest.save()
+        return {'outputs': outputs, 'sizes': {subset: len(subset_samples) for subset, subset_samples in dataset.items()},
+                'built': built, 'seconds': time.perf_counter() - start}
+
+    def status(self):
+        return {'vott_file': str(self.vott_path), 'assets': len(self.records), 'vott_assets': len(self.vott_assets),
+                'categories': len(self.categories), 'coco_cached': len(self.coco), 'examples_cached': len(self.frames),
+                'examples_pending': len(self.changed),
+                'last_refresh': self.last_refresh, 'refreshes': self.num_refreshes}
+
+
+def query_splitter(query):
+    # The Splitter of a request's ratio, seed, stratify and split_by
+    if 'ratio' not in query:
+        return None
+    ratio = parse_ratio(query['ratio'])
+    if not ratio:
+        raise RequestError('ratio must follow pattern like 99:99 or 99:99:99')
+    split_by = query.get('split_by', 'name')
+    if split_by not in SPLIT_KEYS:
+        raise RequestError('split_by must be one of {}'.format(', '.join(SPLIT_KEYS)))
+    try:
+        seed = int(query.get('seed', 0))
+    except ValueError:
+        raise RequestError('seed must be an integer')
+    return Splitter(ratio, seed, query.get('stratify', '') not in ('', '0', 'false'), split_by)
+
+
+def get_status(server, query):
+    return server.state.status()
+
+def get_coco(server, query):
+    splitter = query_splitter(query)
+    subset = query.get('subset')
+    if splitter and subset not in splitter.splits:
+        raise RequestError('subset must be one of {}'.format(', '.join(splitter.splits)))
+    return server.state.coco_json(splitter, subset)
+
+def post_tfrecords(server, query):
+    return server.state.write_tfrecords(query_splitter(query))
+
+def post_shutdown(server, query):
+    # shutdown() waits for serve_forever(), so it runs after the response
+    threading.Thread(target=server.shutdown).start()
+    return {'shutdown': True}
+
+ROUTES = {
+    ('GET', '/status'): get_status,
+    ('GET', '/coco'): get_coco,
+    ('POST', '/tfrecords'): post_tfrecords,
+    ('POST', '/shutdown'): post_shutdown,
+}
+
+
+class RequestHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.dispatch('GET')
+
+    def do_POST(self):
+        self.dispatch('POST')
+
+    def dispatch(self, method):
+        url = urllib.parse.urlsplit(self.path)
+        query = dict(urllib.parse.parse_qsl(url.query))
+        route = ROUTES.get((method, url.path))
+        if route is None:
+            status = 405 if any(path == url.path for _, path in ROUTES) else 404
+            return self.reply(status, {'error': '{} {} is not served'.format(method, url.path)})
+        state = self.server.state
+        try:
+            with state.lock:
+                # every request sees the annotations as they are on disk
+                state.refresh()
+                body = route(self.server, query)
+        except RequestError as e:
+            return self.reply(400, {'error': str(e)})
+        except Exception as e:
+            return self.reply(500, {'error': '{}: {}'.format(type(e).__name__, e)})
+        self.reply(200, body)
+
+    def reply(self, status, body):
+        data = (body if isinstance(body, str) else json.dumps(body)).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def address_string(self):
+        # Unix socket clients have no address
+        return self.client_address[0] if self.client_address else 'unix'
+
+
+class ThreadingHTTPServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    daemon_threads = True
+
+class UnixHTTPServer(ThreadingHTTPServer):
+    address_family = socket.AF_UNIX
+
+    def server_bind(self):
+        socketserver.TCPServer.server_bind(self)
+        self.server_name = 'localhost'
+        self.server_port = 0
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, socket_path, timeout=None):
+        super().__init__('localhost', timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(self.socket_path)
+
+
+def request(path, method='GET', host=DEFAULT_HOST, port=DEFAULT_PORT, socket_path=None, timeout=None):
+    # A local client: (status, decoded json body) of a request to the daemon
+    if socket_path:
+        connection = UnixHTTPConnection(str(socket_path), timeout)
+    else:
+        connection = http.client.HTTPConnection(host, port, timeout)
+    try:
+        connection.request(method, path)
+        response = connection.getresponse()
+        return response.status, json.loads(response.read().decode('utf-8'))
+    finally:
+        connection.close()
+
+
+def poll(state, interval, stop):
+    while not stop.wait(interval):
+        try:
+            with state.lock:
+                if state.refresh():
+                    state.warm()
+        except Exception as e:
+            sys.stderr.write('poll failed: {}: {}\n'.format(type(e).__name__, e))
+
+
+def main(args):
+    if args.new_size and not args.image_dir:
+        sys.exit('--new_size needs --image_dir')
+    # a stale socket of an earlier run is replaced, anything else is kept
+    if args.socket and os.path.lexists(args.socket) and not stat.S_ISSOCK(os.lstat(args.socket).st_mode):
+        sys.exit('--socket {} exists and is not a socket'.format(args.socket))
+    # TensorFlow is not fork-safe, so its worker processes are spawned.
+    context = multiprocessing.get_context('spawn' if args.backend == 'tf' else None)
+    pool = context.Pool(args.num_workers) if args.num_workers > 1 else None
+    state = ProjectState(args.vott_file, args.image_dir, args.output_dir, args.output_prefix, args.new_size,
+                         args.reencode, args.mask_format, args.backend, args.num_shards, pool)
+    start = time.perf_counter()
+    with state.lock:
+        state.refresh()
+        state.warm()
+    print('Loaded {} assets in {:.2f} s'.format(len(state.records), time.perf_counter() - start))
+
+    if args.socket:
+        if os.path.exists(args.socket):
+            os.unlink(args.socket)
+        server = UnixHTTPServer(args.socket, RequestHandler)
+        print('Serving on {}'.format(args.socket))
+    else:
+        server = ThreadingHTTPServer((args.host, args.port), RequestHandler)
+        print('Serving on http://{}:{}'.format(*server.server_address[:2]))
+    server.state = state
+    sys.stdout.flush()
+
+    stop = threading.Event()
+    poller = threading.Thread(target=poll, args=(state, args.poll, stop), daemon=True)
+    poller.start()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop.set()
+        poller.join()
+        server.server_close()
+        if args.socket and os.path.exists(args.socket):
+            os.unlink(args.socket)
+        if pool:
+            pool.close()
+            pool.join()
+
+
+if __name__ == '__main__':
+    main(parse_args('serve'))
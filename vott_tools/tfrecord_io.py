@@ -0,0 +1,415 @@
+import itertools
+import struct
+import urllib.parse
+
+try:
+    from crc32c import crc32c
+except ImportError:
+    try:
+        import google_crc32c
+
+        def crc32c(data):
+            return google_crc32c.value(bytes(data))
+    except ImportError:
+        crc32c = None
+
+
+# TFRecord files and tf.train.Example protos without TensorFlow. Features
+# are (kind, values) tuples, kind being one of 'bytes_list', 'float_list'
+# or 'int64_list'. Features are written sorted by name, so serialization
+# is deterministic; protobuf parsers read them back as the same message.
+
+FEATURE_FIELDS = {'bytes_list': 1, 'float_list': 2, 'int64_list': 3}
+FEATURE_KINDS = {number: kind for kind, number in FEATURE_FIELDS.items()}
+
+
+def _make_crc32c_table():
+    table = []
+    for n in range(256):
+        crc = n
+        for _ in range(8):
+            crc = (crc >> 1) ^ 0x82f63b78 if crc & 1 else crc >> 1
+        table.append(crc)
+    return table
+
+CRC32C_TABLE = _make_crc32c_table()
+
+def _crc32c_update(crc, data):
+    table = CRC32C_TABLE
+    for byte in bytes(data):
+        crc = table[(crc ^ byte) & 0xff] ^ (crc >> 8)
+    return crc
+
+def _crc32c(data):
+    return _crc32c_update(0xffffffff, data) ^ 0xffffffff
+
+
+# Without a crc32c package, long records are checksummed with numpy: the
+# data is cut into lanes that are run through the table side by side, each
+# from a zero register, and the lane checksums are then chained. The CRC
+# is linear, so chaining a lane is shifting the running register through
+# the lane's length of zero bytes (a fixed 32x32 bit matrix, applied as
+# four byte tables) and adding the lane's checksum.
+
+CRC32C_MIN_LANES_LENGTH = 4096
+_crc32c_shifts = {}
+
+def _crc32c_shift_tables(length):
+    if length not in _crc32c_shifts:
+        table = CRC32C_TABLE
+        columns = []
+        for bit in range(32):
+            crc = 1 << bit
+            for _ in range(length):
+                crc = table[crc & 0xff] ^ (crc >> 8)
+            columns.append(crc)
+        shifts = []
+        for k in range(4):
+            shift = [0] * 256
+            for value in range(1, 256):
+                shift[value] = shift[value & (value - 1)] ^ columns[8 * k + (value & -value).bit_length() - 1]
+            shifts.append(shift)
+        _crc32c_shifts[length] = shifts
+    return _crc32c_shifts[length]
+
+def _crc32c_lanes(data):
+    import numpy as np
+    data = np.frombuffer(data, dtype=np.uint8)
+    # about sqrt(n) lanes of about sqrt(n) bytes, a power of two
+    lane_length = 1 << max(6, (len(data).bit_length() - 1) // 2)
+    num_lanes = len(data) // lane_length
+    lanes = np.zeros(num_lanes, dtype=np.uint32)
+    table = np.array(CRC32C_TABLE, dtype=np.uint32)
+    for column in np.ascontiguousarray(data[:num_lanes * lane_length].reshape(num_lanes, lane_length).T):
+        lanes = table[(lanes ^ column) & 0xff] ^ (lanes >> 8)
+    shift0, shift1, shift2, shift3 = _crc32c_shift_tables(lane_length)
+    crc = 0xffffffff
+    for lane in lanes.tolist():
+        crc = shift0[crc & 0xff] ^ shift1[(crc >> 8) & 0xff] ^ shift2[(crc >> 16) & 0xff] ^ shift3[crc >> 24] ^ lane
+    return _crc32c_update(crc, data[num_lanes * lane_length:]) ^ 0xffffffff
+
+def _crc32c_fallback(data):
+    if len(data) < CRC32C_MIN_LANES_LENGTH:
+        return _crc32c(data)
+    return _crc32c_lanes(data)
+
+if crc32c is None:
+    crc32c = _crc32c_fallback
+
+def masked_crc32c(data):
+    crc = crc32c(data)
+    return (((crc >> 15) | (crc << 17)) + 0xa282ead8) & 0xffffffff
+
+
+def bytes_list_feature(values):
+    return ('bytes_list', list(values))
+
+def float_list_feature(values):
+    return ('float_list', list(values))
+
+def int64_list_feature(values):
+    return ('int64_list', list(values))
+
+
+def _varint(value):
+    value &= 0xffffffffffffffff
+    out = bytearray()
+    while True:
+        bits = value & 0x7f
+        value >>= 7
+        if value:
+            out.append(bits | 0x80)
+        else:
+            out.append(bits)
+            return bytes(out)
+
+def _length_delimited(field_number, payload):
+    return _varint(field_number << 3 | 2) + _varint(len(payload)) + payload
+
+def serialize_feature(feature):
+    kind, values = feature
+    if kind == 'bytes_list':
+        payload = b''.join(_length_delimited(1, bytes(value)) for value in values)
+    elif kind == 'float_list':
+        payload = _length_delimited(1, struct.pack('<{}f'.format(len(values)), *values)) if values else b''
+    elif kind == 'int64_list':
+        payload = _length_delimited(1, b''.join(_varint(int(value)) for value in values)) if values else b''
+    else:
+        raise ValueError('unknown feature kind {}'.format(kind))
+    return _length_delimited(FEATURE_FIELDS[kind], payload)
+
+def serialize_example(features):
+    entries = b''.join(_length_delimited(1, _length_delimited(1, name.encode('utf-8')) +
+                                            _length_delimited(2, serialize_feature(features[name])))
+                       for name in sorted(features))
+    return _length_delimited(1, entries)
+
+
+def _read_varint(data, pos):
+    result = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7f) << shift
+        if not byte & 0x80:
+            return result, pos
+        shift += 7
+
+def _fields(data):
+    # (field number, wire type, value) of a serialized message
+    pos = 0
+    while pos < len(data):
+        key, pos = _read_varint(data, pos)
+        field_number, wire_type = key >> 3, key & 7
+        if wire_type == 0:
+            value, pos = _read_varint(data, pos)
+        elif wire_type == 1:
+            value, pos = data[pos:pos + 8], pos + 8
+        elif wire_type == 2:
+            length, pos = _read_varint(data, pos)
+            value, pos = data[pos:pos + length], pos + length
+        elif wire_type == 5:
+            value, pos = data[pos:pos + 4], pos + 4
+        else:
+            raise ValueError('unsupported wire type {}'.format(wire_type))
+        yield field_number, wire_type, value
+
+def _signed(value):
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+def parse_feature(data):
+    kind = None
+    values = []
+    for field_number, _, payload in _fields(data):
+        kind = FEATURE_KINDS[field_number]
+        for _, wire_type, value in _fields(payload):
+            if kind == 'bytes_list':
+                values.append(bytes(value))
+            elif kind == 'float_list':
+                if wire_type == 2:
+                    values.extend(struct.unpack('<{}f'.format(len(value) // 4), value))
+                else:
+                    values.append(struct.unpack('<f', value)[0])
+            elif wire_type == 2:
+                pos = 0
+                while pos < len(value):
+                    number, pos = _read_varint(value, pos)
+                    values.append(_signed(number))
+            else:
+                values.append(_signed(value))
+    return kind, values
+
+def parse_example(data):
+    features = {}
+    data = memoryview(data)
+    for _, _, features_data in _fields(data):
+        for _, _, entry in _fields(features_data):
+            name = None
+            feature = (None, [])
+            for field_number, _, value in _fields(entry):
+                if field_number == 1:
+                    name = bytes(value).decode('utf-8')
+                elif field_number == 2:
+                    feature = parse_feature(value)
+            features[name] = feature
+    return features
+
+
+class Example:
+    # Stand-in for tf.train.Example built from a dict of features.
+
+    def __init__(self, features):
+        self.features = features
+
+    def SerializeToString(self, deterministic=True):
+        return serialize_example(self.features)
+
+    @classmethod
+    def FromString(cls, data):
+        return cls(parse_example(data))
+
+
+def frame_record(record):
+    header = struct.pack('<Q', len(record))
+    return header + struct.pack('<I', masked_crc32c(header)) + record + struct.pack('<I', masked_crc32c(record))
+
+
+class TFRecordWriter:
+    def __init__(self, path):
+        self.f = open(path, 'wb')
+
+    def write(self, record):
+        self.f.write(frame_record(record))
+
+    def write_framed(self, framed):
+        # a record already framed by frame_record
+        self.f.write(framed)
+
+    def flush(self):
+        self.f.flush()
+
+    def close(self):
+        self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class CorruptRecordError(Exception):
+    pass
+
+
+def read_record(f, path, verify=True):
+    # The next record of f, None at the end of the file
+    header = f.read(12)
+    if not header:
+        return None
+    if len(header) < 12:
+        raise CorruptRecordError('{}: truncated record header'.format(path))
+    length, length_crc = struct.unpack('<QI', header)
+    if verify and masked_crc32c(header[:8]) != length_crc:
+        raise CorruptRecordError('{}: bad length checksum'.format(path))
+    record = f.read(length)
+    footer = f.read(4)
+    if len(record) < length or len(footer) < 4:
+        raise CorruptRecordError('{}: truncated record'.format(path))
+    if verify and masked_crc32c(record) != struct.unpack('<I', footer)[0]:
+        raise CorruptRecordError('{}: bad data checksum'.format(path))
+    return record
+
+
+def read_records(path, verify=True):
+    with open(path, 'rb') as f:
+        while True:
+            record = read_record(f, path, verify)
+            if record is None:
+                return
+            yield record
+
+
+# Index sidecars. <file>.idx has one 'offset size' line per record of
+# <file>, covering the whole framed record: the index DALI's TFRecord reader
+# (and its tfrecord2idx script) reads. <file>.ids has the asset id and
+# URL-quoted image filename of each record, tab separated, line for line.
+
+RECORD_OVERHEAD = 16
+
+def index_path(path):
+    return '{}.idx'.format(path)
+
+def ids_path(path):
+    return '{}.ids'.format(path)
+
+def index_paths(path):
+    return [index_path(path), ids_path(path)]
+
+
+class IndexedWriter:
+    # Wraps a TFRecord writer (TFRecordWriter or TensorFlow's) and writes
+    # the index of the records as they are written.
+
+    def __init__(self, writer, path):
+        self.writer = writer
+        self.index = open(index_path(path), 'w')
+        self.ids = open(ids_path(path), 'w')
+        self.offset = 0
+
+    def add(self, length, asset_id, filename):
+        self.index.write('{} {}\n'.format(self.offset, length))
+        self.ids.write('{}\t{}\n'.format(asset_id, urllib.parse.quote(filename)))
+        self.offset += length
+
+    def write(self, record, asset_id='', filename=''):
+        self.writer.write(record)
+        self.add(len(record) + RECORD_OVERHEAD, asset_id, filename)
+
+    def write_framed(self, framed, asset_id='', filename=''):
+        # needs a TFRecordWriter
+        self.writer.write_framed(framed)
+        self.add(len(framed), asset_id, filename)
+
+    def flush(self):
+        self.writer.flush()
+        self.index.flush()
+        self.ids.flush()
+
+    def close(self):
+        self.writer.close()
+        self.index.close()
+        self.ids.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def read_index(path):
+    # Yields (offset, length, asset_id, filename) from the index sidecars
+    # of a TFRecord file
+    with open(index_path(path), 'r') as index, open(ids_path(path), 'r') as ids:
+        for line, ids_line in itertools.zip_longest(index, ids):
+            if line is None or ids_line is None:
+                raise CorruptRecordError('{}: .idx and .ids differ in length'.format(path))
+            offset, length = line.split()
+            asset_id, filename = ids_line.rstrip('\n').split('\t')
+            yield int(offset), int(length), asset_id, urllib.parse.unquote(filename)
+
+
+class IndexedReader:
+    # Reads single records by asset id from one or more indexed TFRecord
+    # files (e.g. the shards of a dataset). Only the indexes are read up
+    # front; a record is fetched with one seek and read.
+
+    def __init__(self, paths, verify=True):
+        if isinstance(paths, (str, bytes)) or not hasattr(paths, '__iter__'):
+            paths = [paths]
+        self.paths = list(paths)
+        self.verify = verify
+        self.entries = {}
+        self.filenames = {}
+        for idx, path in enumerate(self.paths):
+            for offset, length, asset_id, filename in read_index(path):
+                self.entries[asset_id] = (idx, offset, length)
+                self.filenames[asset_id] = filename
+        self.files = {}
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, asset_id):
+        return asset_id in self.entries
+
+    def ids(self):
+        return list(self.entries)
+
+    def read(self, asset_id):
+        # The serialized example of an asset, KeyError for unknown ids
+        idx, offset, length = self.entries[asset_id]
+        if idx not in self.files:
+            self.files[idx] = open(self.paths[idx], 'rb')
+        f = self.files[idx]
+        f.seek(offset)
+        record = read_record(f, self.paths[idx], self.verify)
+        if record is None or len(record) + RECORD_OVERHEAD != length:
+            raise CorruptRecordError('{}: index does not match record at {}'.format(self.paths[idx], offset))
+        return record
+
+    def example(self, asset_id):
+        return Example.FromString(self.read(asset_id))
+
+    def close(self):
+        for f in self.files.values():
+            f.close()
+        self.files = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,249 @@
+import os
+import sys
+import time
+import urllib
+import multiprocessing
+from datetime import datetime
+from . import instrument, prefetch, probe, tfrecord_io, video
+from .cli_utils import check_overwrite, parse_args
+from .dataset_split import Splitter, split_all
+from .project_index import has_video, open_project, read_asset, read_vott_header
+from .vott2coco import CocoWriter, asset_to_coco, polygon_area, print_dataset_size, tags2categories
+from .vott2tfrecords import build_example, get_backend, get_image_format, shard_paths
+
+# Tiled export of large images. Each image is cut into fixed size tiles,
+# optionally overlapping, and its regions are clipped to every tile. The
+# tiles and their regions are planned from the asset file alone, so an
+# image whose tiles are all dropped is never read. Otherwise the image is
+# decoded once, within the window covering the kept tiles (a partial
+# decode for JPEGs with the tf backend), and every tile is cut from it.
+
+
+def tile_starts(length, tile_length, overlap=0):
+    # Offsets of the tiles along one axis. The last tile ends at the image
+    # edge, so tiles keep their full size unless the image is smaller.
+    if length <= tile_length:
+        return [0]
+    return list(range(0, length - tile_length, tile_length - overlap)) + [length - tile_length]
+
+def tile_windows(height, width, tile_size, overlap=0):
+    # (top, left, height, width) of every tile, row by row
+    tile_height, tile_width = tile_size
+    return [(top, left, min(tile_height, height), min(tile_width, width))
+            for top in tile_starts(height, tile_height, overlap)
+            for left in tile_starts(width, tile_width, overlap)]
+
+
+def clip_polygon(points, left, top, right, bottom):
+    # Sutherland-Hodgman clipping of [(x, y)] points to a rectangle
+    for axis, bound, sign in ((0, left, 1), (0, right, -1), (1, top, 1), (1, bottom, -1)):
+        clipped = []
+        previous = points[-1] if points else None
+        for point in points:
+            inside = (point[axis] - bound) * sign >= 0
+            if inside != ((previous[axis] - bound) * sign >= 0):
+                t = (bound - previous[axis]) / (point[axis] - previous[axis])
+                crossing = [previous[0] + t * (point[0] - previous[0]), previous[1] + t * (point[1] - previous[1])]
+                crossing[axis] = bound
+                clipped.append(tuple(crossing))
+            if inside:
+                clipped.append(point)
+            previous = point
+        points = clipped
+    return points
+
+def clip_region(region, window, min_visible=0.0):
+    # The region clipped to a tile, in tile coordinates, or None when no
+    # area or less than min_visible of its area is left
+    top, left, height, width = window
+    points = [(point['x'], point['y']) for point in region['points']]
+    clipped = clip_polygon(points, left, top, left + width, top + height)
+    area = polygon_area(clipped) if len(clipped) >= 3 else 0
+    if area <= 0:
+        return None
+    if min_visible and area < min_visible * polygon_area(points):
+        return None
+    xs = [x - left for x, _ in clipped]
+    ys = [y - top for _, y in clipped]
+    return {'id': region.get('id'), 'type': region['type'], 'tags': region['tags'],
+            'boundingBox': {'left': min(xs), 'top': min(ys), 'width': max(xs) - min(xs), 'height': max(ys) - min(ys)},
+            'points': [{'x': x, 'y': y} for x, y in zip(xs, ys)]}
+
+
+def plan_tiles(record, tile_size, overlap=0, drop_empty=False, min_visible=0.0):
+    # [(window, tile record)] of an *-asset.json record. A tile record looks
+    # like an asset record of the tile's image, named <image>_<top>_<left>.jpg
+    asset = record['asset']
+    stem = os.path.splitext(urllib.parse.unquote(asset['name']))[0]
+    tiles = []
+    for window in tile_windows(asset['size']['height'], asset['size']['width'], tile_size, overlap):
+        top, left, height, width = window
+        regions = [clipped for clipped in (clip_region(region, window, min_visible) for region in record['regions'])
+                   if clipped]
+        if drop_empty and not regions:
+            continue
+        tile_asset = {'id': '{}_{}_{}'.format(asset['id'], top, left),
+                      'name': urllib.parse.quote('{}_{}_{}.jpg'.format(stem, top, left)),
+                      'format': 'jpg', 'size': {'height': height, 'width': width}}
+        tiles.append((window, {'asset': tile_asset, 'regions': regions}))
+    return tiles
+
+
+def render_tiles(task):
+    # Returns (subset, [(tile record, encoded tile, coco (image, annotations),
+    # serialized example)]) for one asset; outputs not requested are None
+    record, subset, tiles, encoded_image_data, options = task
+    formats = options['formats']
+    instrument.count('regions', len(record['regions']))
+    if not tiles:
+        return subset, []
+    image_io = get_backend(options['backend'])
+    top = min(window[0] for window, _ in tiles)
+    left = min(window[1] for window, _ in tiles)
+    bottom = max(window[0] + window[2] for window, _ in tiles)
+    right = max(window[1] + window[3] for window, _ in tiles)
+    with instrument.stage('decode'):
+        image = image_io.decode_window(encoded_image_data, get_image_format(encoded_image_data), top, left,
+                                       bottom - top, right - left)
+
+    outputs = []
+    for (tile_top, tile_left, height, width), tile in tiles:
+        with instrument.stage('encode'):
+            encoded_tile = image_io.encode_jpeg(image[tile_top - top:tile_top - top + height,
+                                                      tile_left - left:tile_left - left + width])
+        coco = serialized = None
+        if 'coco' in formats:
+            with instrument.stage('convert'):
+                coco = asset_to_coco(dict(tile['asset'], regions=tile['regions']), options['class_id'])
+        if 'tfrecords' in formats:
+            example = build_example(tile, options['class_id'], height, width, encoded_tile, b'jpeg',
+                                    options['mask_format'], options['backend'])
+            with instrument.stage('serialize'):
+                serialized = example.SerializeToString(deterministic=True)
+        outputs.append((tile, encoded_tile if coco else None, coco, serialized))
+    instrument.count('tiles', len(outputs))
+    return subset, outputs
+
+
+def main(args):
+    vott_path = args.vott_file
+    annotation_dir = vott_path.parent
+    image_dir = args.image_dir
+    output_dir = args.output_dir
+    output_prefix = args.output_prefix
+    formats = set(args.formats)
+    num_workers = args.num_workers
+    instrument.enable(bool(args.profile))
+    start = time.perf_counter()
+
+    if args.overlap >= min(args.tile_size):
+        sys.exit('--overlap must be smaller than the tile size')
+    if args.validate:
+        probe.preflight(vott_path, image_dir, args.index)
+
+    if args.index:
+        index = open_project(vott_path, args.index)
+        tags = index.tags
+        asset_files = index.file_records()
+    else:
+        index = None
+        tags = read_vott_header(vott_path)[0]['tags']
+        asset_files = sorted(annotation_dir.glob('*-asset.json'))
+    if has_video(vott_path, index):
+        # frames are grouped by video, so each video is decoded once
+        asset_files = video.order_records(prefetch.read_ahead(read_asset, asset_files, args.io_threads, args.prefetch))
+    images = video.ImageSource(image_dir, asset_files)
+    categories = tags2categories({'tags': tags})
+    class_id = {cat['name']: cat['id'] for cat in categories}
+
+    # assets are split before tiling, so all tiles of an image are in one split
+    splitter = Splitter(args.ratio, args.seed, args.stratify, args.split_by) if args.ratio else None
+    subsets = splitter.splits if splitter else ['']
+
+    coco_paths = {subset: output_dir.joinpath(output_prefix + subset + '.json') for subset in subsets}
+    tfrecord_paths = {subset: shard_paths(output_dir, output_prefix + subset, args.num_shards) for subset in subsets}
+    tile_dir = output_dir.joinpath(output_prefix + 'tiles')
+    output_paths = []
+    if 'coco' in formats:
+        output_paths.extend(coco_paths.values())
+    if 'tfrecords' in formats:
+        output_paths.extend(path for paths in tfrecord_paths.values() for path in paths)
+    check_overwrite(output_paths, args.overwrite)
+    if 'coco' in formats:
+        tile_dir.mkdir(exist_ok=True)
+
+    options = {'formats': formats, 'class_id': class_id, 'mask_format': args.mask_format, 'backend': args.backend}
+
+    records = prefetch.read_ahead(read_asset, asset_files, args.io_threads, args.prefetch)
+    if splitter:
+        entries = split_all(splitter, ((record, record['asset'], record['regions']) for record in records))
+    else:
+        entries = ((record, '') for record in records)
+
+    def load_task(entry):
+        record, subset = entry
+        tiles = plan_tiles(record, args.tile_size, args.overlap, args.drop_empty, args.min_visible)
+        encoded_image_data = None
+        if tiles:
+            encoded_image_data = images.read(record)
+        else:
+            images.skip(record)
+        return record, subset, tiles, encoded_image_data, options
+
+    tasks = prefetch.read_ahead(load_task, entries, args.io_threads, args.prefetch)
+
+    def write_record(writer, serialized, asset):
+        with instrument.stage('write'):
+            writer.write(serialized, asset['id'], urllib.parse.unquote(asset['name']))
+
+    now = datetime.now()
+    sizes = {subset: 0 for subset in subsets}
+    coco_writers = {}
+    tfrecord_writers = {}
+    progress = instrument.Progress(len(asset_files))
+    # TensorFlow is not fork-safe, so its worker processes are spawned.
+    context = multiprocessing.get_context('spawn' if args.backend == 'tf' else None)
+    pool = context.Pool(num_workers) if num_workers > 1 else None
+    try:
+        if 'coco' in formats:
+            coco_writers = {subset: CocoWriter(path, categories, now) for subset, path in coco_paths.items()}
+        if 'tfrecords' in formats:
+            image_io = get_backend(args.backend)
+            tfrecord_writers = {subset: [tfrecord_io.IndexedWriter(image_io.writer(path), path) for path in paths]
+                                for subset, paths in tfrecord_paths.items()}
+        # tile images are written by the io threads, records by one more
+        # thread, which keeps their order
+        with prefetch.WriteBehind(args.io_threads, args.prefetch) as file_writer, \
+                prefetch.WriteBehind(min(args.io_threads, 1), args.prefetch) as record_writer, progress:
+            for subset, tiles in instrument.imap(render_tiles, tasks, pool, max(args.prefetch, 2 * num_workers)):
+                for tile, encoded_tile, coco, serialized in tiles:
+                    if coco:
+                        with instrument.stage('write'):
+                            coco_writers[subset].write(*coco)
+                        file_writer.submit(prefetch.write_file, tile_dir.joinpath(coco[0]['file_name']), encoded_tile)
+                    if serialized is not None:
+                        shards = tfrecord_writers[subset]
+                        record_writer.submit(write_record, shards[sizes[subset] % len(shards)], serialized,
+                                             tile['asset'])
+                    sizes[subset] += 1
+                progress.update()
+    finally:
+        images.close()
+        if pool:
+            pool.close()
+            pool.join()
+        for writer in coco_writers.values():
+            writer.close()
+        for shards in tfrecord_writers.values():
+            for writer in shards:
+                writer.close()
+
+    print_dataset_size(sizes)
+    elapsed = time.perf_counter() - start
+    print('Cut {} images into {} tiles in {:.2f} s'.format(progress.done, sum(sizes.values()), elapsed))
+    if args.profile:
+        instrument.write_report(args.profile, instrument.report(elapsed, progress.done))
+
+
+if __name__ == '__main__':
+    main(parse_args('tile'))
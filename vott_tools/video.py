@@ -0,0 +1,203 @@
+import collections
+import os
+import threading
+import urllib.parse
+from . import instrument, prefetch
+
+# VoTT video assets. A video is an asset of its own, and every tagged frame
+# is a child asset with the video as its parent and a timestamp. Frame
+# assets are renamed <video>_t<seconds>.jpg as they are loaded (see
+# frame_asset), so the tools treat them as images. Their pixels come from
+# an ImageSource, which decodes each video once, front to back, and hands
+# out the wanted frames JPEG encoded in memory.
+
+IMAGE_ASSET = 1
+VIDEO_ASSET = 2
+VIDEO_FRAME_ASSET = 3
+# timestamps are seconds as floats, 0.2 s at 30 fps is frame 5.999...
+FRAME_EPSILON = 1e-3
+JPEG_QUALITY = 95
+
+
+def is_video(asset):
+    return asset.get('type') == VIDEO_ASSET
+
+def is_video_frame(asset):
+    return asset.get('type') == VIDEO_FRAME_ASSET and bool(asset.get('parent'))
+
+def video_filename(asset):
+    return urllib.parse.unquote(asset['parent']['name'])
+
+def frame_filename(asset):
+    return '{}_t{:010.3f}.jpg'.format(os.path.splitext(video_filename(asset))[0], asset['timestamp'])
+
+def frame_asset(asset):
+    # Names a frame asset after its video and timestamp, in place
+    if is_video_frame(asset):
+        asset['name'] = urllib.parse.quote(frame_filename(asset))
+    return asset
+
+def frame_index(timestamp, fps):
+    return int(timestamp * fps + FRAME_EPSILON)
+
+
+def order_records(records):
+    # Drops the video assets and puts the frames after the other records,
+    # grouped by video in timestamp order, the order they are decoded in
+    images = []
+    frames = []
+    for record in records:
+        asset = record['asset']
+        if is_video_frame(asset):
+            frames.append(record)
+        elif not is_video(asset):
+            images.append(record)
+    frames.sort(key=lambda record: (video_filename(record['asset']), record['asset']['timestamp']))
+    return images + frames
+
+
+class VideoFrames:
+    # The wanted frames of one video. The video is decoded sequentially up
+    # to each asked frame; wanted frames passed on the way are encoded and
+    # kept until they are asked for. Asking for a frame that was passed and
+    # not kept reopens the video.
+
+    def __init__(self, path, timestamps=()):
+        self.path = path
+        self.timestamps = collections.Counter(timestamps)
+        self.lock = threading.Lock()
+        self.capture = None
+        self.fps = None
+        self.wanted = collections.Counter()
+        self.last = -1
+        self.position = 0
+        self.decoded = {}
+
+    def add(self, timestamp):
+        with self.lock:
+            self.timestamps[timestamp] += 1
+            if self.fps is not None:
+                idx = frame_index(timestamp, self.fps)
+                self.wanted[idx] += 1
+                self.last = max(self.last, idx)
+
+    def skip(self, timestamp):
+        # A frame given to the constructor that will not be read after all
+        with self.lock:
+            self.timestamps[timestamp] -= 1
+            if self.fps is not None:
+                self.served(frame_index(timestamp, self.fps))
+
+    def open(self):
+        import cv2
+        if self.capture is not None:
+            self.capture.release()
+        if self.fps is not None:
+            instrument.count('reopened')
+        self.capture = cv2.VideoCapture(str(self.path))
+        if not self.capture.isOpened():
+            self.capture = None
+            raise ValueError('{}: cannot open video'.format(self.path))
+        if self.fps is None:
+            self.fps = self.capture.get(cv2.CAP_PROP_FPS)
+            if not self.fps:
+                raise ValueError('{}: unknown frame rate'.format(self.path))
+            for timestamp, count in self.timestamps.items():
+                if count > 0:
+                    self.wanted[frame_index(timestamp, self.fps)] += count
+            self.last = max(self.wanted, default=-1)
+        self.position = 0
+
+    def served(self, idx):
+        self.wanted[idx] -= 1
+        if self.wanted[idx] <= 0:
+            del self.wanted[idx]
+            self.decoded.pop(idx, None)
+
+    def encode(self):
+        import cv2
+        with instrument.stage('decode'):
+            _, frame = self.capture.retrieve()
+        with instrument.stage('encode'):
+            return cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY])[1].tobytes()
+
+    def read(self, timestamp):
+        with self.lock:
+            if self.fps is None:
+                self.open()
+            idx = frame_index(timestamp, self.fps)
+            encoded = self.decoded.get(idx)
+            if encoded is None:
+                if self.capture is None or self.position > idx:
+                    self.open()
+                while self.position <= idx:
+                    with instrument.stage('decode'):
+                        if not self.capture.grab():
+                            raise ValueError('{}: no frame at {} s'.format(self.path, timestamp))
+                    position = self.position
+                    self.position += 1
+                    if position == idx:
+                        encoded = self.encode()
+                    elif position in self.wanted:
+                        self.decoded[position] = self.encode()
+                if self.position > self.last:
+                    self.capture.release()
+                    self.capture = None
+            if self.wanted[idx] > 1:
+                self.decoded[idx] = encoded
+            self.served(idx)
+            return encoded
+
+    def close(self):
+        if self.capture is not None:
+            self.capture.release()
+            self.capture = None
+
+
+class ImageSource:
+    # Encoded images of asset records, read from the image files in
+    # image_dir or decoded from the videos there. records are the records
+    # that will be read; their frames are decoded in one pass per video,
+    # best read in the order of order_records.
+
+    def __init__(self, image_dir, records=()):
+        self.image_dir = image_dir
+        self.lock = threading.Lock()
+        timestamps = collections.defaultdict(list)
+        for record in records:
+            if isinstance(record, dict) and is_video_frame(record['asset']):
+                timestamps[video_filename(record['asset'])].append(record['asset']['timestamp'])
+        self.videos = {filename: VideoFrames(image_dir.joinpath(filename), video_timestamps)
+                       for filename, video_timestamps in timestamps.items()}
+
+    def path(self, record):
+        # The file holding the asset's image, the video of a frame
+        asset = record['asset']
+        if is_video_frame(asset):
+            return self.image_dir.joinpath(video_filename(asset))
+        return self.image_dir.joinpath(urllib.parse.unquote(asset['name']))
+
+    def video(self, asset):
+        filename = video_filename(asset)
+        with self.lock:
+            if filename not in self.videos:
+                # a frame that was not announced
+                self.videos[filename] = VideoFrames(self.image_dir.joinpath(filename))
+                self.videos[filename].add(asset['timestamp'])
+            return self.videos[filename]
+
+    def read(self, record):
+        asset = record['asset']
+        if is_video_frame(asset):
+            return self.video(asset).read(asset['timestamp'])
+        return prefetch.read_file(self.path(record))
+
+    def skip(self, record):
+        # Tells that a record passed to the constructor will not be read
+        asset = record['asset']
+        if is_video_frame(asset) and video_filename(asset) in self.videos:
+            self.videos[video_filename(asset)].skip(asset['timestamp'])
+
+    def close(self):
+        for video in self.videos.values():
+            video.close()
@@ -0,0 +1,367 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pathlib
+import sys
+from datetime import datetime
+import json
+import itertools
+import urllib
+import shutil
+import tempfile
+import time
+from . import geometry, instrument, video
+from .cli_utils import check_overwrite, parse_args
+from .dataset_split import Splitter, split_all
+from .manifest import Manifest, record_json
+from .project_index import AssetLoadError, IndexRegions, load_json, open_project, stream_json
+
+# assets converted together by create_coco(s)
+BATCH_SIZE = 256
+
+
+def tags2categories(vott):
+    SUPER_CATEGORY = 'objects'
+
+    categories = []
+    for idx, tag in enumerate(vott['tags']):
+        category = {}
+        category['supercategory'] = SUPER_CATEGORY
+        category['id'] = idx + 1
+        category['name'] = tag['name']
+        categories.append(category)
+    return categories
+
+def split_assets(assets, ratio, seed=0, stratify=False, split_by='name'):
+    # assets maps asset ids to .vott assets with their regions
+    splitter = Splitter(ratio, seed, stratify, split_by)
+    dataset = {'train': [], 'val': [], 'test': []}
+    entries = ((asset_id, asset, asset.get('regions')) for asset_id, asset in assets.items() if not video.is_video(asset))
+    for asset_id, split in split_all(splitter, entries):
+        dataset[split].append(asset_id)
+    return dataset
+
+def split_router(splitter):
+    # Subset routing for create_cocos deciding each asset's split on the fly
+    def route(asset_id, asset):
+        return [splitter.split(asset, asset.get('regions'))]
+    return route
+
+def load_imagesets(imagesets_dir):
+    imageset_files = pathlib.Path(imagesets_dir).glob('*.txt')
+    imagesets = {}
+    for imageset_file in imageset_files:
+        with open(imageset_file, 'r') as f:
+            image_files = [line.strip() for line in f.readlines()]
+        imagesets[imageset_file.stem] = image_files
+    return imagesets
+
+def imagesets2datasets(file2id, imagesets):
+    datasets = {}
+    for name, files in imagesets.items():
+        datasets[name] = [file2id[file] for file in files]
+    return datasets
+
+def print_dataset_size(sizes):
+    sizes = ['{} = {}'.format(subset, size) for subset, size in sizes.items() ]
+    print('Dataset sizes: ' + ', '.join(sizes))
+
+def polygon_area(p):
+    n = len(p)
+    area = abs(sum(p[i][0]*p[i-1][1] - p[i][1]*p[i-1][0] for i in range(n)))/2.0
+    return area
+
+def coco_image(asset):
+    # ids and capture dates are filled in by create_coco
+    image = {}
+    image['license'] = 1
+    image['file_name'] = urllib.parse.unquote(asset['name'])
+    image['coco_url'] = None
+    image['height'] = asset['size']['height']
+    image['width'] = asset['size']['width']
+    image['date_captured'] = None
+    image['flicker_url'] = None
+    image['id'] = None
+    return image
+
+def assets_to_coco(assets, cat2id):
+    # (image, annotations) of each asset, the geometry of all their regions
+    # computed at once
+    region_lists = [asset['regions'] for asset in assets]
+    xs, ys, offsets, boxes, region_offsets = geometry.batch_region_arrays(region_lists)
+    xs = geometry.round_half_up(xs)
+    ys = geometry.round_half_up(ys)
+    areas = geometry.polygon_areas(xs, ys, offsets).tolist()
+    bboxes = geometry.coco_bboxes(boxes).tolist()
+    segmentations = geometry.flat_segmentations(xs, ys, offsets)
+
+    types = []
+    tags = []
+    for regions in region_lists:
+        if isinstance(regions, IndexRegions):
+            types.extend(regions.types())
+            tags.extend(regions.first_tags())
+        else:
+            types.extend(region['type'] for region in regions)
+            tags.extend(region['tags'][0] for region in regions)
+
+    annotations = []
+    for region_type, tag, area, bbox, segmentation in zip(types, tags, areas, bboxes, segmentations):
+        annotation = {}
+        annotation['area'] = area
+        annotation['iscrowd'] = 0
+        annotation['image_id'] = None
+        annotation['bbox'] = bbox
+        annotation['category_id'] =  cat2id[tag]
+        annotation['id'] = None
+        if region_type == 'POLYGON':
+            annotation['segmentation'] = [segmentation]
+        annotations.append(annotation)
+    bounds = region_offsets.tolist()
+    return [(coco_image(asset), annotations[bounds[n]:bounds[n + 1]]) for n, asset in enumerate(assets)]
+
+def asset_to_coco(asset, cat2id):
+    return assets_to_coco([asset], cat2id)[0]
+
+def convert_assets(items, cat2id, manifest=None):
+    # (image, annotations) of (asset_id, asset) items, assets being .vott
+    # assets with their regions. With a manifest, cached assets are loaded
+    # and the others converted together and stored.
+    with instrument.stage('convert'):
+        converted = [None] * len(items)
+        keys = {}
+        stale = []
+        for n, (asset_id, asset) in enumerate(items):
+            if manifest:
+                keys[n] = manifest.key(record_json({'asset': asset, 'regions': asset['regions']}))
+                fragment = manifest.load(asset_id, keys[n])
+                if fragment is not None:
+                    converted[n] = json.loads(fragment)
+                    continue
+            stale.append(n)
+        if stale:
+            for n, coco in zip(stale, assets_to_coco([items[n][1] for n in stale], cat2id)):
+                converted[n] = coco
+                if manifest:
+                    manifest.store(items[n][0], keys[n], json.dumps(list(coco)).encode('utf-8'))
+        return converted
+
+def batches(iterable, size=BATCH_SIZE):
+    iterator = iter(iterable)
+    batch = list(itertools.islice(iterator, size))
+    while batch:
+        yield batch
+        batch = list(itertools.islice(iterator, size))
+
+def coco_info(now):
+    info = {
+        "description": None,
+        "url": None,
+        "version": "1.0",
+        "year": now.year,
+        "contributor": None,
+        "date_created": now.strftime("%Y/%m/%d")
+    }
+    return info
+
+COCO_LICENSES = [
+    {
+        "url": None,
+        "id": 1,
+        "name": "Unknown License"
+    },
+]
+
+
+class CocoWriter:
+    # Streams a coco annotation file. Images are written to the output as
+    # they arrive and annotations are spooled to a temporary file, which is
+    # appended on close(). The result is byte-identical to json.dump of the
+    # whole dict.
+
+    def __init__(self, output_path, categories, now=None):
+        now = now or datetime.now()
+        output_path = pathlib.Path(output_path)
+        self.categories = categories
+        self.date_captured = now.strftime('%Y-%m-%d %H:%M:%S')
+        self.image_id = 1
+        self.annotation_id = 1
+        self.f = open(output_path, 'w')
+        self.annotations = tempfile.TemporaryFile('w+', dir=output_path.parent)
+        self.f.write('{"info": ' + json.dumps(coco_info(now)) +
+                     ', "licenses": ' + json.dumps(COCO_LICENSES) +
+                     ', "images": [')
+
+    def write(self, image, annotations):
+        image['date_captured'] = self.date_captured
+        image['id'] = self.image_id
+        if self.image_id > 1:
+            self.f.write(', ')
+        self.f.write(json.dumps(image))
+
+        for annotation in annotations:
+            annotation['image_id'] = self.image_id
+            annotation['id'] = self.annotation_id
+            if self.annotation_id > 1:
+                self.annotations.write(', ')
+            self.annotations.write(json.dumps(annotation))
+            self.annotation_id += 1
+
+        self.image_id += 1
+
+    @property
+    def num_images(self):
+        return self.image_id - 1
+
+    def close(self):
+        self.f.write('], "annotations": [')
+        self.annotations.seek(0)
+        shutil.copyfileobj(self.annotations, self.f)
+        self.annotations.close()
+        self.f.write('], "categories": ' + json.dumps(self.categories) + '}')
+        self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def create_coco(vott_json, asset_ids, output_path, manifest=None):
+    categories = tags2categories(vott_json)
+    cat2id = {cat['name']:cat['id'] for cat in categories}
+
+    # Assets are visited in project order with a single items() pass, keyed
+    # lookups on a streamed project re-read the .vott file every time.
+    asset_ids = set(asset_ids)
+    with CocoWriter(output_path, categories) as writer:
+        for batch in batches(vott_json['assets'].items()):
+            items = [(asset_id, asset) for asset_id, asset in batch if asset_id in asset_ids]
+            for image, annotations in convert_assets(items, cat2id, manifest):
+                writer.write(image, annotations)
+
+def create_cocos(vott_json, datasets, output_paths, manifest=None, progress=None):
+    # Writes every subset in a single pass over the assets, routing each
+    # asset to the writers of the subsets it belongs to. datasets maps
+    # subsets to asset ids, or is a function returning the subsets of
+    # (asset_id, asset). Video assets are skipped, their tagged frames are
+    # images of their own. Assets are converted BATCH_SIZE at a time by
+    # assets_to_coco. Returns the number of images of each subset.
+    now = datetime.now()
+    categories = tags2categories(vott_json)
+    cat2id = {cat['name']:cat['id'] for cat in categories}
+
+    if callable(datasets):
+        route = datasets
+        if progress:
+            progress.total = len(vott_json['assets'])
+    else:
+        asset_subsets = {}
+        for subset, asset_ids in datasets.items():
+            if subset in output_paths:
+                for asset_id in asset_ids:
+                    asset_subsets.setdefault(asset_id, []).append(subset)
+        route = lambda asset_id, asset: asset_subsets.get(asset_id, [])
+        if progress:
+            progress.total = len(asset_subsets)
+
+    writers = {}
+    try:
+        for subset, output_path in output_paths.items():
+            writers[subset] = CocoWriter(output_path, categories, now)
+        for batch in batches(vott_json['assets'].items()):
+            routed = []
+            for asset_id, asset in batch:
+                if video.is_video(asset):
+                    continue
+                subsets = [subset for subset in route(asset_id, asset) if subset in writers]
+                if subsets:
+                    routed.append((asset_id, asset, subsets))
+            converted = convert_assets([(asset_id, asset) for asset_id, asset, _ in routed], cat2id, manifest)
+            for (_, _, subsets), (image, annotations) in zip(routed, converted):
+                instrument.count('regions', len(annotations))
+                with instrument.stage('write'):
+                    for subset in subsets:
+                        writers[subset].write(image, annotations)
+                if progress:
+                    progress.update()
+    finally:
+        for writer in writers.values():
+            writer.close()
+    return {subset: writer.num_images for subset, writer in writers.items()}
+
+
+def main(args):
+    vott_path = args.vott_file
+    output_dir = args.output_dir
+    output_prefix = args.output_prefix
+    overwrite = args.overwrite or args.incremental
+    instrument.enable(bool(args.profile))
+    start = time.perf_counter()
+
+    try:
+        if args.index:
+            vott = open_project(vott_path, args.index, args.num_workers).to_vott_json()
+        elif args.stream:
+            vott = stream_json(vott_path, args.num_workers)
+        else:
+            vott = load_json(vott_path, args.num_workers)
+    except AssetLoadError as e:
+        sys.exit(str(e))
+
+    if args.ratio and args.stratify:
+        datasets = split_assets(vott['assets'], args.ratio, args.seed, True, args.split_by)
+        subsets = [subset for subset, asset_ids in datasets.items() if asset_ids]
+    elif args.ratio:
+        # splits are assigned while writing
+        splitter = Splitter(args.ratio, args.seed, False, args.split_by)
+        datasets = split_router(splitter)
+        subsets = splitter.splits
+    elif args.imagesets_dir:
+        imagesets = load_imagesets(args.imagesets_dir)
+        file2id = {urllib.parse.unquote(asset['name']):id  for id, asset in vott['assets'].items()}
+        datasets = imagesets2datasets(file2id, imagesets)
+        subsets = [subset for subset, asset_ids in datasets.items() if asset_ids]
+    else:
+        datasets = lambda asset_id, asset: ['']
+        subsets = ['']
+
+    check_overwrite([output_dir.joinpath(output_prefix + subset + '.json') for subset in subsets], overwrite)
+
+    manifest = Manifest(output_dir, output_prefix + '.coco', tags2categories(vott)) if args.incremental else None
+
+    output_paths = {subset: output_dir.joinpath(output_prefix + subset + '.json') for subset in subsets}
+    try:
+        with instrument.Progress() as progress:
+            sizes = create_cocos(vott, datasets, output_paths, manifest, progress)
+    except AssetLoadError as e:
+        # a streamed project fails part way through writing
+        for output_path in output_paths.values():
+            if output_path.exists():
+                output_path.unlink()
+        sys.exit(str(e))
+
+    if callable(datasets):
+        print_dataset_size(sizes)
+    else:
+        print_dataset_size({subset: len(asset_ids) for subset, asset_ids in datasets.items()})
+
+    if manifest:
+        manifest.save()
+
+    if args.profile:
+        instrument.write_report(args.profile, instrument.report(time.perf_counter() - start, progress.done))
+
+
+if __name__ == '__main__':
+    main(parse_args('coco'))
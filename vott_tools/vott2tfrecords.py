@@ -0,0 +1,500 @@
+import os
+import collections
+import sys
+import urllib
+import multiprocessing
+import numpy as np
+from . import geometry, instrument, prefetch, probe, tfrecord_io, video
+from .cli_utils import check_overwrite, parse_args
+from .dataset_split import Splitter, split_all
+from .manifest import Manifest, record_json
+from .project_index import has_video, open_project, read_asset, read_vott_header
+
+def get_categories(vott_file, index=None):
+    if index is not None:
+        tags = index.tags
+    else:
+        tags = read_vott_header(vott_file)[0]['tags']
+    
+    categories = []
+
+    for idx, tag in enumerate(tags):
+        category = {}
+        category['supercategory'] = 'objects'
+        category['id'] = idx + 1
+        category['name'] = tag['name']
+        categories.append(category)
+    return categories
+
+def int64_feature(value):
+    return tfrecord_io.int64_list_feature([value])
+
+
+def int64_list_feature(value):
+    return tfrecord_io.int64_list_feature(value)
+
+
+def bytes_feature(value):
+    return tfrecord_io.bytes_list_feature([value])
+
+
+def bytes_list_feature(value):
+    return tfrecord_io.bytes_list_feature(value)
+
+
+def float_list_feature(value):
+    return tfrecord_io.float_list_feature(value)
+
+
+class TensorFlowBackend:
+    # Image io and tfrecord writing with TensorFlow, imported on first use.
+
+    def __init__(self):
+        import tensorflow as tf
+        if tf.__version__ < '2.0.0':
+            tf.enable_eager_execution()
+        self.tf = tf
+
+    def read_file(self, path):
+        return self.tf.io.read_file(str(path)).numpy()
+
+    def decode_image(self, encoded_image, image_format, ratio=1):
+        if image_format == b'jpeg':
+            return self.tf.io.decode_jpeg(encoded_image, channels=3, ratio=ratio)
+        if image_format == b'png':
+            return self.tf.io.decode_png(encoded_image, channels=3)
+        return self.tf.io.decode_image(encoded_image, channels=3, expand_animations=False)
+
+    def decode_window(self, encoded_image, image_format, top, left, height, width):
+        # JPEGs are decoded only within the window
+        if image_format == b'jpeg':
+            return self.tf.io.decode_and_crop_jpeg(encoded_image, [top, left, height, width], channels=3)
+        return self.decode_image(encoded_image, image_format)[top:top + height, left:left + width]
+
+    def resize(self, image, new_height, new_width):
+        tf_new_size = self.tf.constant([new_height, new_width], dtype=self.tf.int32)
+        return self.tf.image.resize(image, tf_new_size, method=self.tf.image.ResizeMethod.AREA)
+
+    def encode_jpeg(self, image):
+        return self.tf.io.encode_jpeg(self.tf.cast(image, self.tf.uint8)).numpy()
+
+    def encode_png(self, mask):
+        return self.tf.image.encode_png(mask[..., np.newaxis]).numpy()
+
+    def feature(self, feature):
+        kind, values = feature
+        if kind == 'bytes_list':
+            return self.tf.train.Feature(bytes_list=self.tf.train.BytesList(value=values))
+        if kind == 'float_list':
+            return self.tf.train.Feature(float_list=self.tf.train.FloatList(value=values))
+        return self.tf.train.Feature(int64_list=self.tf.train.Int64List(value=values))
+
+    def example(self, features):
+        feature = {name: self.feature(value) for name, value in features.items()}
+        return self.tf.train.Example(features=self.tf.train.Features(feature=feature))
+
+    def writer(self, path):
+        return self.tf.io.TFRecordWriter(str(path))
+
+
+class LiteBackend:
+    # Image io with OpenCV and tfrecord writing with tfrecord_io, so worker
+    # processes never import TensorFlow. Images are kept in OpenCV's BGR
+    # order from decode to encode.
+
+    REDUCED_READ_FLAGS = {2: 'IMREAD_REDUCED_COLOR_2', 4: 'IMREAD_REDUCED_COLOR_4', 8: 'IMREAD_REDUCED_COLOR_8'}
+
+    def __init__(self):
+        import cv2
+        self.cv2 = cv2
+
+    def read_file(self, path):
+        with open(path, 'rb') as f:
+            return f.read()
+
+    def decode_image(self, encoded_image, image_format, ratio=1):
+        flag = self.cv2.IMREAD_COLOR
+        if image_format == b'jpeg' and ratio in self.REDUCED_READ_FLAGS:
+            flag = getattr(self.cv2, self.REDUCED_READ_FLAGS[ratio])
+        return self.cv2.imdecode(np.frombuffer(encoded_image, dtype=np.uint8), flag)
+
+    def decode_window(self, encoded_image, image_format, top, left, height, width):
+        # OpenCV has no partial decode, the window is cut from the whole image
+        return self.decode_image(encoded_image, image_format)[top:top + height, left:left + width]
+
+    def resize(self, image, new_height, new_width):
+        return self.cv2.resize(image, (new_width, new_height), interpolation=self.cv2.INTER_AREA)
+
+    def encode_jpeg(self, image):
+        return self.cv2.imencode('.jpg', image, [self.cv2.IMWRITE_JPEG_QUALITY, 95])[1].tobytes()
+
+    def encode_png(self, mask):
+        return self.cv2.imencode('.png', mask)[1].tobytes()
+
+    def example(self, features):
+        return tfrecord_io.Example(features)
+
+    def writer(self, path):
+        return tfrecord_io.TFRecordWriter(path)
+
+
+BACKENDS = {'tf': TensorFlowBackend, 'lite': LiteBackend}
+_backends = {}
+
+def get_backend(name='tf'):
+    if name not in _backends:
+        _backends[name] = BACKENDS[name]()
+    return _backends[name]
+
+def get_image_format(encoded_image):
+    if encoded_image[:3] == b'\xff\xd8\xff':
+        return b'jpeg'
+    if encoded_image[:8] == b'\x89PNG\r\n\x1a\n':
+        return b'png'
+    if encoded_image[:6] in (b'GIF87a', b'GIF89a'):
+        return b'gif'
+    if encoded_image[:2] == b'BM':
+        return b'bmp'
+    return None
+
+def get_dct_ratio(height, width, new_height, new_width):
+    # Largest JPEG DCT scaling factor whose output is still not smaller than
+    # the target, so the final area resize only ever downsamples.
+    for ratio in (8, 4, 2):
+        if -(-height // ratio) >= new_height and -(-width // ratio) >= new_width:
+            return ratio
+    return 1
+
+def decode_image(encoded_image, image_format, height, width, new_height, new_width, backend='tf'):
+    ratio = get_dct_ratio(height, width, new_height, new_width) if image_format == b'jpeg' else 1
+    with instrument.stage('decode'):
+        return get_backend(backend).decode_image(encoded_image, image_format, ratio)
+
+
+def encode_png_mask(mask, backend='tf'):
+    with instrument.stage('encode'):
+        return get_backend(backend).encode_png(mask)
+
+def encode_masks(regions, height, width, new_height, new_width, mask_format='png', backend='tf', rasterized=None):
+    # Encodes one mask per region from a single rasterization of all
+    # regions, or from rasterized when rasterize_polygons was already run.
+    # 'png' stores full frame PNGs (object_detection's layout), 'png_crop'
+    # stores PNGs cropped to the mask with their top-left offsets, 'rle'
+    # stores COCO compressed RLE strings.
+    columns, start, stop, runs = rasterized or geometry.rasterize_polygons(regions, height, width, new_height, new_width)
+    instrument.count('masks', len(regions))
+
+    features = {}
+    if mask_format == 'rle':
+        with instrument.stage('rasterize'):
+            rles = [geometry.runs_to_rle(columns[run], start[run], stop[run], new_height, new_width) for run in runs]
+        with instrument.stage('encode'):
+            rles = [geometry.rle_to_string(rle) for rle in rles]
+        features['image/object/mask/rle'] = bytes_list_feature([rle.encode('ascii') for rle in rles])
+    elif mask_format == 'png_crop':
+        crops = []
+        crop_xmins = []
+        crop_ymins = []
+        for run in runs:
+            if run.start == run.stop:
+                crop_xmin, crop_ymin, crop_width, crop_height = 0, 0, 1, 1
+            else:
+                crop_xmin = int(columns[run].min())
+                crop_ymin = int(start[run].min())
+                crop_width = int(columns[run].max()) + 1 - crop_xmin
+                crop_height = int(stop[run].max()) - crop_ymin
+            with instrument.stage('rasterize'):
+                mask = geometry.runs_to_mask(columns[run] - crop_xmin, start[run] - crop_ymin, stop[run] - crop_ymin,
+                                             crop_height, crop_width)
+            crops.append(encode_png_mask(mask, backend))
+            crop_xmins.append(crop_xmin)
+            crop_ymins.append(crop_ymin)
+        features['image/object/mask/crop'] = bytes_list_feature(crops)
+        features['image/object/mask/crop/xmin'] = int64_list_feature(crop_xmins)
+        features['image/object/mask/crop/ymin'] = int64_list_feature(crop_ymins)
+    else:
+        masks = []
+        for run in runs:
+            with instrument.stage('rasterize'):
+                mask = geometry.runs_to_mask(columns[run], start[run], stop[run], new_height, new_width)
+            masks.append(encode_png_mask(mask, backend))
+        features['image/object/mask'] = bytes_list_feature(masks)
+    return features
+
+def encode_images(encoded_image_data, image_format, height, width, new_sizes, passthrough=True, backend='tf'):
+    # (encoded image, format) for each (height, width) of new_sizes. The
+    # image is decoded at most once, at a JPEG scale covering the largest
+    # size, and resized to every size that is not passed through.
+    image_io = get_backend(backend)
+    max_height = max(new_height for new_height, _ in new_sizes)
+    max_width = max(new_width for _, new_width in new_sizes)
+    decoded_image = None
+    images = []
+    for new_height, new_width in new_sizes:
+        if passthrough and image_format and (new_height, new_width) == (height, width):
+            images.append((encoded_image_data, image_format))
+            continue
+        if decoded_image is None:
+            decoded_image = decode_image(encoded_image_data, image_format, height, width, max_height, max_width, backend)
+        resized_image = decoded_image
+        if resized_image.shape[0] != new_height or resized_image.shape[1] != new_width:
+            with instrument.stage('resize'):
+                resized_image = image_io.resize(decoded_image, new_height, new_width)
+        with instrument.stage('encode'):
+            images.append((image_io.encode_jpeg(resized_image), b'jpeg'))
+    return images
+
+def create_tf_examples(image_path, asset_json_file, class_id, new_sizes=(None,), passthrough=True, mask_format='png',
+                       backend='tf', encoded_image_data=None):
+    # One example per size of new_sizes (None keeps the original size) from
+    # a single read and decode of the image. encoded_image_data is the
+    # content of the image file when it was already read, e.g. by
+    # prefetch.read_ahead, or the encoded frame of a video frame asset
+    image_io = get_backend(backend)
+    example_dict = read_asset(asset_json_file)
+    filename = urllib.parse.unquote(example_dict['asset']['name'])
+    height = example_dict['asset']['size']['height']
+    width = example_dict['asset']['size']['width']
+    if encoded_image_data is None and video.is_video_frame(example_dict['asset']):
+        encoded_image_data = video.ImageSource(image_path, [example_dict]).read(example_dict)
+    elif encoded_image_data is None:
+        with instrument.stage('read'):
+            encoded_image_data = image_io.read_file(image_path/filename)
+    image_format = get_image_format(encoded_image_data)
+    new_sizes = [tuple(new_size) if new_size else (height, width) for new_size in new_sizes]
+    images = encode_images(encoded_image_data, image_format, height, width, new_sizes, passthrough, backend)
+
+    instrument.count('regions', len(example_dict['regions']))
+    return [build_example(example_dict, class_id, new_height, new_width, encoded_image, new_image_format, mask_format,
+                          backend)
+            for (new_height, new_width), (encoded_image, new_image_format) in zip(new_sizes, images)]
+
+def build_example(example_dict, class_id, new_height, new_width, encoded_image, image_format, mask_format='png',
+                  backend='tf', rasterized=None):
+    # The example of an asset whose image was encoded at the new size.
+    # rasterized is the result of geometry.rasterize_polygons for the asset's
+    # polygons at that size when it is already known.
+    filename = urllib.parse.unquote(example_dict['asset']['name'])
+    height = example_dict['asset']['size']['height']
+    width = example_dict['asset']['size']['width']
+    regions = example_dict['regions']
+    _, _, _, boxes = geometry.region_arrays(regions)
+
+    # Normalized box coordinates (1 per box)
+    xmins, xmaxs, ymins, ymaxs = [a.tolist() for a in geometry.normalized_boxes(boxes, width, height)]
+    classes_text = [region['tags'][0].encode('utf-8') for region in regions] # List of string class name of bounding box (1 per box)
+    classes = [class_id[region['tags'][0]] for region in regions] # List of integer class id of bounding box (1 per box)
+    polygons = [region for region in regions if region['type'] == 'POLYGON'] # (1 mask per polygon)
+    features = {
+        'image/height': int64_feature(new_height),
+        'image/width': int64_feature(new_width),
+        'image/filename': bytes_feature(filename.encode('utf-8')),
+        'image/source_id': bytes_feature(filename.encode('utf-8')),
+        'image/encoded': bytes_feature(encoded_image),
+        'image/format': bytes_feature(image_format),
+        'image/object/bbox/xmin': float_list_feature(xmins),
+        'image/object/bbox/xmax': float_list_feature(xmaxs),
+        'image/object/bbox/ymin': float_list_feature(ymins),
+        'image/object/bbox/ymax': float_list_feature(ymaxs),
+        'image/object/class/text': bytes_list_feature(classes_text),
+        'image/object/class/label': int64_list_feature(classes)
+    }
+    if polygons:
+        features.update(encode_masks(polygons, height, width, new_height, new_width, mask_format, backend, rasterized))
+    return get_backend(backend).example(features)
+
+def create_tf_example(image_path, asset_json_file, class_id, new_size=None, passthrough=True, mask_format='png',
+                      backend='tf', encoded_image_data=None):
+    return create_tf_examples(image_path, asset_json_file, class_id, [new_size], passthrough, mask_format, backend,
+                              encoded_image_data)[0]
+
+
+def serialize_examples(task):
+    image_path, asset_json_file, class_id, new_sizes, passthrough, mask_format, backend, encoded_image_data = task
+    examples = create_tf_examples(image_path, asset_json_file, class_id, new_sizes, passthrough, mask_format, backend,
+                                  encoded_image_data)
+    with instrument.stage('serialize'):
+        return [example.SerializeToString(deterministic=True) for example in examples]
+
+def build_examples(task):
+    # serialize_examples, passing over the cached assets, which have no task
+    if task is None:
+        return None
+    return serialize_examples(task)
+
+
+def shard_paths(output_dir, name, num_shards=1):
+    if num_shards == 1:
+        return [output_dir.joinpath(name + '.tfrecord')]
+    return [output_dir.joinpath('{}-{:05d}-of-{:05d}.tfrecord'.format(name, idx, num_shards))
+            for idx in range(num_shards)]
+
+
+def asset_key(manifest, image_file, example_dict):
+    return manifest.key(record_json(example_dict), manifest.file_digest(image_file))
+
+
+def write_tfrecords(samples, output_paths, image_path, class_id, new_sizes=(None,), passthrough=True,
+                    mask_format='png', pool=None, manifests=None, backend='tf', progress=None,
+                    io_threads=prefetch.NUM_THREADS, depth=prefetch.DEPTH, splitter=None):
+    # Writes the examples of each size of new_sizes to the shards of the
+    # matching output_paths[subset] entry, the subset of a sample being its
+    # split by splitter, or '' without one. Records are dealt round-robin
+    # to the shards of their subset in sample order, so the output only
+    # depends on the order of samples, not on the worker count. With
+    # manifests (one per size), only examples of changed assets are
+    # rebuilt. Asset files and images are read, and hashed for the
+    # manifests, by io_threads threads ahead of the workers, and samples
+    # are split as they stream by (stratified splits after all were read).
+    # Records are written by one more thread, which keeps their order. At
+    # most depth examples are in flight at each stage. Every output gets an
+    # index (tfrecord_io.IndexedWriter) as its records are written; subsets
+    # without samples get no files. Video frames are decoded from their
+    # videos by a video.ImageSource. Returns the number of samples of each
+    # subset.
+    writers = {}
+    sizes = {subset: 0 for subset in output_paths}
+    images = video.ImageSource(image_path, samples)
+
+    records = prefetch.read_ahead(read_asset, samples, io_threads, depth)
+    if splitter:
+        entries = split_all(splitter, ((record, record['asset'], record['regions']) for record in records))
+    else:
+        entries = ((record, '') for record in records)
+
+    def load_task(entry):
+        # Reads, unless its examples are cached, the image. The manifest
+        # keys are computed here too, so the assets are hashed on the io
+        # threads.
+        sample, subset = entry
+        keys = cached = None
+        if manifests:
+            keys = [asset_key(manifest, images.path(sample), sample) for manifest in manifests]
+            cached = [manifest.load(sample['asset']['id'], key) for manifest, key in zip(manifests, keys)]
+            # an asset is rebuilt at every size when one of them is stale
+            if None in cached:
+                cached = None
+            else:
+                images.skip(sample)
+                return sample, subset, keys, cached, None
+        encoded_image_data = images.read(sample)
+        return sample, subset, keys, cached, (image_path, sample, class_id, new_sizes, passthrough, mask_format,
+                                              backend, encoded_image_data)
+
+    def write(writer, serialized, asset):
+        with instrument.stage('write'):
+            writer.write(serialized, asset['id'], urllib.parse.unquote(asset['name']))
+
+    # the loaded samples in order, with their keys and cached examples
+    loaded = collections.deque()
+
+    def keep_loaded(tasks):
+        for sample, subset, keys, cached, task in tasks:
+            loaded.append((sample, subset, keys, cached))
+            yield task
+
+    tasks = prefetch.read_ahead(load_task, entries, io_threads, depth)
+    serialized_examples = instrument.imap(build_examples, keep_loaded(tasks), pool, depth)
+    with prefetch.WriteBehind(min(io_threads, 1), depth) as write_behind:
+        for serialized in serialized_examples:
+            sample, subset, keys, cached = loaded.popleft()
+            if cached is None:
+                if manifests:
+                    for manifest, key, example in zip(manifests, keys, serialized):
+                        manifest.store(sample['asset']['id'], key, example)
+            else:
+                instrument.count('cached')
+                serialized = cached
+            if subset not in writers:
+                writers[subset] = [[tfrecord_io.IndexedWriter(get_backend(backend).writer(output_path), output_path)
+                                    for output_path in size_paths] for size_paths in output_paths[subset]]
+            idx = sizes[subset]
+            for size_writers, example in zip(writers[subset], serialized):
+                write_behind.submit(write, size_writers[idx % len(size_writers)], example, sample['asset'])
+            sizes[subset] += 1
+            if progress:
+                progress.update()
+    images.close()
+    for subset_writers in writers.values():
+        for size_writers in subset_writers:
+            for writer in size_writers:
+                writer.close()
+    return sizes
+
+
+def size_suffix(new_size):
+    return '_{}x{}'.format(*new_size)
+
+
+def main(args):
+    vott_path = args.vott_file
+    annotation_dir = vott_path.parent
+    image_dir = args.image_dir
+    output_dir = args.output_dir
+    output_prefix = args.output_prefix
+    new_sizes = args.new_size or [None]
+    num_workers = args.num_workers
+    num_shards = args.num_shards
+    overwrite = args.overwrite or args.incremental
+    if args.validate:
+        probe.preflight(vott_path, image_dir, args.index)
+    if args.new_size and len(set(map(tuple, new_sizes))) < len(new_sizes):
+        sys.exit('--new_size is given twice with the same size')
+    # with several sizes every output name ends in its size
+    suffixes = [size_suffix(new_size) for new_size in new_sizes] if len(new_sizes) > 1 else ['']
+
+    if args.index:
+        index = open_project(vott_path, args.index)
+        asset_files = index.file_records()
+    else:
+        index = None
+        asset_files = sorted(annotation_dir.glob('*-asset.json'))
+    if has_video(vott_path, index):
+        # frames are grouped by video, so each video is decoded once
+        asset_files = video.order_records(prefetch.read_ahead(read_asset, asset_files, args.io_threads, args.prefetch))
+    categories = get_categories(vott_path, index)
+    cat2id = {cat['name']:cat['id'] for cat in categories}
+
+    # splits are assigned while the asset files are read for writing
+    splitter = Splitter(args.ratio, args.seed, args.stratify, args.split_by) if args.ratio else None
+    subsets = splitter.splits if splitter else ['']
+    outputs = {subset: [shard_paths(output_dir, output_prefix + subset + suffix, num_shards) for suffix in suffixes]
+               for subset in subsets}
+
+    check_overwrite([output_path for output_paths in outputs.values() for size_paths in output_paths
+                     for output_path in size_paths], overwrite)
+
+    if args.incremental:
+        manifests = [Manifest(output_dir, output_prefix + suffix + '.tfrecords',
+                              {'categories': categories, 'new_size': new_size, 'reencode': args.reencode,
+                               'mask_format': args.mask_format, 'backend': args.backend})
+                     for new_size, suffix in zip(new_sizes, suffixes)]
+    else:
+        manifests = None
+
+    instrument.enable(bool(args.profile))
+    progress = instrument.Progress(len(asset_files))
+    # TensorFlow is not fork-safe, so worker processes are spawned.
+    pool = multiprocessing.get_context('spawn').Pool(num_workers) if num_workers > 1 else None
+    try:
+        with progress:
+            sizes = write_tfrecords(asset_files, outputs, image_dir, cat2id, new_sizes, not args.reencode,
+                                    args.mask_format, pool, manifests, args.backend, progress,
+                                    args.io_threads, max(args.prefetch, 2 * num_workers), splitter)
+        for manifest in manifests or []:
+            manifest.save()
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+
+    if splitter:
+        print('Num Samples: {} (train -> {}, validation -> {}, test -> {})'.format(
+            len(asset_files), *[sizes.get(split, 0) for split in ('train', 'val', 'test')]))
+
+    if args.profile:
+        instrument.write_report(args.profile, instrument.report(progress.elapsed, progress.done))
+
+
+if __name__ == '__main__':
+    main(parse_args('tfrecords'))